@@ -2,7 +2,7 @@ import streamlit as st
 from datetime import date, time, timedelta
 from typing import List, Dict
 
-from gcs_utils import load_workbook_from_gcs, save_workbook_to_gcs
+from workbook_writes import AFTER_LAST, RowAppend, append_rows
 
 DATA_START_ROW_ANEXO1 = 7  # fila donde empiezan los datos en el Excel
 
@@ -17,66 +17,38 @@ UNIT_FILE_ANEXO1 = {
 # -------------------------------------------------------------------
 # Auxiliares de Excel
 # -------------------------------------------------------------------
-def _get_next_row_and_counter(path: str, data_start_row: int = DATA_START_ROW_ANEXO1):
+def _guardar_todos_anexo1(ruta_excel: str, diagramas: List[Dict]) -> int:
     """
-    Devuelve (wb, ws, next_row, next_number) para escribir en la columna A.
+    Guarda una lista de diagramas en UN archivo Excel, a continuación del
+    último número de la columna A. Si otro usuario guarda al mismo tiempo,
+    las filas se reubican automáticamente después de las suyas.
     """
-    wb = load_workbook_from_gcs(path)
-    ws = wb.active
-
-    last_row = None
-    last_number = None
-
-    # Buscar el último número en la columna A
-    for row in range(data_start_row, ws.max_row + 1):
-        value = ws.cell(row=row, column=1).value
-        if value is not None:
-            last_row = row
-            last_number = value
-
-    if last_row is None:
-        next_row = data_start_row
-        next_number = 1
-    else:
-        next_row = last_row + 1
-        try:
-            next_number = int(last_number) + 1
-        except Exception:
-            next_number = 1
-
-    return wb, ws, next_row, next_number
-
-
-def _guardar_todos_anexo1(ruta_excel: str, diagramas: List[Dict]) -> int:
-    """Guarda una lista de diagramas en UN archivo Excel."""
     if not diagramas:
         return 0
 
-    wb, ws, start_row, start_num = _get_next_row_and_counter(ruta_excel, DATA_START_ROW_ANEXO1)
-
-    for idx, d in enumerate(diagramas):
-        row = start_row + idx
-        num = start_num + idx
-
-        unidad = d["unidad"].strip()
-        fecha = d["fecha"]
-        rec_hum = d["rec_hum"]
-        rec_util = d["rec_util"]
-        lugar = d["lugar"].strip()
+    filas = []
+    for d in diagramas:
         hora_desde = d["hora_desde"]
         hora_hasta = d["hora_hasta"]
-
-        ws.cell(row=row, column=1).value = num
-        ws.cell(row=row, column=2).value = unidad
-        ws.cell(row=row, column=3).value = fecha.strftime("%d/%m/%Y")
-        ws.cell(row=row, column=4).value = rec_hum
-        ws.cell(row=row, column=5).value = rec_util
-        ws.cell(row=row, column=6).value = lugar
-
-        texto_horas = f"{hora_desde.strftime('%H:%M')} - {hora_hasta.strftime('%H:%M')}"
-        ws.cell(row=row, column=7).value = texto_horas
-
-    save_workbook_to_gcs(wb, ruta_excel)
+        filas.append({
+            2: d["unidad"].strip(),
+            3: d["fecha"].strftime("%d/%m/%Y"),
+            4: d["rec_hum"],
+            5: d["rec_util"],
+            6: d["lugar"].strip(),
+            7: f"{hora_desde.strftime('%H:%M')} - {hora_hasta.strftime('%H:%M')}",
+        })
+
+    append_rows(
+        ruta_excel,
+        RowAppend(
+            rows=filas,
+            key_column=1,
+            start_row=DATA_START_ROW_ANEXO1,
+            mode=AFTER_LAST,
+            counter_column=1,
+        ),
+    )
 
     return len(diagramas)
 
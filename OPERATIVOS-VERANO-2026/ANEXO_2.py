@@ -3,7 +3,7 @@ from typing import Dict, List
 
 import streamlit as st
 
-from gcs_utils import load_workbook_from_gcs, save_workbook_to_gcs
+from workbook_writes import AFTER_LAST, RowAppend, append_rows
 
 DATA_START_ROW_ANEXO2 = 7  # fila donde empiezan los datos en el Excel
 
@@ -18,89 +18,55 @@ UNIT_FILE_ANEXO2 = {
 # -------------------------------------------------------------------
 # Auxiliares de Excel
 # -------------------------------------------------------------------
-def _get_next_row_and_counter(path: str, data_start_row: int = DATA_START_ROW_ANEXO2):
+def _guardar_todos_anexo2(ruta_excel: str, resultados: List[Dict]) -> int:
     """
-    Devuelve (wb, ws, next_row, next_number) para escribir en la columna A.
+    Guarda una lista de resultados en UN archivo Excel, a continuación del
+    último número de la columna A. Si otro usuario guarda al mismo tiempo,
+    las filas se reubican automáticamente después de las suyas.
     """
-    wb = load_workbook_from_gcs(path)
-    ws = wb.active
-
-    last_row = None
-    last_number = None
-
-    for row in range(data_start_row, ws.max_row + 1):
-        value = ws.cell(row=row, column=1).value
-        if value is not None:
-            last_row = row
-            last_number = value
-
-    if last_row is None:
-        next_row = data_start_row
-        next_number = 1
-    else:
-        next_row = last_row + 1
-        try:
-            next_number = int(last_number) + 1
-        except Exception:
-            next_number = 1
-
-    return wb, ws, next_row, next_number
-
-
-def _guardar_todos_anexo2(ruta_excel: str, resultados: List[Dict]) -> int:
-    """Guarda una lista de resultados en UN archivo Excel."""
     if not resultados:
         return 0
 
-    wb, ws, start_row, start_num = _get_next_row_and_counter(
-        ruta_excel, DATA_START_ROW_ANEXO2
-    )
-
-    for idx, r in enumerate(resultados):
-        row = start_row + idx
-        num = start_num + idx
-
+    filas = []
+    for r in resultados:
         fecha_val = r["fecha"]
         hora_desde = r["hora_desde"]
         hora_hasta = r["hora_hasta"]
-        tipo_op = r["tipo_op"]
-        lugar = r["lugar"]
-        pers_ident = r["pers_ident"]
-        pers_asist = r["pers_asist"]
-        delito_prop = r["delito_prop"]
-        delito_pers = r["delito_pers"]
-        delito_otro = r["delito_otro"]
-        lesionados = r["lesionados"]
-        dem_aa = r["dem_aa"]
-        dem_av_hecho = r["dem_av_hecho"]
-        dem_infraganti = r["dem_infraganti"]
-        dem_contrav = r["dem_contrav"]
-        rec_hum = r["rec_hum"]
-        rec_mat = r["rec_mat"]
-        observ = r["observ"]
-
-        ws.cell(row=row, column=1).value = num
+
+        fila = {}
         if isinstance(fecha_val, date):
-            ws.cell(row=row, column=2).value = fecha_val.strftime("%d/%m/%Y")
-        ws.cell(row=row, column=3).value = hora_desde.strftime("%H:%M") if hora_desde else ""
-        ws.cell(row=row, column=4).value = hora_hasta.strftime("%H:%M") if hora_hasta else ""
-        ws.cell(row=row, column=5).value = tipo_op
-        ws.cell(row=row, column=6).value = lugar
-        ws.cell(row=row, column=7).value = pers_ident
-        ws.cell(row=row, column=8).value = pers_asist
-        ws.cell(row=row, column=9).value = delito_prop
-        ws.cell(row=row, column=10).value = delito_pers
-        ws.cell(row=row, column=11).value = delito_otro
-        ws.cell(row=row, column=12).value = lesionados
-        ws.cell(row=row, column=13).value = dem_aa
-        ws.cell(row=row, column=14).value = dem_av_hecho
-        ws.cell(row=row, column=15).value = dem_infraganti
-        ws.cell(row=row, column=16).value = dem_contrav
-        ws.cell(row=row, column=17).value = rec_hum
-        ws.cell(row=row, column=18).value = rec_mat
-        ws.cell(row=row, column=19).value = observ
-
-    save_workbook_to_gcs(wb, ruta_excel)
+            fila[2] = fecha_val.strftime("%d/%m/%Y")
+        fila.update({
+            3: hora_desde.strftime("%H:%M") if hora_desde else "",
+            4: hora_hasta.strftime("%H:%M") if hora_hasta else "",
+            5: r["tipo_op"],
+            6: r["lugar"],
+            7: r["pers_ident"],
+            8: r["pers_asist"],
+            9: r["delito_prop"],
+            10: r["delito_pers"],
+            11: r["delito_otro"],
+            12: r["lesionados"],
+            13: r["dem_aa"],
+            14: r["dem_av_hecho"],
+            15: r["dem_infraganti"],
+            16: r["dem_contrav"],
+            17: r["rec_hum"],
+            18: r["rec_mat"],
+            19: r["observ"],
+        })
+        filas.append(fila)
+
+    append_rows(
+        ruta_excel,
+        RowAppend(
+            rows=filas,
+            key_column=1,
+            start_row=DATA_START_ROW_ANEXO2,
+            mode=AFTER_LAST,
+            counter_column=1,
+        ),
+    )
 
     return len(resultados)
 
@@ -1,12 +1,21 @@
 import io
+import sys
 from datetime import date, timedelta
+from pathlib import Path
 
 import pandas as pd
 import streamlit as st
 
+# Módulos compartidos por las tres apps (gcs_utils, escritura de planillas):
+# viven en SNIC-SAT y esta app no tiene copias propias.
+_SNICSAT_DIR = Path(__file__).resolve().parent.parent / "SNIC-SAT"
+if str(_SNICSAT_DIR) not in sys.path:
+    sys.path.append(str(_SNICSAT_DIR))
+
 from ANEXO_1 import mostrar_anexo1
 from ANEXO_2 import mostrar_anexo_2
 from gcs_utils import download_blob_bytes, upload_blob_bytes
+from storage_metrics import begin_rerun, render_storage_panel
 
 APP_TITLE = "Operativos Verano"
 
@@ -124,9 +133,14 @@ def _cerrar_sesion() -> None:
 def run_operativos_verano_app(
     allowed_units: list[str] | None = None,
     configure_page: bool = True,
+    is_admin: bool = False,
 ) -> None:
     if configure_page:
         st.set_page_config(page_title=APP_TITLE, layout="wide")
+        begin_rerun()
+
+    if is_admin:
+        render_storage_panel()
 
     unidades_disponibles = _unidades_habilitadas(allowed_units)
 
@@ -3,7 +3,6 @@ import sys
 from pathlib import Path
 
 import streamlit as st
-from openpyxl.utils import column_index_from_string
 
 _PLANILLAS_DIR = Path(__file__).resolve().parent
 _SNICSAT_DIR = _PLANILLAS_DIR.parent / "SNIC-SAT"
@@ -12,12 +11,12 @@ if str(_SNICSAT_DIR) not in sys.path:
 
 from gcs_utils import (
     blob_exists,
+    create_blob_if_absent,
     download_blob_bytes,
-    load_workbook_from_gcs,
     resolve_excel_blob,
-    save_workbook_to_gcs,
-    upload_blob_bytes,
 )
+from storage_metrics import begin_rerun, render_storage_panel
+from workbook_writes import RowAppend, append_rows
 from agenda_ley_2785 import (
     registrar_carga_hecho,
     render_admin_agenda,
@@ -377,7 +376,10 @@ def ensure_unit_file_exists(unidad):
         raise ValueError(f"Unidad no reconocida: {unidad}")
 
     target = UNIT_FILE_MAP[unidad]
+    if blob_exists(target):
+        return target
 
+    # La plantilla solo se descarga cuando hay que crear la planilla de la unidad.
     template_blob = resolve_excel_blob(TEMPLATE_BASE)
     template_bytes = download_blob_bytes(template_blob)
     if template_bytes is None:
@@ -386,47 +388,30 @@ def ensure_unit_file_exists(unidad):
             f"Verificá que exista el blob '{template_blob}'."
         )
 
-    if not blob_exists(target):
-        upload_blob_bytes(target, template_bytes)
-
+    # Si otro usuario la creó al mismo tiempo, se conserva la suya.
+    create_blob_if_absent(target, template_bytes)
     return target
 
 
-def get_next_row_and_counter(ws):
-    row = 3
-    while ws.cell(row=row, column=1).value not in (None, ""):
-        row += 1
-
-    if row == 3:
-        return row, 1
-
-    last = ws.cell(row=row - 1, column=1).value
-    try:
-        last = int(last)
-    except Exception:
-        last = 0
-
-    return row, last + 1
-
-
 def save_to_excel(unidad, data):
+    """
+    Agrega el registro en la primera fila libre de la hoja LEY 2785 con el
+    número correlativo siguiente. Si otro usuario guarda al mismo tiempo, el
+    registro se reubica en la fila siguiente en lugar de pisar la suya.
+    """
     target = ensure_unit_file_exists(unidad)
-    wb = load_workbook_from_gcs(target)
-    if EXCEL_SHEET_NAME not in wb.sheetnames:
-        raise ValueError(
-            f"La hoja '{EXCEL_SHEET_NAME}' no existe en el archivo {target}."
-        )
-
-    ws = wb[EXCEL_SHEET_NAME]
-
-    row, counter = get_next_row_and_counter(ws)
-    ws.cell(row=row, column=1).value = counter
-
-    for k, col in COLUMN_MAPPING.items():
-        idx = column_index_from_string(col)
-        ws.cell(row=row, column=idx).value = data.get(k)
-    save_workbook_to_gcs(wb, target)
-    return counter, target
+    fila = {col: data.get(k) for k, col in COLUMN_MAPPING.items()}
+    result = append_rows(
+        target,
+        RowAppend(
+            rows=[fila],
+            key_column="A",
+            start_row=3,
+            counter_column="A",
+            sheet_name=EXCEL_SHEET_NAME,
+        ),
+    )
+    return result.first_number, target
 
 
 def render_admin_download(unidades):
@@ -497,6 +482,7 @@ def _allowed_units(unidades):
 def run_planillas_ley_2785_app(allowed_units=None, configure_page=True, is_admin=False):
     if configure_page:
         _configure_page()
+        begin_rerun()
 
     unidades = _allowed_units(allowed_units)
     if not unidades:
@@ -506,6 +492,7 @@ def run_planillas_ley_2785_app(allowed_units=None, configure_page=True, is_admin
         return
 
     if is_admin:
+        render_storage_panel()
         render_admin_download(unidades)
         render_admin_agenda(st.session_state.get("username"), unidades)
 
@@ -1,13 +1,17 @@
+import copy
 import datetime
 import html
 import json
-import uuid
-from typing import Any, Dict, List, Optional, Tuple
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import streamlit as st
 
-from gcs_utils import blob_exists, load_json_from_gcs, save_json_to_gcs
+from gcs_utils import GenerationMismatch, download_blob_with_generation, save_json_to_gcs, stat_blob
 from login import COMISARIA_OPTIONS
+import storage_metrics
+
+logger = logging.getLogger(__name__)
 
 # ===========================
 # Configuración básica
@@ -85,29 +89,436 @@ def es_admin(username: Optional[str], allowed_comisarias: Optional[List[str]]) -
     return set(allowed) == set(COMISARIA_OPTIONS)
 
 
-def _leer_agenda() -> AgendaData:
-    data = load_json_from_gcs(AGENDA_PATH)
-    if isinstance(data, dict) and data:
-        if _migrar_formato_antiguo(data):
-            _guardar_agenda(data)
-        return data  # type: ignore[return-value]
+# ===========================
+# Formato compacto de los meses
+# ===========================
+
+# Cada mes se guarda como ``{"v": 2, "dias": {día: ...}}`` y cada día como
+#   "n": nombres de los delitos (cada uno una sola vez),
+#   "s": slots ``[id, índice en "n"]`` (el id es un contador del día),
+#   "k": bits de los slots ya cargados (bit i = slot i de "s"),
+#   "p": preventivos por id de slot, "c": próximo id (no se reutilizan).
+# En memoria y en la API los días siguen con un dict por slot (ver
+# ``_decodificar_mes``), así que el resto del módulo no ve el formato.
+AGENDA_FORMATO = 2
+
+
+def _proximo_slot(entry: Dict[str, Any]) -> int:
+    delitos = entry.get("delitos")
+    numeros = [int(clave) for clave in delitos if str(clave).isdigit()] if isinstance(delitos, dict) else []
+    return max([int(entry.get("siguiente") or 1)] + [numero + 1 for numero in numeros])
+
+
+def _codificar_dia(entry: Dict[str, Any]) -> Dict[str, Any]:
+    delitos = entry.get("delitos")
+    siguiente = _proximo_slot(entry)
+    nombres: List[str] = []
+    posiciones: Dict[str, int] = {}
+    slots: List[List[int]] = []
+    cargados = 0
+    preventivos: Dict[str, str] = {}
+    for clave, info in (delitos.items() if isinstance(delitos, dict) else ()):
+        if not isinstance(info, dict):
+            continue
+        slot_id = str(info.get("id") or clave)
+        if not slot_id.isdigit():
+            # Ids de versiones anteriores (uuid): se renumeran en orden.
+            slot_id, siguiente = str(siguiente), siguiente + 1
+        nombre = info.get("nombre") or str(clave)
+        if nombre not in posiciones:
+            posiciones[nombre] = len(nombres)
+            nombres.append(nombre)
+        if int(info.get("cargados", 0) or 0) > 0:
+            cargados |= 1 << len(slots)
+        slots.append([int(slot_id), posiciones[nombre]])
+        preventivo = _normalize_preventivo(info.get("preventivo"))
+        if preventivo:
+            preventivos[slot_id] = preventivo
+    compacto: Dict[str, Any] = {"n": nombres, "s": slots, "c": siguiente}
+    if cargados:
+        compacto["k"] = cargados
+    if preventivos:
+        compacto["p"] = preventivos
+    return compacto
+
+
+def _codificar_mes(dias: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "v": AGENDA_FORMATO,
+        "dias": {key: _codificar_dia(entry) for key, entry in dias.items() if isinstance(entry, dict)},
+    }
+
+
+def _decodificar_mes(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Días del mes con un dict por slot (``id``, ``nombre``, ``plan``,
+    ``cargados`` y ``preventivo``). Los meses sin versión (un dict por slot
+    con ids uuid) se convierten al vuelo con los mismos ids que les quedan
+    al guardarlos.
+    """
+    if "v" not in raw:
+        raw = _codificar_mes(raw)
+    if raw["v"] != AGENDA_FORMATO:
+        raise ValueError(f"Formato de agenda desconocido: {raw['v']}")
+    dias: Dict[str, Any] = {}
+    for key, compacto in raw["dias"].items():
+        nombres = compacto.get("n", [])
+        cargados = int(compacto.get("k", 0))
+        preventivos = compacto.get("p", {})
+        delitos: Dict[str, Dict[str, Any]] = {}
+        for posicion, (numero, indice) in enumerate(compacto.get("s", [])):
+            slot_id = str(numero)
+            registro = {
+                "id": slot_id,
+                "nombre": nombres[indice],
+                "plan": 1,
+                "cargados": (cargados >> posicion) & 1,
+            }
+            if slot_id in preventivos:
+                registro["preventivo"] = preventivos[slot_id]
+            delitos[slot_id] = registro
+        dias[key] = {"delitos": delitos, "siguiente": int(compacto.get("c", 1))}
+    return dias
+
+
+# ===========================
+# Almacenamiento por comisaría y mes
+# ===========================
+
+# La agenda se guarda en un blob por comisaría y mes con los días de ese mes
+# (``agenda_delitos/<comisaría>/<AAAA-MM>.json``) y un manifiesto chico con
+# los meses de cada comisaría. Cada comisaría tiene además un resumen
+# (``resumen.json``) con los días de cada mes y su primer día pendiente,
+# así que el selector solo lee los meses que muestra. ``AGENDA_PATH`` (el
+# archivo único anterior) solo se lee para migrarlo la primera vez.
+AGENDA_PREFIX = "agenda_delitos"
+AGENDA_MANIFEST_PATH = f"{AGENDA_PREFIX}/manifest.json"
+MAX_CAS_ATTEMPTS = 5
+
+# JSON ya leídos por blob y generación (compartidos por todas las sesiones: no modificar).
+_parseados: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+_SNAPSHOT_KEY = "_agenda_delitos_snapshot"
+
+
+class AgendaConflictError(Exception):
+    """No se pudo guardar porque la agenda cambió en cada reintento."""
+
+
+def _mes(key: str) -> str:
+    return key[:7]
+
+
+def _mes_path(comisaria: str, mes: str) -> str:
+    return f"{AGENDA_PREFIX}/{comisaria}/{mes}.json"
+
+
+def _resumen_path(comisaria: str) -> str:
+    return f"{AGENDA_PREFIX}/{comisaria}/resumen.json"
+
+
+def _leer_json(
+    blob_name: str,
+    decodificar: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+    """
+    JSON del blob (pasado por ``decodificar``) revalidado por generación (un
+    GET condicional); si no cambió se reutiliza el ya leído. ``None`` si no
+    existe o está dañado.
+    """
+    contenido, generation = download_blob_with_generation(blob_name)
+    if generation is None:
+        _parseados.pop(blob_name, None)
+        return None, None
+    cached = _parseados.get(blob_name)
+    if cached is not None and cached[0] == generation:
+        return cached[1], generation
+    try:
+        data = json.loads(contenido.decode("utf-8"))
+        if not isinstance(data, dict):
+            return None, generation
+        if decodificar is not None:
+            data = decodificar(data)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None, generation
+    _parseados[blob_name] = (generation, data)
+    return data, generation
+
+
+def _guardar_json(blob_name: str, data: Dict[str, Any], if_generation_match: Optional[int] = None) -> int:
+    """Sube el JSON; ``data`` pasa a ser la versión compartida (no seguir modificándola)."""
+    info = save_json_to_gcs(blob_name, data, if_generation_match=if_generation_match, compact=True)
+    _parseados[blob_name] = (info.generation, data)
+    return info.generation
+
+
+def _leer_dias(path: str) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+    return _leer_json(path, _decodificar_mes)
+
+
+def _guardar_dias(path: str, dias: Dict[str, Any], if_generation_match: Optional[int] = None) -> int:
+    """Sube los días de un mes en el formato compacto."""
+    compacto = _codificar_mes(dias)
+    info = save_json_to_gcs(path, compacto, if_generation_match=if_generation_match, compact=True)
+    # Se guarda lo que leerán los demás (los ids renumerados, si los hubo).
+    _parseados[path] = (info.generation, _decodificar_mes(compacto))
+    return info.generation
+
+
+def _manifiesto() -> Dict[str, List[str]]:
+    """Meses con agenda de cada comisaría. La primera vez migra ``AGENDA_PATH``."""
+    data, generation = _leer_json(AGENDA_MANIFEST_PATH)
+    if generation is None:
+        return _migrar_agenda_unica()
+    if data is None:
+        logger.error("El manifiesto de la agenda (%s) está dañado; se usa una agenda vacía", AGENDA_MANIFEST_PATH)
+        return {}
+    return data.get("meses") or {}
+
+
+def _migrar_agenda_unica() -> Dict[str, List[str]]:
+    """Divide el archivo único de la agenda en meses por comisaría (una sola vez)."""
+    contenido, generation = download_blob_with_generation(AGENDA_PATH)
+    try:
+        data = json.loads(contenido.decode("utf-8")) if contenido else {}
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        data = None
+    if generation is None:
+        logger.info("No existe %s: la agenda comienza vacía", AGENDA_PATH)
+        data = {}
+    elif not isinstance(data, dict):
+        logger.error("%s está dañado: la agenda comienza vacía", AGENDA_PATH)
+        data = {}
+    _migrar_formato_antiguo(data)
+    try:
+        return _guardar_agenda_completa(data)
+    except GenerationMismatch:
+        # Otra sesión migró primero: se usa su manifiesto.
+        data, _ = _leer_json(AGENDA_MANIFEST_PATH)
+        return (data or {}).get("meses") or {}
+
+
+def _agrupar_por_mes(data: AgendaData) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """``{comisaría: {día: ...}}`` pasado a ``{comisaría: {mes: {día: ...}}}``."""
+    por_mes: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for comisaria, com_data in data.items():
+        if not isinstance(com_data, dict):
+            continue
+        for key, entry in com_data.items():
+            por_mes.setdefault(comisaria, {}).setdefault(_mes(key), {})[key] = entry
+    return por_mes
+
+
+def _guardar_agenda_completa(data: AgendaData) -> Dict[str, List[str]]:
+    """
+    Migración: sube cada mes de cada comisaría y después el manifiesto. Los
+    meses y el manifiesto solo se crean si no existen: un mes que ya está lo
+    migró otra sesión (y puede tener cambios posteriores), así que no se pisa.
+    """
+    por_mes = _agrupar_por_mes(data)
+    resumenes: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for comisaria, meses in por_mes.items():
+        for mes, dias in meses.items():
+            try:
+                generation = _guardar_dias(_mes_path(comisaria, mes), dias, if_generation_match=0)
+            except GenerationMismatch:
+                continue  # ya migrado
+            resumenes.setdefault(comisaria, {})[mes] = _resumen_mes(dias, generation)
+    for comisaria, entradas in resumenes.items():
+        _actualizar_resumen(comisaria, entradas)
+
+    meses_por_comisaria = {comisaria: sorted(meses) for comisaria, meses in por_mes.items()}
+    _guardar_json(AGENDA_MANIFEST_PATH, {"version": 1, "meses": meses_por_comisaria}, if_generation_match=0)
+    _olvidar_snapshot()
+    return meses_por_comisaria
+
+
+def _restaurar_agenda(data: AgendaData) -> None:
+    """
+    Reemplaza la agenda por la de un respaldo, mes por mes y con las mismas
+    reglas que cualquier cambio (``_modificar_mes``): cada mes se escribe
+    sobre la versión que se leyó. Los meses que no están en el respaldo
+    quedan vacíos y los que no cambian no se escriben.
+    """
+    por_mes = _agrupar_por_mes(data)
+    meses = {(comisaria, mes) for comisaria, lista in _manifiesto().items() for mes in lista}
+    meses.update((comisaria, mes) for comisaria, lista in por_mes.items() for mes in lista)
+    for comisaria, mes in sorted(meses):
+        dias = por_mes.get(comisaria, {}).get(mes, {})
+        if dias:
+            # También rearma un manifiesto dañado con los meses del respaldo.
+            _registrar_mes(comisaria, mes)
+
+        def cambio(actual: AgendaData, comisaria: str = comisaria, dias: Dict[str, Any] = dias) -> Tuple[bool]:
+            if actual.get(comisaria, {}) == dias:
+                return (False,)
+            actual[comisaria] = copy.deepcopy(dias)
+            return (True,)
+
+        _modificar_mes(comisaria, datetime.date.fromisoformat(f"{mes}-01"), cambio, cambio_conteos=False)
+        # Cambiaron días enteros: el índice del mes se vuelve a armar al consultarlo.
+        _indices.pop((comisaria, mes), None)
+
+
+def _registrar_mes(comisaria: str, mes: str) -> None:
+    """Agrega el mes al manifiesto si todavía no estaba (con reintentos ante escrituras concurrentes)."""
+    for _ in range(MAX_CAS_ATTEMPTS):
+        data, generation = _leer_json(AGENDA_MANIFEST_PATH)
+        meses = ((data or {}).get("meses") or {}).get(comisaria) or []
+        if mes in meses:
+            return
+        nuevo = copy.deepcopy(data or {"version": 1, "meses": {}})
+        nuevo.setdefault("meses", {})[comisaria] = sorted(meses + [mes])
+        try:
+            _guardar_json(AGENDA_MANIFEST_PATH, nuevo, if_generation_match=generation or 0)
+        except GenerationMismatch:
+            continue
+        return
+    raise AgendaConflictError("No se pudo actualizar el manifiesto de la agenda. Intente nuevamente.")
+
+
+def _resumen_mes(dias: Dict[str, Any], generation: Optional[int]) -> Dict[str, Any]:
+    """Días del mes y su primer día con delitos sin cargar, sobre la versión ``generation``."""
+    claves = _ordenar_dias(list(dias.keys()))
+    pendiente = next(
+        (key for key in claves if (_resumen_dia(dias.get(key)) or {}).get("sin_cargar")),
+        None,
+    )
+    return {"generation": generation, "dias": claves, "pendiente": pendiente}
+
+
+def _actualizar_resumen(comisaria: str, entradas: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Guarda en el resumen las ``entradas`` de cada mes, salvo donde ya hay
+    una de una versión más nueva. Es de mejor esfuerzo: si no se puede
+    guardar, los lectores lo rearman al ver que la generación del mes cambió.
+    """
+    path = _resumen_path(comisaria)
+    for _ in range(MAX_CAS_ATTEMPTS):
+        data, generation = _leer_json(path)
+        meses = dict((data or {}).get("meses") or {})
+        nuevas = {
+            mes: entrada for mes, entrada in entradas.items()
+            if mes not in meses or (meses[mes].get("generation") or 0) < (entrada["generation"] or 0)
+        }
+        if not nuevas:
+            return
+        meses.update(nuevas)
+        try:
+            _guardar_json(path, {"meses": meses}, if_generation_match=generation or 0)
+        except GenerationMismatch:
+            continue
+        return
 
-    agenda_vacia: AgendaData = {}
-    if not blob_exists(AGENDA_PATH):
-        st.caption("No se encontró el calendario en la nube. Se creará uno vacío por defecto.")
-        _guardar_agenda(agenda_vacia)
-        return agenda_vacia
 
-    if isinstance(data, dict):
-        return agenda_vacia
+def _snapshot(clave: Tuple[str, Optional[str]], leer: Callable[[], Any]) -> Any:
+    """
+    Lo que devuelve ``leer``, de solo lectura, para este rerun: se revalida
+    contra el bucket una vez por rerun y todas las consultas lo comparten.
+    """
+    rerun = storage_metrics.rerun_id()
+    if rerun is None:
+        return leer()
+    snapshot = st.session_state.get(_SNAPSHOT_KEY)
+    if snapshot is None or snapshot[0] != rerun:
+        snapshot = st.session_state[_SNAPSHOT_KEY] = (rerun, {})
+    if clave not in snapshot[1]:
+        snapshot[1][clave] = leer()
+    return snapshot[1][clave]
+
+
+def _olvidar_snapshot(comisaria: Optional[str] = None) -> None:
+    if storage_metrics.rerun_id() is None:
+        return
+    snapshot = st.session_state.get(_SNAPSHOT_KEY)
+    if snapshot is not None:
+        for clave in [clave for clave in snapshot[1] if comisaria is None or clave[0] == comisaria]:
+            del snapshot[1][clave]
+
+
+def _dias_mes(comisaria: str, mes: str) -> Dict[str, Any]:
+    """Días de un mes de la comisaría para este rerun (un solo blob)."""
+    return _snapshot((comisaria, mes), lambda: _leer_dias(_mes_path(comisaria, mes))[0] or {})
+
+
+def _resumen_vigente(comisaria: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Resumen de cada mes de la comisaría. Un mes cuyo blob es más nuevo que
+    su entrada (p. ej. si no se pudo guardar el resumen) se relee y se corrige.
+    """
+    meses = _manifiesto().get(comisaria) or []
+    data, _ = _leer_json(_resumen_path(comisaria))
+    guardados = (data or {}).get("meses") or {}
+    resumen: Dict[str, Dict[str, Any]] = {}
+    corregidas: Dict[str, Dict[str, Any]] = {}
+    for mes in meses:
+        entrada = guardados.get(mes)
+        info = stat_blob(_mes_path(comisaria, mes))
+        generation = info.generation if info is not None else None
+        if entrada is None or (entrada.get("generation") or 0) < (generation or 0):
+            dias, generation = _leer_dias(_mes_path(comisaria, mes))
+            entrada = corregidas[mes] = _resumen_mes(dias or {}, generation)
+        resumen[mes] = entrada
+    if corregidas:
+        _actualizar_resumen(comisaria, corregidas)
+    return resumen
 
-    st.error("El archivo de agenda está dañado. Se comenzó con una agenda vacía.")
-    _guardar_agenda(agenda_vacia)
-    return agenda_vacia
 
+def _resumen_comisaria(comisaria: str) -> Dict[str, Dict[str, Any]]:
+    return _snapshot((comisaria, None), lambda: _resumen_vigente(comisaria))
 
-def _guardar_agenda(data: AgendaData) -> None:
-    save_json_to_gcs(AGENDA_PATH, data)
+
+def _agenda_completa() -> AgendaData:
+    """Todas las comisarías con todos sus meses (solo para el respaldo)."""
+    agenda: AgendaData = {}
+    for comisaria, meses in _manifiesto().items():
+        com_data = agenda.setdefault(comisaria, {})
+        for mes in meses:
+            dias, _ = _leer_dias(_mes_path(comisaria, mes))
+            com_data.update(dias or {})
+    return agenda
+
+
+def _modificar_mes(
+    comisaria: str,
+    fecha: datetime.date,
+    cambio: Callable[[AgendaData], Tuple[Any, ...]],
+    cambio_conteos: bool = True,
+) -> Tuple[Any, ...]:
+    """
+    Lee el mes de ``fecha`` de la comisaría, le aplica ``cambio`` (que
+    modifica ``{comisaría: {día: ...}}`` en el lugar y devuelve un resultado
+    que empieza con ``ok``) y lo guarda solo si nadie escribió en el medio;
+    si alguien escribió, vuelve a leer y a aplicar ``cambio``. Si ``ok`` es
+    falso no se escribe. Solo se toca el blob de ese mes (y el manifiesto si
+    el mes es nuevo), así que otras comisarías no compiten. Con
+    ``cambio_conteos`` el índice se actualiza recalculando ese día.
+    """
+    if AGENDA_MANIFEST_PATH not in _parseados:
+        _manifiesto()  # migra la agenda anterior si hace falta (una vez por proceso)
+    mes = _mes(_key_fecha(fecha))
+    path = _mes_path(comisaria, mes)
+    for _ in range(MAX_CAS_ATTEMPTS):
+        dias, generation = _leer_dias(path)
+        data = {comisaria: copy.deepcopy(dias)} if dias else {}
+        resultado = cambio(data)
+        if not resultado[0]:
+            return resultado
+        # Un mes nuevo se registra antes de subirlo: un mes listado sin blob se
+        # lee vacío. Si el blob ya existe, el mes ya está en el manifiesto.
+        if generation is None:
+            _registrar_mes(comisaria, mes)
+        nuevos = data.get(comisaria, {})
+        try:
+            generation_nueva = _guardar_dias(path, nuevos, if_generation_match=generation or 0)
+        except GenerationMismatch:
+            continue
+        nuevos = _parseados[path][1]
+        _actualizar_resumen(comisaria, {mes: _resumen_mes(nuevos, generation_nueva)})
+        _olvidar_snapshot(comisaria)
+        if dias is not None:
+            _actualizar_indice(comisaria, mes, dias, nuevos, [fecha] if cambio_conteos else [])
+        return resultado
+    raise AgendaConflictError("La agenda cambió mientras se guardaba. Intente nuevamente.")
 
 
 def _key_fecha(fecha: datetime.date) -> str:
@@ -130,8 +541,11 @@ def _ordenar_dias(dias: List[str]) -> List[str]:
     return [par[1] for par in fechas_validas]
 
 
-def _generate_slot_id() -> str:
-    return uuid.uuid4().hex
+def _generate_slot_id(entry: Dict[str, Any]) -> str:
+    """Id corto del próximo slot del día: un contador que no se reutiliza."""
+    numero = _proximo_slot(entry)
+    entry["siguiente"] = numero + 1
+    return str(numero)
 
 
 def _migrar_formato_antiguo(data: AgendaData) -> bool:
@@ -158,7 +572,7 @@ def _migrar_formato_antiguo(data: AgendaData) -> bool:
                 if plan <= 0:
                     plan = max(1, cargados)
                 for idx in range(plan):
-                    slot_id = _generate_slot_id()
+                    slot_id = _generate_slot_id(entry)
                     nuevo = {
                         "id": slot_id,
                         "nombre": nombre,
@@ -192,7 +606,7 @@ def _ensure_entry(data: AgendaData, comisaria: str, fecha: datetime.date) -> Dic
                 continue
             registro = dict(info)
             if not registro.get("id"):
-                registro["id"] = _generate_slot_id()
+                registro["id"] = _generate_slot_id(entry)
                 cambios = True
             if not registro.get("nombre"):
                 registro["nombre"] = clave
@@ -240,15 +654,96 @@ def _generar_etiquetas(detalle: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
     return etiquetas
 
 
+# ===========================
+# Índice por comisaría
+# ===========================
+
+# Índice de cada mes de cada comisaría por día: plan, cargados, restantes,
+# estado y delitos sin cargar. Se guarda junto a los días de los que salió
+# (se comparan por identidad).
+_indices: Dict[Tuple[str, str], Tuple[Dict[str, Any], Dict[datetime.date, Dict[str, Any]]]] = {}
+
+
+def _resumen_dia(entry: Any) -> Optional[Dict[str, Any]]:
+    delitos = entry.get("delitos", {}) if isinstance(entry, dict) else {}
+    if not isinstance(delitos, dict) or not delitos:
+        return None
+
+    total_plan = 0
+    total_cargados = 0
+    sin_cargar = 0
+    pendientes = False
+
+    for valores in delitos.values():
+        if not isinstance(valores, dict):
+            continue
+
+        plan = max(int(valores.get("plan", 1)), 1)
+        cargados = 1 if int(valores.get("cargados", 0)) > 0 else 0
+
+        total_plan += plan
+        total_cargados += cargados
+        if plan > cargados:
+            pendientes = True
+        if not cargados:
+            sin_cargar += 1
+
+    return {
+        "plan": total_plan,
+        "cargados": total_cargados,
+        "restantes": max(total_plan - total_cargados, 0),
+        "estado": "pendiente" if pendientes else "completo",
+        "sin_cargar": sin_cargar,
+    }
+
+
+def _indice_comisaria(com_data: Dict[str, Any]) -> Dict[datetime.date, Dict[str, Any]]:
+    indice: Dict[datetime.date, Dict[str, Any]] = {}
+    for key in _ordenar_dias(list(com_data.keys())):
+        resumen = _resumen_dia(com_data.get(key))
+        if resumen is not None:
+            indice[_parse_fecha(key)] = resumen
+    return indice
+
+
+def _indice(comisaria: str, mes: str) -> Dict[datetime.date, Dict[str, Any]]:
+    """Índice de un mes de la comisaría para este rerun, armado en una sola pasada."""
+    dias = _dias_mes(comisaria, mes)
+    cached = _indices.get((comisaria, mes))
+    if cached is None or cached[0] is not dias:
+        cached = _indices[(comisaria, mes)] = (dias, _indice_comisaria(dias))
+    return cached[1]
+
+
+def _actualizar_indice(
+    comisaria: str,
+    mes: str,
+    anterior: Dict[str, Any],
+    dias: Dict[str, Any],
+    fechas: List[datetime.date],
+) -> None:
+    """Pasa el índice del mes de ``anterior`` a ``dias`` recalculando solo ``fechas``."""
+    cached = _indices.get((comisaria, mes))
+    if cached is None or cached[0] is not anterior:
+        return  # no había índice de la versión anterior: se arma al consultar
+    nuevo = dict(cached[1])
+    for fecha in fechas:
+        resumen = _resumen_dia(dias.get(_key_fecha(fecha)))
+        if resumen is None:
+            nuevo.pop(fecha, None)
+        else:
+            nuevo[fecha] = resumen
+    _indices[(comisaria, mes)] = (dias, dict(sorted(nuevo.items())))
+
+
 # ===========================
 # API pública de datos
 # ===========================
 
 
 def obtener_dias_planificados(comisaria: str) -> List[datetime.date]:
-    data = _leer_agenda()
-    dias = data.get(comisaria, {})
-    ordenados = _ordenar_dias(list(dias.keys()))
+    resumen = _resumen_comisaria(comisaria)
+    ordenados = _ordenar_dias([key for mes in resumen.values() for key in mes.get("dias", [])])
     resultado = []
     for key in ordenados:
         fecha = _parse_fecha(key)
@@ -258,8 +753,8 @@ def obtener_dias_planificados(comisaria: str) -> List[datetime.date]:
 
 
 def obtener_detalle_dia(comisaria: str, fecha: datetime.date) -> Dict[str, Dict[str, Any]]:
-    data = _leer_agenda()
-    entry = data.get(comisaria, {}).get(_key_fecha(fecha), {})
+    key = _key_fecha(fecha)
+    entry = _dias_mes(comisaria, _mes(key)).get(key, {})
     delitos = entry.get("delitos", {})
     resultado: Dict[str, Dict[str, Any]] = {}
     for delito_id, valores in delitos.items():
@@ -309,10 +804,10 @@ def obtener_delitos_pendientes(comisaria: str, fecha: datetime.date) -> Dict[str
 
 
 def obtener_primer_dia_pendiente(comisaria: str) -> Optional[datetime.date]:
-    for fecha in obtener_dias_planificados(comisaria):
-        detalle = obtener_delitos_pendientes(comisaria, fecha)
-        if any(info.get("restantes", 0) > 0 for info in detalle.values()):
-            return fecha
+    resumen = _resumen_comisaria(comisaria)
+    for mes in sorted(resumen):
+        if resumen[mes].get("pendiente"):
+            return _parse_fecha(resumen[mes]["pendiente"])
     return None
 
 
@@ -331,25 +826,29 @@ def puede_cargar_delito(comisaria: str, fecha: datetime.date, delito_id: str) ->
 
 
 def registrar_carga_delito(comisaria: str, fecha: datetime.date, delito_id: str) -> Tuple[bool, Optional[str], Optional[int]]:
-    data = _leer_agenda()
-    com_data = data.get(comisaria)
-    if not com_data:
-        return False, "No hay un almanaque cargado para esta comisaría.", None
-    key = _key_fecha(fecha)
-    dia_info = com_data.get(key)
-    if not dia_info:
-        return False, "El día seleccionado no tiene delitos asignados.", None
-    delitos = dia_info.get("delitos", {})
-    if delito_id not in delitos:
-        return False, "El delito no pertenece al día seleccionado.", None
-    registro = delitos[delito_id]
-    cargados = int(registro.get("cargados", 0))
-    if cargados >= 1:
-        return False, "Se alcanzó el total planificado para este delito.", None
-    registro["cargados"] = 1
-    _guardar_agenda(data)
-    restantes = 0
-    return True, None, restantes
+    def cambio(data: AgendaData) -> Tuple[bool, Optional[str], Optional[int]]:
+        com_data = data.get(comisaria)
+        if not com_data:
+            return False, "No hay un almanaque cargado para esta comisaría.", None
+        key = _key_fecha(fecha)
+        dia_info = com_data.get(key)
+        if not dia_info:
+            return False, "El día seleccionado no tiene delitos asignados.", None
+        delitos = dia_info.get("delitos", {})
+        if delito_id not in delitos:
+            return False, "El delito no pertenece al día seleccionado.", None
+        registro = delitos[delito_id]
+        cargados = int(registro.get("cargados", 0))
+        if cargados >= 1:
+            return False, "Se alcanzó el total planificado para este delito.", None
+        registro["cargados"] = 1
+        restantes = 0
+        return True, None, restantes
+
+    try:
+        return _modificar_mes(comisaria, fecha, cambio)
+    except AgendaConflictError as exc:
+        return False, str(exc), None
 
 
 def asignar_delito(
@@ -361,23 +860,28 @@ def asignar_delito(
 ) -> Tuple[bool, Optional[str]]:
     if cantidad <= 0:
         return False, "La cantidad debe ser mayor a cero."
-    data = _leer_agenda()
-    entry = _ensure_entry(data, comisaria, fecha)
-    delitos = entry["delitos"]
     preventivo_normalizado = _normalize_preventivo(preventivo)
-    for _ in range(cantidad):
-        slot_id = _generate_slot_id()
-        nuevo_registro = {
-            "id": slot_id,
-            "nombre": delito,
-            "plan": 1,
-            "cargados": 0,
-        }
-        if preventivo_normalizado:
-            nuevo_registro["preventivo"] = preventivo_normalizado
-        delitos[slot_id] = nuevo_registro
-    _guardar_agenda(data)
-    return True, None
+
+    def cambio(data: AgendaData) -> Tuple[bool, Optional[str]]:
+        entry = _ensure_entry(data, comisaria, fecha)
+        delitos = entry["delitos"]
+        for _ in range(cantidad):
+            slot_id = _generate_slot_id(entry)
+            nuevo_registro = {
+                "id": slot_id,
+                "nombre": delito,
+                "plan": 1,
+                "cargados": 0,
+            }
+            if preventivo_normalizado:
+                nuevo_registro["preventivo"] = preventivo_normalizado
+            delitos[slot_id] = nuevo_registro
+        return True, None
+
+    try:
+        return _modificar_mes(comisaria, fecha, cambio)
+    except AgendaConflictError as exc:
+        return False, str(exc)
 
 
 def actualizar_preventivo_delito(
@@ -386,47 +890,56 @@ def actualizar_preventivo_delito(
     delito_id: str,
     preventivo: Optional[str],
 ) -> Tuple[bool, Optional[str]]:
-    data = _leer_agenda()
-    com_data = data.get(comisaria)
-    if not com_data:
-        return False, "No se encontraron asignaciones para la comisaría."
-    key = _key_fecha(fecha)
-    dia_info = com_data.get(key)
-    if not dia_info:
-        return False, "El día seleccionado no tiene delitos asignados."
-    delitos = dia_info.get("delitos", {})
-    registro = delitos.get(delito_id)
-    if not registro:
-        return False, "El delito no está asignado en este día."
     preventivo_normalizado = _normalize_preventivo(preventivo)
-    if preventivo_normalizado:
-        registro["preventivo"] = preventivo_normalizado
-    else:
-        registro.pop("preventivo", None)
-    _guardar_agenda(data)
-    return True, None
+
+    def cambio(data: AgendaData) -> Tuple[bool, Optional[str]]:
+        com_data = data.get(comisaria)
+        if not com_data:
+            return False, "No se encontraron asignaciones para la comisaría."
+        key = _key_fecha(fecha)
+        dia_info = com_data.get(key)
+        if not dia_info:
+            return False, "El día seleccionado no tiene delitos asignados."
+        delitos = dia_info.get("delitos", {})
+        registro = delitos.get(delito_id)
+        if not registro:
+            return False, "El delito no está asignado en este día."
+        if preventivo_normalizado:
+            registro["preventivo"] = preventivo_normalizado
+        else:
+            registro.pop("preventivo", None)
+        return True, None
+
+    try:
+        return _modificar_mes(comisaria, fecha, cambio, cambio_conteos=False)
+    except AgendaConflictError as exc:
+        return False, str(exc)
 
 
 def quitar_delito(comisaria: str, fecha: datetime.date, delito_id: str) -> Tuple[bool, Optional[str]]:
-    data = _leer_agenda()
-    com_data = data.get(comisaria)
-    if not com_data:
-        return False, "No se encontraron asignaciones para la comisaría."
-    key = _key_fecha(fecha)
-    dia_info = com_data.get(key)
-    if not dia_info:
-        return False, "El día seleccionado no tiene delitos asignados."
-    delitos = dia_info.get("delitos", {})
-    registro = delitos.get(delito_id)
-    if not registro:
-        return False, "El delito no está asignado en este día."
-    if int(registro.get("cargados", 0)) > 0:
-        return False, "No se puede quitar un delito que ya tiene cargas registradas."
-    delitos.pop(delito_id, None)
-    if not delitos:
-        com_data.pop(key, None)
-    _guardar_agenda(data)
-    return True, None
+    def cambio(data: AgendaData) -> Tuple[bool, Optional[str]]:
+        com_data = data.get(comisaria)
+        if not com_data:
+            return False, "No se encontraron asignaciones para la comisaría."
+        key = _key_fecha(fecha)
+        dia_info = com_data.get(key)
+        if not dia_info:
+            return False, "El día seleccionado no tiene delitos asignados."
+        delitos = dia_info.get("delitos", {})
+        registro = delitos.get(delito_id)
+        if not registro:
+            return False, "El delito no está asignado en este día."
+        if int(registro.get("cargados", 0)) > 0:
+            return False, "No se puede quitar un delito que ya tiene cargas registradas."
+        delitos.pop(delito_id, None)
+        if not delitos:
+            com_data.pop(key, None)
+        return True, None
+
+    try:
+        return _modificar_mes(comisaria, fecha, cambio)
+    except AgendaConflictError as exc:
+        return False, str(exc)
 
 
 def resumen_dia_dataframe(comisaria: str, fecha: datetime.date) -> None:
@@ -452,49 +965,10 @@ def resumen_dia_dataframe(comisaria: str, fecha: datetime.date) -> None:
 # ===========================
 
 
-def _resumen_estados_dias(comisaria: str) -> Dict[datetime.date, Dict[str, int]]:
-    """Resumen por día para colorear el almanaque."""
-
-    data = _leer_agenda()
-    com_data = data.get(comisaria, {})
-    resumen: Dict[datetime.date, Dict[str, int]] = {}
+def _resumen_estados_dias(comisaria: str, mes: str) -> Dict[datetime.date, Dict[str, int]]:
+    """Resumen por día del mes para colorear el almanaque."""
 
-    for key in _ordenar_dias(list(com_data.keys())):
-        fecha = _parse_fecha(key)
-        if fecha is None:
-            continue
-
-        entry = com_data.get(key, {})
-        delitos = entry.get("delitos", {})
-        if not isinstance(delitos, dict) or not delitos:
-            continue
-
-        total_plan = 0
-        total_cargados = 0
-        pendientes = False
-
-        for valores in delitos.values():
-            if not isinstance(valores, dict):
-                continue
-
-            plan = max(int(valores.get("plan", 1)), 1)
-            cargados = 1 if int(valores.get("cargados", 0)) > 0 else 0
-
-            total_plan += plan
-            total_cargados += cargados
-            if plan > cargados:
-                pendientes = True
-
-        estado = "pendiente" if pendientes else "completo"
-
-        resumen[fecha] = {
-            "plan": total_plan,
-            "cargados": total_cargados,
-            "restantes": max(total_plan - total_cargados, 0),
-            "estado": estado,
-        }
-
-    return resumen
+    return _indice(comisaria, mes)
 
 
 def _render_almanaque(dias: List[datetime.date], resumen: Dict[datetime.date, Dict[str, int]], seleccionada: Optional[datetime.date]) -> None:
@@ -646,6 +1120,18 @@ def _render_almanaque(dias: List[datetime.date], resumen: Dict[datetime.date, Di
 # ===========================
 
 
+_RESPALDO_KEY = "agenda_admin_respaldo"
+
+
+def _respaldo_entregado() -> None:
+    st.session_state.pop(_RESPALDO_KEY, None)
+
+
+def _manifiesto_danado() -> bool:
+    data, generation = _leer_json(AGENDA_MANIFEST_PATH)
+    return generation is not None and data is None
+
+
 def render_admin_agenda(username: Optional[str], allowed_comisarias: Optional[List[str]]) -> None:
     if not es_admin(username, allowed_comisarias):
         return
@@ -657,21 +1143,32 @@ def render_admin_agenda(username: Optional[str], allowed_comisarias: Optional[Li
         " Puede agregar o quitar asignaciones siempre que no tengan cargas registradas."
     )
 
+    if _manifiesto_danado():
+        st.error("El manifiesto de la agenda está dañado. Restaure el calendario desde un respaldo.")
+
     st.markdown("#### Respaldo del calendario")
     col_backup_download, col_backup_upload = st.columns(2)
 
     with col_backup_download:
         st.markdown("**Guardar calendario actual**")
-        agenda_actual = _leer_agenda()
-        backup_bytes = json.dumps(agenda_actual, ensure_ascii=False, indent=2).encode("utf-8")
-        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-        st.download_button(
-            label="📁 Descargar respaldo",
-            data=backup_bytes,
-            file_name=f"agenda_delitos_{timestamp}.json",
-            mime="application/json",
-            use_container_width=True,
-        )
+        # El respaldo lee todos los meses de todas las comisarías: solo a pedido.
+        if st.button("📦 Preparar respaldo", key="agenda_admin_preparar_respaldo", use_container_width=True):
+            agenda_actual = _agenda_completa()
+            st.session_state[_RESPALDO_KEY] = (
+                datetime.datetime.now().strftime("%Y%m%d-%H%M%S"),
+                json.dumps(agenda_actual, ensure_ascii=False, indent=2).encode("utf-8"),
+            )
+        respaldo = st.session_state.get(_RESPALDO_KEY)
+        if respaldo is not None:
+            timestamp, backup_bytes = respaldo
+            st.download_button(
+                label="📁 Descargar respaldo",
+                data=backup_bytes,
+                file_name=f"agenda_delitos_{timestamp}.json",
+                mime="application/json",
+                use_container_width=True,
+                on_click=_respaldo_entregado,
+            )
         st.caption("Guarde una copia local del calendario actual para conservar un respaldo.")
 
     with col_backup_upload:
@@ -693,9 +1190,14 @@ def render_admin_agenda(username: Optional[str], allowed_comisarias: Optional[Li
                 if not isinstance(data, dict):
                     st.error("El respaldo debe contener un objeto JSON con el calendario completo.")
                 else:
-                    _guardar_agenda(data)
-                    st.success("Se restauró el calendario desde el archivo subido.")
-                    st.rerun()
+                    _migrar_formato_antiguo(data)
+                    try:
+                        _restaurar_agenda(data)
+                    except AgendaConflictError as exc:
+                        st.error(str(exc))
+                    else:
+                        st.success("Se restauró el calendario desde el archivo subido.")
+                        st.rerun()
 
     comisarias = allowed_comisarias or COMISARIA_OPTIONS
     comisaria_sel = st.selectbox(
@@ -802,11 +1304,11 @@ def render_selector_comisaria(comisaria: str) -> Tuple[Optional[datetime.date],
     if not dias:
         return None, {}, "¡Felicitaciones! No hay delitos asignados por el administrador para esta comisaría."
 
-    resumen = _resumen_estados_dias(comisaria)
+    primer_pendiente = obtener_primer_dia_pendiente(comisaria)
 
     preferido = st.session_state.get("agenda_fecha")
     if preferido not in dias:
-        preferido = obtener_primer_dia_pendiente(comisaria) or dias[0]
+        preferido = primer_pendiente or dias[0]
 
     fecha_sel = st.date_input(
         "Seleccione el día asignado",
@@ -819,12 +1321,14 @@ def render_selector_comisaria(comisaria: str) -> Tuple[Optional[datetime.date],
 
     st.session_state.agenda_fecha = fecha_sel
 
-    _render_almanaque(dias, resumen, fecha_sel)
+    # El almanaque muestra el mes elegido: solo se lee ese mes.
+    mes_sel = _mes(_key_fecha(fecha_sel))
+    dias_mes = [dia for dia in dias if _mes(_key_fecha(dia)) == mes_sel]
+    _render_almanaque(dias_mes, _resumen_estados_dias(comisaria, mes_sel), fecha_sel)
 
     if fecha_sel not in dias:
         return None, {}, "No hay delitos asignados para la fecha elegida."
 
-    primer_pendiente = obtener_primer_dia_pendiente(comisaria)
     if primer_pendiente and fecha_sel > primer_pendiente:
         msg = primer_pendiente.strftime("%d/%m/%Y")
         return None, {}, f"Debe completar primero el día {msg} antes de avanzar."
@@ -1,8 +1,12 @@
 import streamlit as st
 import datetime
+import logging
 import os
 import sys
+import time
+import uuid
 from pathlib import Path
+from typing import Optional
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 if str(ROOT_DIR) not in sys.path:
@@ -12,17 +16,24 @@ import direcciones          # módulo externo para pantalla de direcciones strea
 import Robos_Hurtos         # subflujo para delitos Robos/Hurtos
 import otros                # subflujo para Lesiones / Desaparición
 import agenda_delitos       # gestión de almanaque de delitos asignados
+import registro_snic        # escritura de un registro completo en la planilla
+import row_leases           # vigencia de las reservas de fila
+import write_behind         # guardado diferido con diario local
+import registro_log         # registro de solo agregado + planilla materializada
+import volumenes            # volúmenes de la planilla (renovación automática)
+import storage_metrics      # costo de almacenamiento por rerun
 from gcs_utils import (
     ensure_excel_blob,
-    load_workbook_from_gcs,
     resolve_excel_blob,
-    save_workbook_to_gcs,
+    stat_blob,
     upload_blob_bytes,
     download_blob_bytes,
 )
 from login import render_login, render_user_header
 from system_selector import AVAILABLE_SYSTEMS, render_system_selector
 
+logger = logging.getLogger(__name__)
+
 SYSTEM_SNICSAT_ID = "snic-sat"
 SYSTEM_OPERATIVOS_VERANO_ID = "operativos-verano"
 SYSTEM_PLANILLAS_2785_ID = "planillas-ley-2785"
@@ -41,6 +52,7 @@ PLANILLAS_UNIDAD_MAP = {
 }
 
 st.set_page_config(page_title="Panel de sistemas DSICCO", layout="wide")
+storage_metrics.begin_rerun()
 
 _OPERATIVOS_DIR = Path(__file__).resolve().parent.parent / "OPERATIVOS-VERANO-2026"
 if str(_OPERATIVOS_DIR) not in sys.path:
@@ -92,33 +104,6 @@ def asegurar_excel(path: str):
     ensure_excel_blob(path)
 
 
-def cargar_libro(path: str):
-    """
-    Carga el libro desde GCS respetando macros si es .xlsm.
-    """
-    return load_workbook_from_gcs(path)
-
-def obtener_siguiente_fila_por_fecha(path: str, col_fecha: str = "C") -> int:
-    """
-    Busca la primera fila vacía en la columna de fecha (C por defecto) a partir de la fila 3.
-    """
-    wb = cargar_libro(path)
-    ws = wb.active
-    fila = 3
-    while True:
-        val = ws[f"{col_fecha}{fila}"].value
-        if val is None or (isinstance(val, str) and val.strip() == ""):
-            return fila
-        fila += 1
-
-def unwrap_quotes(v):
-    if not isinstance(v, str):
-        return v
-    if len(v) >= 2 and ((v[0] == v[-1] == '"') or (v[0] == v[-1] == "'")):
-        return v[1:-1]
-    return v
-
-
 def normalizar_preventivo(preventivo):
     """Formatea el preventivo reemplazando el 0 por "NO APORTA"."""
 
@@ -136,36 +121,6 @@ def fecha_a_texto_curvo(fecha: datetime.date) -> str:
         return None
     return fecha.strftime("%d/%m/%y")
 
-def escribir_registro(path: str, fila: int, hecho, delito,
-                      actuacion, fecha_denuncia_txt, fecha_hecho_txt,
-                      hora_hecho_txt, hora_fin_txt, preventivo_txt,
-                      denunciante_txt, motivo_txt):
-    """
-    Escribe datos en: C,D,E,F,H,Q,AF,BL,X,R (sin tocar A).
-    """
-    wb = cargar_libro(path)
-    ws = wb.active
-    try:
-        ws[f"C{fila}"].value  = fecha_denuncia_txt
-        ws[f"D{fila}"].value  = fecha_hecho_txt
-        ws[f"E{fila}"].value  = hora_hecho_txt
-        ws[f"F{fila}"].value  = hora_fin_txt
-        ws[f"H{fila}"].value  = unwrap_quotes(preventivo_txt)
-        ws[f"Q{fila}"].value  = unwrap_quotes(denunciante_txt)
-        ws[f"AF{fila}"].value = unwrap_quotes(motivo_txt)
-        ws[f"BL{fila}"].value = unwrap_quotes(hecho)
-        ws[f"X{fila}"].value  = unwrap_quotes(delito)
-        ws[f"R{fila}"].value  = unwrap_quotes(actuacion)
-        save_workbook_to_gcs(wb, path)
-        return True
-    except PermissionError:
-        st.error("⚠️ No se pudo guardar porque el archivo está abierto en Excel con bloqueo de escritura. Cerrá el archivo y probá de nuevo.")
-        return False
-    except Exception as e:
-        st.error(f"⚠️ No se pudo escribir en {path}: {e}")
-        return False
-
-
 def fila_a_mostrar(fila: int):
     """
     Ajusta la fila de escritura para mostrar al usuario restando 2,
@@ -189,26 +144,205 @@ def excel_path_por_comisaria(nombre_comisaria: str) -> str:
     return resolve_excel_path(base)
 
 
-@st.cache_data(show_spinner=False)
-def _cached_excel_path(nombre_comisaria: str, refresh_token: int) -> str:
-    base = _BASE_POR_COMISARIA.get(nombre_comisaria, excel_base_cenaf_4)
-    return resolve_excel_path(base)
+# Límites del contexto de Excel en cache: una entrada por volumen y generación.
+EXCEL_CONTEXT_MAX_ENTRIES = 32
+EXCEL_CONTEXT_TTL_SECONDS = 15 * 60
+
 
+@st.cache_data(show_spinner=False, max_entries=EXCEL_CONTEXT_MAX_ENTRIES, ttl=EXCEL_CONTEXT_TTL_SECONDS)
+def _prepare_excel_context(excel_path: str, generation: Optional[int]) -> int:
+    """
+    Próxima fila libre de la versión ``generation`` del volumen (solo lectura).
+    Cuando alguien guarda cambia la generación de esa comisaría y solo esa
+    se recalcula.
+    """
+    return registro_snic.siguiente_fila(excel_path)
 
-@st.cache_data(show_spinner=False)
-def _prepare_excel_context(nombre_comisaria: str, refresh_token: int):
-    excel_path = _cached_excel_path(nombre_comisaria, refresh_token)
+
+def _excel_de_trabajo(nombre_comisaria: str) -> tuple[str, int]:
+    """
+    Volumen donde se carga y su próxima fila. Crear la planilla o abrir el
+    volumen siguiente cuando se completa se hace acá, en cada rerun, y no en
+    la parte en cache (que se saltearía con un acierto).
+    """
+    excel_path = volumenes.volumen_activo(excel_path_por_comisaria(nombre_comisaria))
     asegurar_excel(excel_path)
-    fila_objetivo = obtener_siguiente_fila_por_fecha(excel_path, col_fecha="C")
-    planilla_llena = fila_objetivo >= 103
-    excel_bytes = download_blob_bytes(excel_path)
-    return excel_path, fila_objetivo, planilla_llena, excel_bytes
+    info = stat_blob(excel_path)
+    fila_objetivo = _prepare_excel_context(excel_path, info.generation if info is not None else None)
+    if fila_objetivo >= registro_snic.FILA_LIMITE:
+        # El volumen activo está completo: se abre el siguiente.
+        excel_path, fila_objetivo = volumenes.volumen_para_escribir(excel_path)
+    return excel_path, fila_objetivo
+
+
+DESCARGA_COMBINADA = "Todos los volúmenes (combinado)"
+
+
+def _excel_para_descarga(excel_path: str, combinado: bool = False):
+    """
+    Contenido actual de la planilla (o de todos sus volúmenes combinados),
+    solo cuando el usuario pide la descarga. La cache de contenidos del
+    bucket lo revalida por generación, así que pedirla de nuevo sin cambios
+    no vuelve a bajar el archivo.
+    """
+    nombres = volumenes.volumenes(excel_path) if combinado else [excel_path]
+    if _modo_guardado() == MODO_GUARDADO_REGISTRO:
+        # La descarga tiene que incluir todo lo registrado hasta ahora.
+        for nombre in nombres:
+            try:
+                registro_log.materializar_si_hay_pendientes(nombre)
+            except Exception:
+                _get_materializador().programar(nombre, 0)
+    if combinado:
+        return volumenes.exportar_combinado(excel_path, nombres)
+    return download_blob_bytes(excel_path)
+
 
+def _generaciones(nombres: list[str]) -> tuple[Optional[int], ...]:
+    """Generación de cada blob según el manifiesto (sin descargar nada)."""
+    return tuple(getattr(stat_blob(nombre), "generation", None) for nombre in nombres)
+
+
+def _descarga_entregada():
+    st.session_state.pop("descarga_excel_preparada", None)
+
+
+# ---------------------------
+# Guardado directo / diferido
+# ---------------------------
+
+MODO_GUARDADO_DIRECTO = "directo"
+MODO_GUARDADO_DIFERIDO = "diferido"
+MODO_GUARDADO_REGISTRO = "registro"
+
+
+def _modo_guardado() -> str:
+    """
+    "directo" (por defecto) guarda en la planilla antes de responder.
+    "diferido" registra el registro en un diario local y lo guarda en segundo plano.
+    "registro" lo agrega al registro de la comisaría en el bucket; la planilla
+    se materializa en segundo plano y antes de cada descarga.
+    Se configura con SNICSAT_MODO_GUARDADO o [snicsat] modo_guardado en secrets.
+    """
+    modo = os.getenv("SNICSAT_MODO_GUARDADO")
+    if not modo:
+        try:
+            modo = st.secrets.get("snicsat", {}).get("modo_guardado")
+        except Exception:
+            modo = None
+    return (modo or MODO_GUARDADO_DIRECTO).strip().lower()
+
+
+def _guardar_registro_diferido(registro: dict) -> int:
+    # El id de la tarea viaja en el registro: si se repite, no se escribe dos veces.
+    _, fila = volumenes.guardar_registro(registro)
+    return fila
+
+
+def _agenda_tras_guardado_diferido(registro: dict, fila: int) -> None:
+    """El delito del almanaque se marca como cargado recién cuando el registro está en la planilla."""
+    agenda = registro.get("agenda")
+    if not agenda:
+        return
+    registrado, msg_agenda, _ = agenda_delitos.registrar_carga_delito(
+        agenda["comisaria"],
+        datetime.date.fromisoformat(agenda["fecha"]),
+        agenda["slot"],
+    )
+    if not registrado:
+        logger.warning(
+            "Registro %s guardado en la fila %s sin marcar el almanaque: %s", registro.get("id"), fila, msg_agenda
+        )
+
+
+@st.cache_resource(show_spinner=False)
+def _get_write_behind() -> write_behind.WriteBehindJournal:
+    path = os.getenv("SNICSAT_JOURNAL_PATH", ".write-behind/snicsat.jsonl")
+    return write_behind.WriteBehindJournal(
+        path, _guardar_registro_diferido, on_success=_agenda_tras_guardado_diferido
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def _get_materializador() -> registro_log.Materializador:
+    return registro_log.Materializador()
+
+
+def _render_panel_guardado_diferido() -> None:
+    journal = _get_write_behind()
+    entradas = journal.entries()
+    fallidas = [e for e in entradas if e["estado"] == write_behind.FAILED]
+    titulo = f"Guardados diferidos ({len(entradas) - len(fallidas)} pendientes, {len(fallidas)} fallidos)"
+    with st.expander(titulo, expanded=bool(fallidas)):
+        if not entradas:
+            st.caption("No hay registros pendientes de guardar.")
+            return
+        for entrada in entradas:
+            payload = entrada["payload"] or {}
+            st.markdown(
+                f"**{payload.get('comisaria') or entrada['blob']}** · {payload.get('delito') or '-'} · "
+                f"{entrada['estado']} · intentos: {entrada['intentos']} · creado: {entrada['creado']}"
+            )
+            if entrada["ultimo_error"]:
+                st.caption(f"Último error: {entrada['ultimo_error']}")
+            if entrada["estado"] == write_behind.FAILED:
+                col_r, col_d = st.columns(2)
+                if col_r.button("Reintentar", key=f"wb_retry_{entrada['id']}"):
+                    journal.retry(entrada["id"])
+                    st.rerun()
+                if col_d.button("Descartar", key=f"wb_discard_{entrada['id']}"):
+                    journal.discard(entrada["id"])
+                    st.rerun()
+
+# ---------------------------
+# Reserva de fila
+# ---------------------------
+
+def _liberar_reserva_fila() -> None:
+    reserva = st.session_state.get("reserva_fila")
+    st.session_state.reserva_fila = None
+    if not reserva:
+        return
+    try:
+        registro_snic.liberar_reserva_planilla(reserva[0], st.session_state.lease_owner)
+    except Exception:
+        pass  # si no se pudo liberar, la reserva vence sola
+
+
+def _reservar_fila(excel_path: str):
+    """Reserva (o renueva) la fila de esta sesión en la planilla."""
+    reserva = st.session_state.get("reserva_fila")
+    if reserva and reserva[0] != excel_path:
+        _liberar_reserva_fila()
+    try:
+        fila = registro_snic.reservar_fila_planilla(excel_path, st.session_state.lease_owner)
+    except Exception as e:
+        st.warning(f"No se pudo reservar la fila; se usará la próxima libre al guardar. ({e})")
+        return None
+    if fila >= registro_snic.FILA_LIMITE:
+        # Las filas que quedaban están reservadas por otros: se pasa al volumen siguiente.
+        _liberar_reserva_fila()
+        return None
+    st.session_state.reserva_fila = (excel_path, fila, time.time())
+    return fila
+
+
+def _renovar_reserva_fila() -> None:
+    """
+    Mientras se completa el registro (pasos 3 a 6) renueva la reserva cuando
+    pasó la mitad de su vigencia, o la pasa al volumen nuevo si la planilla
+    se completó; en los demás reruns no toca el bucket.
+    """
+    reserva = st.session_state.get("reserva_fila")
+    if not reserva:
+        return
+    vigente = time.time() - reserva[2] < row_leases.LEASE_TTL_SECONDS / 2
+    if reserva[0] == st.session_state.excel_path and vigente:
+        return
+    fila = _reservar_fila(st.session_state.excel_path)
+    if fila is not None:
+        st.session_state.fila = fila
 
-def _invalidate_excel_caches():
-    _cached_excel_path.clear()
-    _prepare_excel_context.clear()
-    st.session_state["excel_refresh_token"] = st.session_state.get("excel_refresh_token", 0) + 1
 
 # ---------------------------
 # Estado de sesión
@@ -234,7 +368,6 @@ def _init_state():
     d.setdefault("fecha_hecho", None)
     d.setdefault("hora_hecho", None)
     d.setdefault("hora_fin", None)
-    d.setdefault("excel_refresh_token", 0)
     d.setdefault("preventivo", "")
     d.setdefault("denunciante", "")
     d.setdefault("motivo", "")
@@ -244,6 +377,9 @@ def _init_state():
     d.setdefault("others_done", False)
     d.setdefault("others_preview", None)   # resumen Otros (Lesiones/Desap)
     d.setdefault("direcciones_preview", None)  # resumen Direcciones
+    # Reserva de fila: dueño del lease de esta sesión y (planilla, fila) reservada
+    d.setdefault("lease_owner", uuid.uuid4().hex)
+    d.setdefault("reserva_fila", None)
 
 _init_state()
 
@@ -270,8 +406,17 @@ def _render_operativos_verano() -> None:
 
     from operativos_verano_app import run_operativos_verano_app
 
+    usuario_es_admin = agenda_delitos.es_admin(
+        st.session_state.username,
+        st.session_state.allowed_comisarias or [],
+    )
+
     render_user_header()
-    run_operativos_verano_app(allowed_units=allowed_units, configure_page=False)
+    run_operativos_verano_app(
+        allowed_units=allowed_units,
+        configure_page=False,
+        is_admin=usuario_es_admin,
+    )
 
 
 def _planillas_ley_2785_allowed_units() -> list[str]:
@@ -359,6 +504,7 @@ render_user_header()
 # ---------------------------
 
 if st.session_state.step == 1:
+    _liberar_reserva_fila()
     st.session_state.agenda_fecha = None
     st.session_state.delito_slot_id = None
 
@@ -377,6 +523,12 @@ if st.session_state.step == 1:
 # Panel de administración del almanaque (solo usuarios habilitados)
 agenda_delitos.render_admin_agenda(st.session_state.username, allowed_comisarias)
 
+if usuario_es_admin and _modo_guardado() == MODO_GUARDADO_DIFERIDO:
+    _render_panel_guardado_diferido()
+
+if usuario_es_admin:
+    storage_metrics.render_storage_panel()
+
 st.markdown(
     "<hr style='border: 4px solid #444; margin: 1.5rem 0 1rem;' />",
     unsafe_allow_html=True,
@@ -397,14 +549,17 @@ if usuario_es_admin and len(allowed_comisarias) > 1:
         st.rerun()
 
 comisaria_actual = st.session_state.comisaria
-excel_path_preview, fila_objetivo, planilla_llena, excel_bytes = _prepare_excel_context(
-    comisaria_actual,
-    st.session_state.excel_refresh_token,
-)
+excel_path_preview, fila_objetivo = _excel_de_trabajo(comisaria_actual)
 
 st.session_state.excel_path = excel_path_preview
 st.session_state.fila = fila_objetivo
-st.session_state.planilla_llena = planilla_llena
+# La fila se reserva recién al empezar una carga (Siguiente del paso 2) y
+# mientras dure se muestra la reservada.
+reserva_actual = st.session_state.get("reserva_fila")
+if reserva_actual and reserva_actual[0] == excel_path_preview:
+    st.session_state.fila = reserva_actual[1]
+if st.session_state.step in (3, 4, 5, 6):
+    _renovar_reserva_fila()
 
 # --- Botón Descargar Excel + Uploader con validación de nombre ---
 st.caption("Usted puede descargar las SNIC que va cargando.")
@@ -419,20 +574,55 @@ with col_dl:
     else:  # .xls u otro
         mime = "application/vnd.ms-excel"
 
-    if excel_bytes is None:
-        st.caption("⚠️ No se encontró el Excel en el bucket. Se creará automáticamente cuando continúe.")
+    volumenes_excel = volumenes.volumenes(excel_path_preview)
+    descarga = excel_path_preview
+    if len(volumenes_excel) > 1:
+        descarga = st.selectbox(
+            "Volumen a descargar",
+            volumenes_excel + [DESCARGA_COMBINADA],
+            index=len(volumenes_excel) - 1,
+            format_func=os.path.basename,
+            key="volumen_descarga",
+        )
+    combinado = descarga == DESCARGA_COMBINADA
+    if combinado:
+        nombre_base, _ = os.path.splitext(os.path.basename(volumenes.volumen_path(excel_path_preview, 1)))
+        nombre_descarga = f"{nombre_base} - completo{_ext}"
     else:
+        nombre_descarga = os.path.basename(descarga)
+
+    # La planilla se trae del bucket solo al pedirla, una vez: el contenido
+    # queda en la sesión junto a las generaciones de las que salió y los
+    # reruns lo reutilizan hasta que se descarga o cambia la planilla.
+    incluidos = volumenes_excel if combinado else [descarga]
+    clave_descarga = (descarga, _generaciones(incluidos))
+    preparada = st.session_state.get("descarga_excel_preparada")
+    if preparada is not None and preparada[0] != clave_descarga:
+        _descarga_entregada()
+        preparada = None
+
+    if preparada is None and st.button("📦 Preparar descarga", use_container_width=True):
         try:
-            st.download_button(
-                label="📥 Descargar Excel",
-                data=excel_bytes,
-                file_name=os.path.basename(excel_path_preview),
-                mime=mime,
-                use_container_width=True,
-            )
+            excel_bytes = _excel_para_descarga(excel_path_preview if combinado else descarga, combinado)
+            if excel_bytes is None:
+                st.caption("⚠️ No se encontró el Excel en el bucket. Se creará automáticamente cuando continúe.")
+            else:
+                # La materialización pudo generar una versión nueva: se toma la clave de después.
+                clave_descarga = (descarga, _generaciones(incluidos))
+                preparada = st.session_state["descarga_excel_preparada"] = (clave_descarga, excel_bytes)
         except Exception as e:
             st.caption(f"⚠️ No se pudo preparar la descarga: {e}")
 
+    if preparada is not None:
+        st.download_button(
+            label="📥 Descargar Excel",
+            data=preparada[1],
+            file_name=nombre_descarga,
+            mime=mime,
+            use_container_width=True,
+            on_click=_descarga_entregada,
+        )
+
 if usuario_es_admin:
     with col_upload:
         st.markdown("— o —")
@@ -452,15 +642,10 @@ if usuario_es_admin:
                         uploaded.getbuffer().tobytes(),
                     )
                     st.success(f"Se reemplazó el Excel de {comisaria_actual}: {expected_name}")
-                    _invalidate_excel_caches()
                 except Exception as e:
                     st.error(f"No se pudo guardar el archivo en el bucket: {e}")
 
 if st.session_state.step == 2:
-    if st.session_state.planilla_llena:
-        st.error("PLANILLA COMPLETA POR FAVOR RENUEVE.")
-        st.stop()
-
     st.subheader(f"Bienvenido(a) a la carga de {st.session_state.comisaria}")
     st.caption(f"Próximo registro: fila {fila_a_mostrar(st.session_state.fila)}")
     st.subheader("Seleccione el día y el delito asignado")
@@ -585,6 +770,10 @@ if st.session_state.step == 2:
             st.session_state.delito = delito_nombre
             st.session_state.preventivo = preventivo
             st.session_state.motivo = motivo_sel
+            # Empieza la carga: la fila queda reservada para esta sesión.
+            fila_reservada = _reservar_fila(st.session_state.excel_path)
+            if fila_reservada is not None:
+                st.session_state.fila = fila_reservada
             st.session_state.step = 3
             st.rerun()
 
@@ -884,219 +1073,108 @@ elif st.session_state.step == 6:
 
     with col2:
         if st.button("Finalizar y guardar ✅"):
-            fila = obtener_siguiente_fila_por_fecha(st.session_state.excel_path, col_fecha="C")
-
             fecha_den_txt = fecha_a_texto_curvo(st.session_state.fecha_denuncia) if st.session_state.fecha_denuncia else None
             fecha_hecho_txt = fecha_a_texto_curvo(st.session_state.fecha_hecho) if st.session_state.fecha_hecho else None
             hora_hecho_txt = st.session_state.hora_hecho or "INDETERMINADO"
             hora_fin_txt   = st.session_state.hora_fin or "INDETERMINADO"
 
-            # === Guardado diferido de Direcciones (si hay preview) ===
-            dprev = st.session_state.get("direcciones_preview")
-            if dprev:
-                try:
-                    wb_dir = cargar_libro(st.session_state.excel_path)
-                    ws_dir = wb_dir.active
-                    C = lambda col: f"{col}{fila}"
-
-                    # I{fila}: ciudad/código según comisaría
-                    cc = dprev.get("ciudad_cod")
-                    if cc not in (None, ""):
-                        ws_dir[C("I")].value = unwrap_quotes(str(cc))
-
-                    # J{fila}: barrio (si 'OTRO', además guarda el texto en K{fila})
-                    b = dprev.get("barrio")
-                    if b not in (None, ""):
-                        ws_dir[C("J")].value = unwrap_quotes(str(b))
-                    ob = dprev.get("otro_barrio") or ""
-                    if (b == "OTRO") and ob.strip():
-                        ws_dir[C("K")].value = unwrap_quotes(ob.strip())
-
-                    # L{fila}: dirección ; M{fila}: altura
-                    dir_txt = dprev.get("direccion")
-                    if dir_txt not in (None, ""):
-                        ws_dir[C("L")].value = unwrap_quotes(str(dir_txt))
-                    alt_txt = dprev.get("altura")
-                    if alt_txt not in (None, ""):
-                        ws_dir[C("M")].value = unwrap_quotes(str(alt_txt))
-
-                    # N{fila}: link de Google Maps (obligatorio)
-                    link = (dprev.get("link_maps") or "").strip()
-                    if link:
-                        ws_dir[C("N")].value = unwrap_quotes(link)
-
-                    save_workbook_to_gcs(wb_dir, st.session_state.excel_path)
+            rh_preview = st.session_state.get("rh_preview")
+            if not ((st.session_state.delito or "").strip() in delitos_rh_norm):
+                rh_preview = None
+            oprev = st.session_state.get("others_preview")
+            if not ((st.session_state.delito or "").strip() in delitos_otros_norm):
+                oprev = None
 
-                except PermissionError:
-                    st.error("⚠️ No se pudo guardar Direcciones: el archivo está abierto en Excel.")
-                    st.stop()
-                except Exception as e:
-                    st.error(f"⚠️ Error al guardar Direcciones: {e}")
-                    st.stop()
+            # Una reserva de otro volumen (la planilla se completó en el medio) no sirve.
+            reserva = st.session_state.get("reserva_fila")
+            fila_reservada = reserva[1] if reserva and reserva[0] == st.session_state.excel_path else None
+            registro = registro_snic.armar_registro(
+                st.session_state.excel_path,
+                comisaria=st.session_state.comisaria,
+                hecho=st.session_state.hecho,
+                delito=st.session_state.delito,
+                actuacion=st.session_state.actuacion,
+                fecha_denuncia_txt=fecha_den_txt,
+                fecha_hecho_txt=fecha_hecho_txt,
+                hora_hecho_txt=hora_hecho_txt,
+                hora_fin_txt=hora_fin_txt,
+                preventivo=st.session_state.preventivo,    # H
+                denunciante=st.session_state.denunciante,  # Q
+                motivo=st.session_state.motivo,            # AF
+                direcciones=st.session_state.get("direcciones_preview"),
+                robos_hurtos=rh_preview,
+                otros=oprev,
+                fila_reservada=fila_reservada,
+                reserva_owner=st.session_state.lease_owner,
+            )
 
-            # === Guardado diferido de Robos/Hurtos (si hay preview y aplica) ===
-            rh_preview = st.session_state.get("rh_preview")
-            if rh_preview and ((st.session_state.delito or "").strip() in delitos_rh_norm):
+            if _modo_guardado() == MODO_GUARDADO_REGISTRO:
                 try:
-                    wb_rh = cargar_libro(st.session_state.excel_path)
-                    ws_rh = wb_rh.active
-                    C = lambda col: f"{col}{fila}"
-
-                    # -------- Víctimas (AO total) + por sexo (AG/AH/AI)
-                    total_m = total_f = total_nc = 0
-                    for r in (rh_preview.get("vict_rows") or []):
-                        sexo = (r.get("sexo") or "").strip()
-                        try:
-                            c = int(str(r.get("cant") or "0").strip())
-                        except Exception:
-                            c = 0
-                        if sexo == "MASCULINO": total_m += c
-                        elif sexo == "FEMENINO": total_f += c
-                        elif sexo == "NO CONSTA": total_nc += c
-                    ao_total = total_m + total_f + total_nc
-                    ws_rh[C("AO")].value = ao_total if ao_total else None
-                    if total_m: ws_rh[C("AG")].value = total_m
-                    if total_f: ws_rh[C("AH")].value = total_f
-                    if total_nc: ws_rh[C("AI")].value = total_nc
-
-                    # -------- Vulnerabilidad (AP) y Tipo de arma (AR)
-                    v = rh_preview.get("vulnerab")
-                    if v not in (None, ""): ws_rh[C("AP")].value = unwrap_quotes(str(v).strip())
-                    ta = rh_preview.get("tipo_arma")
-                    if ta not in (None, ""): ws_rh[C("AR")].value = unwrap_quotes(str(ta).strip())
-
-                    # -------- Inculpados: SI/NO (AS) + rango (AW/AX/AY/AZ) + sexo (AT/AU/AV)
-                    inc_sn = (rh_preview.get("inc_sn") or "").strip()
-                    if inc_sn: ws_rh[C("AS")].value = unwrap_quotes(inc_sn)
-                    if inc_sn == "SI":
-                        rango = rh_preview.get("rango_etario")
-                        cant_rango = rh_preview.get("cant_rango")
-                        if rango and str(cant_rango).strip() != "":
-                            try:
-                                cant_num = int(str(cant_rango).strip())
-                            except Exception:
-                                cant_num = 0
-                            if   rango == "Hasta 15 año":     ws_rh[C("AW")].value = cant_num
-                            elif rango == "15 a 17 años":     ws_rh[C("AX")].value = cant_num
-                            elif rango == "mayor de 18 años": ws_rh[C("AY")].value = cant_num
-                            elif rango == "Sin Determinar":   ws_rh[C("AZ")].value = cant_num
-                        # Distribución por sexo de inculpados
-                        t_m = t_f = t_nc = 0
-                        for r in (rh_preview.get("sex_rows") or []):
-                            sx = (r.get("sexo") or "").strip()
-                            try:
-                                c = int(str(r.get("cant") or "0").strip())
-                            except Exception:
-                                c = 0
-                            if sx == "MASCULINO": t_m += c
-                            elif sx == "FEMENINO": t_f += c
-                            elif sx == "NO CONSTA": t_nc += c
-                        if t_m: ws_rh[C("AT")].value = t_m
-                        if t_f: ws_rh[C("AU")].value = t_f
-                        if t_nc: ws_rh[C("AV")].value = t_nc
-
-                    # -------- Tipo de lugar (AD) + Detalle establecimiento (AE)
-                    tl = rh_preview.get("tipo_lugar")
-                    if tl not in (None, ""): ws_rh[C("AD")].value = unwrap_quotes(str(tl).strip())
-                    de = rh_preview.get("detalle_est")
-                    if de not in (None, ""): ws_rh[C("AE")].value = unwrap_quotes(str(de).strip())
-
-                    # -------- Elementos (BB) + Subcat (BC) + Denom (BD) + Año (BE) + Modelo (BF)
-                    el = rh_preview.get("elem")
-                    if el not in (None, ""): ws_rh[C("BB")].value = unwrap_quotes(str(el).strip())
-                    sc = rh_preview.get("subcat")
-                    if sc not in (None, ""): ws_rh[C("BC")].value = unwrap_quotes(str(sc).strip())
-                    dn = rh_preview.get("denom")
-                    if dn not in (None, ""): ws_rh[C("BD")].value = unwrap_quotes(str(dn).strip())
-                    if el in ("AUTOMOTOR", "MOTOCICLETA"):
-                        an = rh_preview.get("anio")
-                        md = rh_preview.get("modelo")
-                        if an not in (None, ""): ws_rh[C("BE")].value = unwrap_quotes(str(an).strip())
-                        if md not in (None, ""): ws_rh[C("BF")].value = unwrap_quotes(str(md).strip())
-
-                    # -------- Modus (BJ) + Especialidad (BK)
-                    mo = rh_preview.get("modus")
-                    if mo not in (None, ""): ws_rh[C("BJ")].value = unwrap_quotes(str(mo).strip())
-                    es = rh_preview.get("especialidad")
-                    if es not in (None, ""): ws_rh[C("BK")].value = unwrap_quotes(str(es).strip())
-
-                    save_workbook_to_gcs(wb_rh, st.session_state.excel_path)
-
-                except PermissionError:
-                    st.error("⚠️ No se pudo guardar Robos/Hurtos: el archivo está abierto en Excel.")
-                    st.stop()
+                    registro_log.agregar_registro(registro)
+                    _get_materializador().programar(st.session_state.excel_path)
+                    ok = True
+                    # La reserva la libera la materialización del registro.
+                    st.session_state.reserva_fila = None
+                    st.session_state.lease_owner = uuid.uuid4().hex
+                    mensaje_ok = (
+                        f"Registro de {st.session_state.comisaria} guardado ✅ "
+                        "La planilla Excel se actualiza en segundo plano."
+                    )
                 except Exception as e:
-                    st.error(f"⚠️ Error al guardar datos de Robos/Hurtos: {e}")
-                    st.stop()
-
-            # === Guardado diferido de Otros (si hay preview y aplica) ===
-            oprev = st.session_state.get("others_preview")
-            if oprev and ((st.session_state.delito or "").strip() in delitos_otros_norm):
+                    st.error(f"⚠️ No se pudo guardar el registro de {st.session_state.comisaria}: {e}")
+                    ok = False
+            elif _modo_guardado() == MODO_GUARDADO_DIFERIDO:
                 try:
-                    wb_o = cargar_libro(st.session_state.excel_path)
-                    ws_o = wb_o.active
-                    C = lambda col: f"{col}{fila}"
-
-                    # Limpiar AO/AG/AH/AI por seguridad (si reescriben tras editar)
-                    ws_o[C("AO")].value = None
-                    ws_o[C("AG")].value = None
-                    ws_o[C("AH")].value = None
-                    ws_o[C("AI")].value = None
-
-                    # Acumular por sexo (AG/AH/AI) y total (AO)
-                    total_m = total_f = total_nc = 0
-                    for r in (oprev.get("vict_rows") or []):
-                        sexo = (r.get("sexo") or "").strip()
-                        try:
-                            c = int(str(r.get("cant") or "0").strip())
-                        except Exception:
-                            c = 0
-                        if sexo == "MASCULINO": total_m += c
-                        elif sexo == "FEMENINO": total_f += c
-                        elif sexo == "NO CONSTA": total_nc += c
-                    ao_total = total_m + total_f + total_nc
-                    ws_o[C("AO")].value = ao_total if ao_total else None
-                    if total_m: ws_o[C("AG")].value = total_m
-                    if total_f: ws_o[C("AH")].value = total_f
-                    if total_nc: ws_o[C("AI")].value = total_nc
-
-                    # AP Vulnerabilidad
-                    vul = oprev.get("vulnerabilidad")
-                    if vul not in (None, ""):
-                        ws_o[C("AP")].value = unwrap_quotes(str(vul).strip())
-
-                    # BA ¿Apareció? solo si corresponde (Desaparición)
-                    if oprev.get("aparecio") is not None:
-                        ws_o[C("BA")].value = unwrap_quotes(str(oprev.get("aparecio")).strip())
-
-                    save_workbook_to_gcs(wb_o, st.session_state.excel_path)
-
+                    registro_id = uuid.uuid4().hex
+                    tarea = {**registro, "id": registro_id}
+                    agenda_fecha = st.session_state.get("agenda_fecha")
+                    delito_slot = st.session_state.get("delito_slot_id")
+                    if isinstance(agenda_fecha, datetime.date) and delito_slot:
+                        tarea["agenda"] = {
+                            "comisaria": st.session_state.comisaria,
+                            "fecha": agenda_fecha.isoformat(),
+                            "slot": delito_slot,
+                        }
+                    _get_write_behind().enqueue(st.session_state.excel_path, tarea, entry_id=registro_id)
+                    ok = True
+                    # La reserva pasa al registro encolado (la libera el guardado en
+                    # segundo plano); la sesión sigue con un dueño nuevo.
+                    st.session_state.reserva_fila = None
+                    st.session_state.lease_owner = uuid.uuid4().hex
+                    mensaje_ok = (
+                        f"Registro de {st.session_state.comisaria} recibido ✅ "
+                        "Se guardará en la planilla en segundo plano y entonces se marcará en el almanaque."
+                    )
+                except Exception as e:
+                    st.error(f"⚠️ No se pudo registrar el guardado diferido: {e}")
+                    ok = False
+            else:
+                # Un solo commit con todas las columnas (C..BL): si falla cualquier
+                # bloque no se sube nada, y ante un guardado concurrente la fila
+                # se recalcula sobre la versión nueva.
+                try:
+                    volumen, fila = volumenes.guardar_registro(registro)
+                    ok = True
+                    st.session_state.reserva_fila = None  # la liberó el guardado
+                    mensaje_ok = f"Datos guardados en {st.session_state.comisaria} (fila {fila_a_mostrar(fila)}) ✅"
+                    if volumen != st.session_state.excel_path:
+                        mensaje_ok += f" La planilla anterior se completó: se usó {os.path.basename(volumen)}."
                 except PermissionError:
-                    st.error("⚠️ No se pudo guardar Otros: el archivo está abierto en Excel.")
-                    st.stop()
+                    st.error("⚠️ No se pudo guardar porque el archivo está abierto en Excel con bloqueo de escritura. Cerrá el archivo y probá de nuevo.")
+                    ok = False
+                except registro_snic.PlanillaCompletaError:
+                    st.error("PLANILLA COMPLETA POR FAVOR RENUEVE.")
+                    ok = False
                 except Exception as e:
-                    st.error(f"⚠️ Error al guardar Otros: {e}")
-                    st.stop()
-
-            ok = escribir_registro(
-                st.session_state.excel_path,
-                fila,
-                st.session_state.hecho,
-                st.session_state.delito,
-                st.session_state.actuacion,
-                fecha_den_txt,
-                fecha_hecho_txt,
-                hora_hecho_txt,
-                hora_fin_txt,
-                st.session_state.preventivo,   # H
-                st.session_state.denunciante,  # Q
-                st.session_state.motivo        # AF
-            )
+                    st.error(f"⚠️ No se pudo escribir en {st.session_state.excel_path}: {e}")
+                    ok = False
 
             if ok:
                 agenda_fecha = st.session_state.get("agenda_fecha")
                 delito_slot = st.session_state.get("delito_slot_id")
-                if isinstance(agenda_fecha, datetime.date) and delito_slot:
+                # En el modo diferido lo marca el guardado en segundo plano al terminar.
+                diferido = _modo_guardado() == MODO_GUARDADO_DIFERIDO
+                if isinstance(agenda_fecha, datetime.date) and delito_slot and not diferido:
                     registrado, msg_agenda, restantes = agenda_delitos.registrar_carga_delito(
                         st.session_state.comisaria,
                         agenda_fecha,
@@ -1107,8 +1185,7 @@ elif st.session_state.step == 6:
                     elif restantes == 0:
                         st.caption("✔️ Se completó la carga planificada para este delito en el día seleccionado.")
 
-                st.success(f"Datos guardados en {st.session_state.comisaria} (fila {fila_a_mostrar(fila)}) ✅")
-                _invalidate_excel_caches()
+                st.success(mensaje_ok)
                 # Reset total
                 st.session_state.step = 1
                 st.session_state.hecho = None
@@ -0,0 +1,107 @@
+"""Compara el formato anterior de la agenda con el compacto.
+
+- Anterior: un dict por slot con id uuid, ``"plan": 1`` y el nombre
+  completo repetido, guardado con ``indent=2``.
+- Compacto (``agenda_delitos.AGENDA_FORMATO``): nombres una vez por día,
+  ids cortos, bits de cargados y JSON sin espacios.
+
+Uso:
+    python benchmark_agenda.py                      # mes sintético: 30 días, 20 delitos por día
+    python benchmark_agenda.py --dias 31 --delitos 60
+    python benchmark_agenda.py --archivo "agenda_delitos/comisaria 14/2026-01.json"
+
+Se informa el tamaño de un mes en cada formato y la mediana del tiempo de
+lectura (parsear el JSON y, en el compacto, pasarlo al formato de la API),
+y se verifica que ambos lleven a los mismos delitos.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import time
+import uuid
+from typing import Any, Callable
+
+import agenda_delitos
+
+
+def _mes_sintetico(dias: int, delitos: int) -> dict[str, Any]:
+    rnd = random.Random(0)
+    mes: dict[str, Any] = {}
+    for dia in range(1, dias + 1):
+        slots = {}
+        for _ in range(delitos):
+            slot_id = uuid.uuid4().hex
+            slots[slot_id] = {
+                "id": slot_id,
+                "nombre": rnd.choice(agenda_delitos.DELITOS_DISPONIBLES),
+                "plan": 1,
+                "cargados": rnd.randint(0, 1),
+            }
+            if rnd.random() < 0.2:
+                slots[slot_id]["preventivo"] = f"{rnd.randint(1, 999)}/26"
+        mes[f"2026-01-{dia:02d}"] = {"delitos": slots}
+    return mes
+
+
+def _leer_anterior(data: bytes) -> dict[str, Any]:
+    return json.loads(data.decode("utf-8"))
+
+
+def _leer_compacto(data: bytes) -> dict[str, Any]:
+    return agenda_delitos._decodificar_mes(json.loads(data.decode("utf-8")))
+
+
+def _medir(nombre: str, leer: Callable[[bytes], dict], data: bytes, repeticiones: int) -> dict[str, Any]:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = leer(data)
+        tiempos.append(time.perf_counter() - inicio)
+    print(f"{nombre:<10} {len(data) / 1024:>10.1f} KiB {statistics.median(tiempos) * 1000:>10.2f} ms")
+    return resultado
+
+
+def _delitos(dias: dict[str, Any]) -> dict[str, list]:
+    """Los delitos de cada día sin los ids (que cambian al pasar al formato compacto)."""
+    return {
+        key: [
+            (info["nombre"], int(info.get("cargados", 0)), info.get("preventivo"))
+            for info in entry.get("delitos", {}).values()
+        ]
+        for key, entry in dias.items()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dias", type=int, default=30, help="días del mes sintético")
+    parser.add_argument("--delitos", type=int, default=20, help="delitos asignados por día")
+    parser.add_argument("--archivo", help="mes real (en cualquiera de los dos formatos) en lugar del sintético")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.archivo:
+        with open(args.archivo, "rb") as fh:
+            mes = agenda_delitos._decodificar_mes(json.load(fh))
+    else:
+        mes = _mes_sintetico(args.dias, args.delitos)
+
+    anterior = json.dumps(mes, ensure_ascii=False, indent=2).encode("utf-8")
+    compacto = json.dumps(
+        agenda_delitos._codificar_mes(mes), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+    print(f"{len(mes)} días, {args.repeticiones} repeticiones")
+    print(f"\n{'formato':<10} {'tamaño':>14} {'lectura':>13}")
+    con_anterior = _medir("anterior", _leer_anterior, anterior, args.repeticiones)
+    con_compacto = _medir("compacto", _leer_compacto, compacto, args.repeticiones)
+    print(f"El compacto ocupa el {len(compacto) / len(anterior):.0%} del anterior")
+    iguales = _delitos(con_anterior) == _delitos(con_compacto)
+    print("Mismos delitos en ambos formatos:", "sí" if iguales else "NO")
+
+
+if __name__ == "__main__":
+    main()
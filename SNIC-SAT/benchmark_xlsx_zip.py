@@ -0,0 +1,152 @@
+"""Compara openpyxl con los caminos a nivel zip al guardar y al buscar fila.
+
+- Guardado de un registro: openpyxl contra ``xlsx_zip``.
+- Búsqueda de la próxima fila libre: cargar el libro con openpyxl contra
+  recorrer la columna de fecha con ``xlsx_stream``.
+
+Uso:
+    python benchmark_xlsx_zip.py                     # planilla sintética de 100 filas
+    python benchmark_xlsx_zip.py --filas 5000
+    python benchmark_xlsx_zip.py --archivo "comisaria 14.xlsm"
+
+Cada repetición de guardado parte del mismo archivo, escribe un registro
+SNIC-SAT completo en la próxima fila libre y serializa el resultado en
+memoria. Se informa la mediana de tiempo y el pico de memoria
+(tracemalloc), y se verifica que ambos caminos den el mismo resultado.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import statistics
+import time
+import tracemalloc
+from typing import Callable
+
+from openpyxl import Workbook, load_workbook
+
+import registro_snic
+import xlsx_stream
+from xlsx_zip import ZipWorkbook
+
+COLUMNAS = 64
+
+
+def _planilla_sintetica(filas: int) -> bytes:
+    wb = Workbook()
+    ws = wb.active
+    ws["C1"] = "Planilla SNIC-SAT (sintética)"
+    # La fila FILA_LIMITE - 1 queda libre para que siempre haya dónde escribir.
+    libre = registro_snic.FILA_LIMITE - 1
+    for fila in range(registro_snic.FILA_INICIAL, registro_snic.FILA_INICIAL + filas):
+        for columna in range(1 if fila != libre else 4, COLUMNAS + 1):
+            ws.cell(row=fila, column=columna).value = f"dato {fila}-{columna}" if columna % 3 else fila
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def _registro() -> dict:
+    return registro_snic.armar_registro(
+        "benchmark.xlsm",
+        comisaria="comisaria 14",
+        hecho="Hecho de prueba",
+        delito="ROBO",
+        actuacion="DE OFICIO",
+        fecha_denuncia_txt="01/01/2026",
+        fecha_hecho_txt="01/01/2026",
+        hora_hecho_txt="10:00",
+        hora_fin_txt="10:30",
+        preventivo="123/26",
+        denunciante="Denunciante",
+        motivo="Motivo",
+        direcciones={"barrio": "CENTRO", "direccion": "San Martín", "altura": "100", "link_maps": "https://maps"},
+        robos_hurtos={"vict_rows": [{"sexo": "MASCULINO", "cant": "1"}], "inc_sn": "NO", "elem": "CELULAR"},
+    )
+
+
+def _con_openpyxl(data: bytes, keep_vba: bool) -> bytes:
+    wb = load_workbook(io.BytesIO(data), keep_vba=keep_vba)
+    registro_snic.aplicar_registro(wb, _registro())
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def _con_zip(data: bytes, keep_vba: bool) -> bytes:
+    with ZipWorkbook(io.BytesIO(data)) as wb:
+        registro_snic.aplicar_registro(wb, _registro())
+        out = io.BytesIO()
+        wb.save(out)
+    return out.getvalue()
+
+
+def _buscar_con_openpyxl(data: bytes, keep_vba: bool) -> tuple[int, list[int]]:
+    ws = load_workbook(io.BytesIO(data), keep_vba=keep_vba).active
+    proxima = registro_snic.primera_fila_libre(ws)
+    return proxima, registro_snic.filas_ocupadas_desde(ws, proxima)
+
+
+def _buscar_en_streaming(data: bytes, keep_vba: bool) -> tuple[int, list[int]]:
+    llenas = xlsx_stream.filled_rows(io.BytesIO(data), registro_snic.COLUMNA_FECHA, min_row=registro_snic.FILA_INICIAL)
+    ocupadas = set(llenas)
+    proxima = registro_snic.FILA_INICIAL
+    while proxima in ocupadas:
+        proxima += 1
+    return proxima, [fila for fila in llenas if fila > proxima]
+
+
+def _medir(nombre: str, guardar: Callable[[bytes, bool], bytes], data: bytes, keep_vba: bool, repeticiones: int):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = guardar(data, keep_vba)
+        tiempos.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    guardar(data, keep_vba)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{nombre:<10} {statistics.median(tiempos) * 1000:>10.1f} ms {pico / 1024 / 1024:>10.1f} MiB")
+    return resultado
+
+
+def _celdas(data: bytes) -> dict:
+    ws = load_workbook(io.BytesIO(data), read_only=True).active
+    return {
+        (fila, columna): valor
+        for fila, valores in enumerate(ws.iter_rows(values_only=True), start=1)
+        for columna, valor in enumerate(valores, start=1)
+        if valor is not None
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=100, help="filas con datos de la planilla sintética")
+    parser.add_argument("--archivo", help="planilla real (.xlsx/.xlsm) en lugar de la sintética")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.archivo:
+        with open(args.archivo, "rb") as fh:
+            data = fh.read()
+        keep_vba = args.archivo.lower().endswith(".xlsm")
+    else:
+        data = _planilla_sintetica(args.filas)
+        keep_vba = False
+
+    print(f"Planilla de {len(data) / 1024:.0f} KiB, {args.repeticiones} repeticiones")
+    print(f"\nGuardado de un registro\n{'motor':<10} {'mediana':>13} {'pico mem.':>14}")
+    con_openpyxl = _medir("openpyxl", _con_openpyxl, data, keep_vba, args.repeticiones)
+    con_zip = _medir("zip", _con_zip, data, keep_vba, args.repeticiones)
+    iguales = _celdas(con_openpyxl) == _celdas(con_zip)
+    print("Mismas celdas en ambos caminos:", "sí" if iguales else "NO")
+
+    print(f"\nBúsqueda de la próxima fila\n{'motor':<10} {'mediana':>13} {'pico mem.':>14}")
+    con_openpyxl = _medir("openpyxl", _buscar_con_openpyxl, data, keep_vba, args.repeticiones)
+    en_streaming = _medir("streaming", _buscar_en_streaming, data, keep_vba, args.repeticiones)
+    print("Misma fila y ocupadas en ambos caminos:", "sí" if con_openpyxl == en_streaming else "NO")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,46 @@
 import io
 import json
 import mimetypes
-from typing import Any, Optional
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, BinaryIO, Optional
 
 import streamlit as st
 from google.cloud import storage
-from google.api_core.exceptions import NotFound
 from openpyxl import Workbook, load_workbook
 
+from storage_backends import (
+    BlobInfo,
+    BlobNotFound,
+    BlobNotModified,
+    GenerationMismatch,
+    IntegrityError,
+    StorageBackend,
+    TransientStorageError,
+    crc32c_of_bytes,
+    crc32c_of_file,
+    create_backend,
+)
+import storage_metrics
+
 BUCKET_NAME = "operaciones-storage"
 
+# Presupuesto de memoria de la cache de contenidos (compartida por todas las sesiones).
+BYTE_CACHE_MAX_BYTES = int(os.environ.get("GCS_BYTE_CACHE_MB", "64")) * 1024 * 1024
+
+# Hasta este tamaño los libros se serializan y descargan en memoria; por encima,
+# en un archivo temporal en disco (y no entran en la cache de contenidos).
+SPOOL_MAX_MEMORY_BYTES = int(os.environ.get("GCS_SPOOL_MB", "8")) * 1024 * 1024
+
+# Intentos de una transferencia ante fallas momentáneas o checksum distinto.
+TRANSFER_ATTEMPTS = int(os.environ.get("GCS_TRANSFER_ATTEMPTS", "3"))
+
+# Segundos durante los que se confía en el listado de un prefijo sin volver a pedirlo.
+MANIFEST_TTL_SECONDS = float(os.environ.get("GCS_MANIFEST_TTL", "30"))
+
 
 @st.cache_resource(show_spinner=False)
 def _get_storage_client() -> storage.Client:
@@ -23,9 +54,35 @@ def _get_storage_client() -> storage.Client:
     return storage.Client.from_service_account_info(info)
 
 
-def _get_bucket() -> storage.Bucket:
-    client = _get_storage_client()
-    return client.bucket(BUCKET_NAME)
+def _storage_setting(key: str, default: str) -> str:
+    """
+    Configuración del backend: variable de entorno ``STORAGE_<KEY>`` o, si no
+    está, la sección ``[storage]`` de los secrets de Streamlit.
+    """
+    env_value = os.environ.get(f"STORAGE_{key.upper()}")
+    if env_value:
+        return env_value
+    try:
+        value = st.secrets.get("storage", {}).get(key)
+    except Exception:
+        value = None
+    return str(value) if value not in (None, "") else default
+
+
+@st.cache_resource(show_spinner=False)
+def _get_backend() -> StorageBackend:
+    """
+    Backend activo: ``gcs`` (por defecto), ``local`` (directorio
+    ``STORAGE_LOCAL_DIR``) o ``memory``. ``STORAGE_LATENCY_MS`` agrega una
+    demora fija por operación para perfilar sin red.
+    """
+    return create_backend(
+        _storage_setting("backend", "gcs"),
+        gcs_client_factory=_get_storage_client,
+        bucket_name=BUCKET_NAME,
+        local_dir=_storage_setting("local_dir", ".storage-local"),
+        latency_ms=float(_storage_setting("latency_ms", "0")),
+    )
 
 
 def _content_type_from_name(name: str) -> Optional[str]:
@@ -33,26 +90,434 @@ def _content_type_from_name(name: str) -> Optional[str]:
     return guessed
 
 
+# =========================
+# Manifiesto del bucket
+# =========================
+
+def _prefix_of(blob_name: str) -> str:
+    head, sep, _ = blob_name.rpartition("/")
+    return f"{head}/" if sep else ""
+
+
+class _BucketManifest:
+    """
+    Listado en memoria de los blobs de cada prefijo ("carpeta") del bucket.
+
+    Cada prefijo se lista una sola vez y se vuelve a listar cuando vence el
+    TTL; las escrituras y lecturas propias actualizan la entrada puntual sin
+    volver a listar. Así las consultas de existencia y de extensión se
+    responden localmente.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._prefixes: dict[str, tuple[float, dict[str, BlobInfo]]] = {}
+        self._lock = threading.Lock()
+
+    def _list_prefix(self, prefix: str) -> dict[str, BlobInfo]:
+        return {info.name: info for info in _get_backend().list_prefix(prefix)}
+
+    def _listing(self, prefix: str) -> dict[str, BlobInfo]:
+        with self._lock:
+            cached = self._prefixes.get(prefix)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl_seconds:
+            return cached[1]
+        with storage_metrics.operation("list", prefix) as metric:
+            metric["cache"] = "miss"
+            listing = self._list_prefix(prefix)
+        with self._lock:
+            self._prefixes[prefix] = (time.monotonic(), listing)
+        return listing
+
+    def stat(self, blob_name: str) -> Optional[BlobInfo]:
+        return self._listing(_prefix_of(blob_name)).get(blob_name)
+
+    def note_blob(self, info: BlobInfo) -> None:
+        prefix = _prefix_of(info.name)
+        with self._lock:
+            cached = self._prefixes.get(prefix)
+            if cached is None:
+                return
+            listing = dict(cached[1])
+            listing[info.name] = info
+            self._prefixes[prefix] = (cached[0], listing)
+
+    def note_missing(self, blob_name: str) -> None:
+        prefix = _prefix_of(blob_name)
+        with self._lock:
+            cached = self._prefixes.get(prefix)
+            if cached is None or blob_name not in cached[1]:
+                return
+            listing = dict(cached[1])
+            listing.pop(blob_name, None)
+            self._prefixes[prefix] = (cached[0], listing)
+
+    def invalidate(self, blob_name: Optional[str] = None) -> None:
+        with self._lock:
+            if blob_name is None:
+                self._prefixes.clear()
+            else:
+                self._prefixes.pop(_prefix_of(blob_name), None)
+
+
+_MANIFEST = _BucketManifest(MANIFEST_TTL_SECONDS)
+
+
+def stat_blob(blob_name: str) -> Optional[BlobInfo]:
+    """Tamaño, generación y fecha de actualización del blob según el manifiesto."""
+    with storage_metrics.operation("exists", blob_name) as metric:
+        info = _MANIFEST.stat(blob_name)
+        metric["cache"] = metric["cache"] or "hit"
+    return info
+
+
 def blob_exists(blob_name: str) -> bool:
-    client = _get_storage_client()
-    bucket = _get_bucket()
-    blob = bucket.blob(blob_name)
-    return blob.exists(client=client)
+    return stat_blob(blob_name) is not None
+
+
+def refresh_manifest(blob_name: Optional[str] = None) -> None:
+    """Descarta el listado del prefijo del blob (o de todo el bucket)."""
+    _MANIFEST.invalidate(blob_name)
+
+
+# =========================
+# Cache de contenidos
+# =========================
+
+class _BlobByteCache:
+    """
+    Cache LRU de contenidos indexada por (nombre de blob, generación).
+
+    Se guarda solo la última generación conocida de cada blob; al leer se
+    revalida con un GET condicional y, si no cambió, se reutilizan los bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple[int, bytes]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, blob_name: str) -> Optional[tuple[int, bytes]]:
+        with self._lock:
+            entry = self._entries.get(blob_name)
+            if entry is not None:
+                self._entries.move_to_end(blob_name)
+            return entry
+
+    def put(self, blob_name: str, generation: Optional[int], data: bytes) -> None:
+        if generation is None or len(data) > self.max_bytes:
+            self.discard(blob_name)
+            return
+        with self._lock:
+            previous = self._entries.pop(blob_name, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            self._entries[blob_name] = (int(generation), data)
+            self._size += len(data)
+            while self._size > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def discard(self, blob_name: str) -> None:
+        with self._lock:
+            previous = self._entries.pop(blob_name, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+
+    def usage(self) -> dict[str, int]:
+        with self._lock:
+            return {"entradas": len(self._entries), "bytes": self._size, "máximo": self.max_bytes}
+
+
+_BYTE_CACHE = _BlobByteCache(BYTE_CACHE_MAX_BYTES)
+storage_metrics.register_cache("contenidos de blobs", _BYTE_CACHE.usage)
+
+
+# =========================
+# Transferencias verificadas
+# =========================
+
+def _with_retries(transfer):
+    for attempt in range(1, TRANSFER_ATTEMPTS + 1):
+        try:
+            return transfer()
+        except (TransientStorageError, IntegrityError):
+            if attempt == TRANSFER_ATTEMPTS:
+                raise
+
+
+def _verify_checksum(info: BlobInfo, actual_crc32c: str) -> None:
+    if info.crc32c and info.crc32c != actual_crc32c:
+        raise IntegrityError(f"{info.name}: CRC32C {actual_crc32c} no coincide con {info.crc32c}.")
+
+
+def _write_verified(blob_name: str, write, expected_crc32c: str, if_generation_match: Optional[int]) -> BlobInfo:
+    """
+    Ejecuta ``write(if_generation_match)`` y verifica el CRC32C que informa el
+    servidor. Ante una falla momentánea o un checksum distinto reintenta con
+    el mismo contenido (sin volver a serializarlo).
+    """
+    precondition = if_generation_match
+    retried = False
+    for attempt in range(1, TRANSFER_ATTEMPTS + 1):
+        try:
+            info = write(precondition)
+        except GenerationMismatch:
+            if retried:
+                # El intento anterior pudo haber llegado al bucket sin que llegara la respuesta.
+                current = _get_backend().stat(blob_name)
+                if current is not None and current.crc32c == expected_crc32c:
+                    return current
+            raise
+        except (TransientStorageError, IntegrityError):
+            if attempt == TRANSFER_ATTEMPTS:
+                raise
+            # No se sabe qué generación dejó este intento, si dejó alguna: se
+            # reintenta con la misma condición. Si otra versión quedó en el
+            # medio (aunque fuera la nuestra dañada) sale GenerationMismatch y
+            # el llamador vuelve a leer, en lugar de pisar a otro escritor.
+            retried = True
+            continue
+        if info.crc32c and info.crc32c != expected_crc32c:
+            if attempt == TRANSFER_ATTEMPTS:
+                _verify_checksum(info, expected_crc32c)
+            if precondition is not None:
+                # La versión dañada es la que acaba de subir este intento: se reemplaza esa.
+                precondition = info.generation
+            retried = True
+            continue
+        return info
+    raise AssertionError("unreachable")
+
+
+def download_blob_with_generation(blob_name: str) -> tuple[Optional[bytes], Optional[int]]:
+    """
+    Descarga el blob en un solo GET (condicional si ya está en cache) y
+    devuelve ``(contenido, generación)``, o ``(None, None)`` si no existe.
+    """
+    with storage_metrics.operation("download", blob_name) as metric:
+        cached = _BYTE_CACHE.get(blob_name)
+
+        def read():
+            data, info = _get_backend().read(
+                blob_name,
+                if_generation_not_match=cached[0] if cached is not None else None,
+            )
+            if info.crc32c:
+                _verify_checksum(info, crc32c_of_bytes(data))
+            return data, info
+
+        try:
+            data, info = _with_retries(read)
+        except BlobNotModified:
+            metric["cache"] = "not_modified"
+            return cached[1], cached[0]
+        except BlobNotFound:
+            metric["cache"] = "miss"
+            _BYTE_CACHE.discard(blob_name)
+            _MANIFEST.note_missing(blob_name)
+            return None, None
+        metric["cache"] = "miss"
+        metric["bytes"] = len(data)
+        _BYTE_CACHE.put(blob_name, info.generation, data)
+        _MANIFEST.note_blob(info)
+        return data, info.generation
 
 
 def download_blob_bytes(blob_name: str) -> Optional[bytes]:
-    client = _get_storage_client()
-    bucket = _get_bucket()
-    blob = bucket.blob(blob_name)
-    if not blob.exists(client=client):
-        return None
-    return blob.download_as_bytes()
+    """Contenido del blob, o None si no existe."""
+    return download_blob_with_generation(blob_name)[0]
+
+
+def upload_blob_bytes(
+    blob_name: str,
+    data: bytes,
+    content_type: Optional[str] = None,
+    if_generation_match: Optional[int] = None,
+) -> BlobInfo:
+    """
+    Sube el contenido del blob. Con ``if_generation_match`` la subida solo se
+    aplica si la generación actual coincide (0 = el blob no debe existir);
+    si no coincide se lanza ``GenerationMismatch``.
+    """
+    content_type = content_type or _content_type_from_name(blob_name)
+    with storage_metrics.operation("upload", blob_name) as metric:
+        metric["bytes"] = len(data)
+        info = _write_verified(
+            blob_name,
+            lambda precondition: _get_backend().write(
+                blob_name, data, content_type=content_type, if_generation_match=precondition
+            ),
+            crc32c_of_bytes(data),
+            if_generation_match,
+        )
+    # Lo recién subido es la versión vigente: la próxima lectura solo revalida.
+    _BYTE_CACHE.put(blob_name, info.generation, data)
+    _MANIFEST.note_blob(info)
+    return info
+
+
+def _spool() -> BinaryIO:
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES)
+
+
+def _file_size(fileobj: BinaryIO) -> int:
+    fileobj.seek(0, io.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    return size
+
+
+def download_blob_to_file(blob_name: str) -> tuple[Optional[BinaryIO], Optional[int]]:
+    """
+    Como ``download_blob_with_generation`` pero devuelve un archivo legible
+    posicionado al inicio. Los blobs grandes se bajan directo a un temporal
+    en disco sin pasar por ``bytes``; el llamador debe cerrarlo.
+    """
+    with storage_metrics.operation("download", blob_name) as metric:
+        cached = _BYTE_CACHE.get(blob_name)
+        spool = _spool()
+
+        def read_into():
+            spool.seek(0)
+            spool.truncate()
+            info = _get_backend().read_into(
+                blob_name,
+                spool,
+                if_generation_not_match=cached[0] if cached is not None else None,
+            )
+            # Se verifica antes de entregarle el archivo a openpyxl.
+            if info.crc32c:
+                _verify_checksum(info, crc32c_of_file(spool))
+            return info
+
+        try:
+            info = _with_retries(read_into)
+        except BlobNotModified:
+            spool.close()
+            metric["cache"] = "not_modified"
+            return io.BytesIO(cached[1]), cached[0]
+        except BlobNotFound:
+            spool.close()
+            metric["cache"] = "miss"
+            _BYTE_CACHE.discard(blob_name)
+            _MANIFEST.note_missing(blob_name)
+            return None, None
+        except BaseException:
+            spool.close()
+            raise
+        metric["cache"] = "miss"
+        metric["bytes"] = info.size
+        _MANIFEST.note_blob(info)
+        spool.seek(0)
+        if info.size > SPOOL_MAX_MEMORY_BYTES:
+            _BYTE_CACHE.discard(blob_name)
+            return spool, info.generation
+        data = spool.read()
+        spool.close()
+        _BYTE_CACHE.put(blob_name, info.generation, data)
+        return io.BytesIO(data), info.generation
+
+
+def upload_blob_file(
+    blob_name: str,
+    fileobj: BinaryIO,
+    content_type: Optional[str] = None,
+    if_generation_match: Optional[int] = None,
+) -> BlobInfo:
+    """Como ``upload_blob_bytes`` pero leyendo el contenido desde un archivo."""
+    size = _file_size(fileobj)
+    content_type = content_type or _content_type_from_name(blob_name)
+
+    def write(precondition):
+        fileobj.seek(0)
+        return _get_backend().write_from_file(
+            blob_name, fileobj, content_type=content_type, if_generation_match=precondition
+        )
+
+    with storage_metrics.operation("upload", blob_name) as metric:
+        metric["bytes"] = size
+        info = _write_verified(blob_name, write, crc32c_of_file(fileobj), if_generation_match)
+    if size > SPOOL_MAX_MEMORY_BYTES:
+        _BYTE_CACHE.discard(blob_name)
+    else:
+        fileobj.seek(0)
+        _BYTE_CACHE.put(blob_name, info.generation, fileobj.read())
+    _MANIFEST.note_blob(info)
+    return info
 
 
-def upload_blob_bytes(blob_name: str, data: bytes, content_type: Optional[str] = None) -> None:
-    bucket = _get_bucket()
-    blob = bucket.blob(blob_name)
-    blob.upload_from_string(data, content_type=content_type or _content_type_from_name(blob_name))
+def create_blob_if_absent(blob_name: str, data: bytes, content_type: Optional[str] = None) -> bool:
+    """
+    Crea el blob solo si todavía no existe. Devuelve False si otro proceso
+    lo creó antes (en ese caso no se sobrescribe nada).
+    """
+    try:
+        upload_blob_bytes(blob_name, data, content_type=content_type, if_generation_match=0)
+    except GenerationMismatch:
+        # Existe aunque el manifiesto no lo supiera: se vuelve a listar su prefijo.
+        _MANIFEST.invalidate(blob_name)
+        return False
+    return True
+
+
+# =========================
+# Blobs de solo agregado
+# =========================
+
+APPEND_ATTEMPTS = 8
+
+
+def append_blob_bytes(blob_name: str, data: bytes, content_type: Optional[str] = None) -> BlobInfo:
+    """
+    Agrega ``data`` al final del blob (lo crea si no existe) sin pisar
+    agregados concurrentes: cada intento exige la generación recién leída.
+    El byte donde quedó ``data`` es ``info.size - len(data)``.
+    """
+    content_type = content_type or _content_type_from_name(blob_name)
+    backend = _get_backend()
+    uncertain = False
+    with storage_metrics.operation("append", blob_name) as metric:
+        metric["bytes"] = len(data)
+        for _ in range(APPEND_ATTEMPTS):
+            current = backend.stat(blob_name)
+            if uncertain and current is not None and current.size >= len(data):
+                # El intento anterior pudo haber llegado sin que llegara la respuesta.
+                tail, _ = backend.read_range(blob_name, current.size - len(data))
+                if tail == data:
+                    info = current
+                    break
+            uncertain = False
+            try:
+                info = backend.append(
+                    blob_name,
+                    data,
+                    content_type=content_type,
+                    if_generation_match=current.generation if current is not None else 0,
+                )
+            except GenerationMismatch:
+                continue
+            except (TransientStorageError, IntegrityError):
+                uncertain = True
+                continue
+            break
+        else:
+            raise GenerationMismatch(f"No se pudo agregar a {blob_name} tras {APPEND_ATTEMPTS} intentos.")
+    _BYTE_CACHE.discard(blob_name)
+    _MANIFEST.note_blob(info)
+    return info
+
+
+def download_blob_range(blob_name: str, start: int) -> tuple[bytes, Optional[BlobInfo]]:
+    """Bytes del blob desde ``start`` (``(b"", None)`` si no existe)."""
+    with storage_metrics.operation("download_range", blob_name) as metric:
+        try:
+            data, info = _with_retries(lambda: _get_backend().read_range(blob_name, start))
+        except BlobNotFound:
+            return b"", None
+        metric["bytes"] = len(data)
+    return data, info
 
 
 # =========================
@@ -74,52 +539,111 @@ def resolve_excel_blob(base_without_ext: str) -> str:
     return f"{base_without_ext}.xlsm"
 
 
-def ensure_excel_blob(blob_name: str) -> str:
-    if download_blob_bytes(blob_name) is not None:
-        return blob_name
+def _new_workbook() -> Workbook:
     wb = Workbook()
     ws = wb.active
     ws.title = "Hoja1"
-    save_workbook_to_gcs(wb, blob_name)
-    return blob_name
+    return wb
 
 
-def load_workbook_from_gcs(blob_name: str):
-    excel_blob = ensure_excel_blob(blob_name)
-    data = download_blob_bytes(excel_blob)
-    if data is None:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Hoja1"
-        save_workbook_to_gcs(wb, excel_blob)
-        return wb
-    return load_workbook(io.BytesIO(data), keep_vba=is_xlsm(excel_blob))
-
-
-def save_workbook_to_gcs(wb, blob_name: str) -> None:
+def _workbook_to_bytes(wb) -> bytes:
     buffer = io.BytesIO()
     wb.save(buffer)
-    upload_blob_bytes(blob_name, buffer.getvalue(), content_type=_content_type_from_name(blob_name))
+    return buffer.getvalue()
+
+
+def _workbook_to_file(wb) -> BinaryIO:
+    """Serializa el libro en un temporal (en memoria hasta SPOOL_MAX_MEMORY_BYTES)."""
+    spool = _spool()
+    wb.save(spool)
+    spool.seek(0)
+    return spool
+
+
+def ensure_excel_blob(blob_name: str) -> str:
+    if blob_exists(blob_name):
+        return blob_name
+    create_blob_if_absent(blob_name, _workbook_to_bytes(_new_workbook()))
+    return blob_name
+
+
+def load_workbook_with_generation(blob_name: str) -> tuple[Any, int]:
+    """
+    Carga el libro desde GCS junto con la generación leída. Si no existe lo
+    crea vacío de forma atómica. El contenido se descarga a lo sumo una vez.
+    """
+    source, generation = download_blob_to_file(blob_name)
+    if source is None:
+        wb = _new_workbook()
+        try:
+            info = upload_blob_bytes(blob_name, _workbook_to_bytes(wb), if_generation_match=0)
+        except GenerationMismatch:
+            # Otro usuario lo creó primero: se trabaja sobre su versión.
+            source, generation = download_blob_to_file(blob_name)
+        else:
+            return wb, info.generation
+        if source is None:
+            raise BlobNotFound(blob_name)
+    with source:
+        return load_workbook(source, keep_vba=is_xlsm(blob_name)), generation
+
+
+def load_or_create_workbook(blob_name: str):
+    """Carga el libro desde GCS o, si no existe, lo crea vacío de forma atómica."""
+    return load_workbook_with_generation(blob_name)[0]
+
+
+def load_workbook_from_gcs(blob_name: str):
+    return load_or_create_workbook(blob_name)
+
+
+def save_workbook_to_gcs(wb, blob_name: str, if_generation_match: Optional[int] = None) -> BlobInfo:
+    """
+    Sube el libro. Con ``if_generation_match`` (la generación que se leyó) la
+    subida se rechaza con ``GenerationMismatch`` si alguien guardó en el medio.
+    """
+    with _workbook_to_file(wb) as serialized:
+        return upload_blob_file(
+            blob_name,
+            serialized,
+            content_type=_content_type_from_name(blob_name),
+            if_generation_match=if_generation_match,
+        )
 
 
 # =========================
 # JSON helpers (agenda)
 # =========================
 
-def load_json_from_gcs(blob_name: str) -> dict[str, Any]:
-    try:
-        data = download_blob_bytes(blob_name)
-    except NotFound:
-        return {}
-
+def load_json_with_generation(blob_name: str) -> tuple[dict[str, Any], Optional[int]]:
+    """JSON del blob junto con su generación (``({}, None)`` si no existe)."""
+    with storage_metrics.operation("json_read", blob_name):
+        data, generation = download_blob_with_generation(blob_name)
     if not data:
-        return {}
+        return {}, generation
 
     try:
-        return json.loads(data.decode("utf-8"))
+        return json.loads(data.decode("utf-8")), generation
     except json.JSONDecodeError:
-        return {}
+        return {}, generation
 
 
-def save_json_to_gcs(blob_name: str, payload: dict[str, Any]) -> None:
-    upload_blob_bytes(blob_name, json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8"), content_type="application/json")
+def load_json_from_gcs(blob_name: str) -> dict[str, Any]:
+    return load_json_with_generation(blob_name)[0]
+
+
+def save_json_to_gcs(
+    blob_name: str,
+    payload: dict[str, Any],
+    if_generation_match: Optional[int] = None,
+    compact: bool = False,
+) -> BlobInfo:
+    """Sube ``payload`` como JSON; con ``compact`` sin sangría ni espacios."""
+    formato = {"separators": (",", ":")} if compact else {"indent": 2}
+    with storage_metrics.operation("json_write", blob_name):
+        return upload_blob_bytes(
+            blob_name,
+            json.dumps(payload, ensure_ascii=False, **formato).encode("utf-8"),
+            content_type="application/json",
+            if_generation_match=if_generation_match,
+        )
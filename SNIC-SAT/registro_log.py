@@ -0,0 +1,267 @@
+"""Registro de solo agregado de las cargas SNIC-SAT de cada comisaría.
+
+Cada registro finalizado (el diccionario de ``registro_snic.armar_registro``
+con los resúmenes de Direcciones, Robos/Hurtos y Otros) se agrega como una
+línea JSON a ``<planilla>.registros.jsonl``. Guardar pasa a ser un agregado
+chico en lugar de descargar, modificar y volver a subir el ``.xlsm``.
+
+La planilla Excel es una proyección del registro: guarda en una propiedad
+del documento hasta qué byte del registro tiene aplicado, y ``materializar``
+le escribe las líneas nuevas en un único commit (la propiedad viaja en el
+mismo libro, así que dos materializaciones nunca aplican la misma línea).
+Si la planilla se completa, lo que no entró pasa al registro del volumen
+siguiente (``volumenes``).
+Se materializa en segundo plano poco después de cada guardado y, antes de
+ofrecer la descarga, si quedó algo pendiente.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+from openpyxl.packaging.custom import IntProperty
+
+from gcs_utils import append_blob_bytes, download_blob_range, load_json_with_generation, stat_blob
+import registro_snic
+import row_leases
+import volumenes
+from workbook_writes import ENGINE_OPENPYXL, commit_workbook_changes
+
+logger = logging.getLogger(__name__)
+
+LOG_SUFFIX = ".registros.jsonl"
+OFFSET_PROPERTY = "snic_registro_offset"
+
+# Espera antes de materializar, para juntar en un commit los guardados seguidos.
+MATERIALIZAR_DEMORA_SEGUNDOS = float(os.getenv("SNICSAT_MATERIALIZAR_SEG", "5"))
+REINTENTO_MAX_SEGUNDOS = 300.0
+
+
+def registro_log_path(excel_path: str) -> str:
+    return f"{excel_path}{LOG_SUFFIX}"
+
+
+def _agregar_linea(linea: dict[str, Any]) -> int:
+    data = (json.dumps(linea, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+    info = append_blob_bytes(registro_log_path(linea["excel_path"]), data, content_type="application/x-ndjson")
+    return info.size - len(data)
+
+
+def agregar_registro(registro: dict[str, Any]) -> int:
+    """Agrega el registro al final del registro de su planilla y devuelve su offset."""
+    return _agregar_linea({"id": uuid.uuid4().hex, "creado": datetime.now(timezone.utc).isoformat(), **registro})
+
+
+# =========================
+# Proyección en la planilla
+# =========================
+
+def offset_proyectado(wb) -> int:
+    """Byte del registro hasta el que el libro ya tiene aplicadas las líneas."""
+    try:
+        return int(wb.custom_doc_props[OFFSET_PROPERTY].value or 0)
+    except KeyError:
+        return 0
+
+
+def _marcar_offset(wb, offset: int) -> None:
+    try:
+        wb.custom_doc_props[OFFSET_PROPERTY].value = offset
+    except KeyError:
+        wb.custom_doc_props.append(IntProperty(name=OFFSET_PROPERTY, value=offset))
+
+
+def _lineas_completas(data: bytes, desde: int) -> list[tuple[int, int, dict[str, Any]]]:
+    """
+    ``(inicio, fin, registro)`` de cada línea terminada en ``\\n``. Una última
+    línea sin terminar (agregado en curso) se deja para la próxima vez.
+    """
+    lineas = []
+    inicio = 0
+    while True:
+        fin = data.find(b"\n", inicio)
+        if fin < 0:
+            return lineas
+        crudo = data[inicio:fin].strip()
+        if crudo:
+            try:
+                lineas.append((desde + inicio, desde + fin + 1, json.loads(crudo)))
+            except json.JSONDecodeError:
+                logger.warning("Línea inválida en el byte %s del registro; se omite.", desde + inicio)
+        inicio = fin + 1
+
+
+def pendientes(excel_path: str) -> int:
+    """Bytes del registro que todavía no llegaron a la planilla (según el índice)."""
+    info = stat_blob(registro_log_path(excel_path))
+    if info is None:
+        return 0
+    indice, _ = load_json_with_generation(registro_snic.indice_filas_path(excel_path))
+    return max(0, info.size - int(indice.get("log_offset") or 0))
+
+
+def _reenviar(excel_path: str, registros: list[dict[str, Any]]) -> None:
+    """
+    Pasa al registro de ``excel_path`` los registros que no entraron en el
+    volumen anterior. Los que ya están (por id) no se repiten, así que se
+    puede volver a llamar si el commit del volumen anterior se reintenta.
+    """
+    data, _ = download_blob_range(registro_log_path(excel_path), 0)
+    presentes = {registro.get("id") for _, _, registro in _lineas_completas(data, 0)}
+    for registro in registros:
+        if registro.get("id") in presentes:
+            continue
+        presentes.add(registro.get("id"))
+        _agregar_linea({**registro, "excel_path": excel_path, "fila_reservada": None})
+
+
+class _SinNovedades(Exception):
+    """No hay líneas nuevas que aplicar: no hace falta subir el libro."""
+
+
+def materializar(excel_path: str) -> int:
+    """
+    Aplica a la planilla las líneas del registro posteriores a su offset y
+    devuelve cuántos registros escribió. Si la planilla se completa, las
+    líneas restantes pasan al volumen siguiente y se materializan ahí.
+    """
+    log_path = registro_log_path(excel_path)
+    lease_path = registro_snic.reservas_path(excel_path)
+    reservadas = row_leases.filas_reservadas(lease_path)
+
+    def aplicar(wb) -> tuple[int, list[str], int, list[int], int, Optional[str]]:
+        desde = offset_proyectado(wb)
+        data, _ = download_blob_range(log_path, desde)
+        aplicados = 0
+        owners: list[str] = []
+        offset = desde
+        vistos: set[str] = set()
+        sin_lugar: list[dict[str, Any]] = []
+        for _, fin, registro in _lineas_completas(data, desde):
+            if registro.get("id") not in vistos:
+                vistos.add(registro.get("id"))
+                if registro.get("reserva_owner"):
+                    owners.append(registro["reserva_owner"])
+                excluidas = reservadas - {registro.get("fila_reservada")}
+                try:
+                    if sin_lugar:
+                        raise registro_snic.PlanillaCompletaError(excel_path)
+                    registro_snic.aplicar_registro(wb, registro, excluidas=excluidas)
+                    aplicados += 1
+                except registro_snic.PlanillaCompletaError:
+                    sin_lugar.append(registro)
+            offset = fin
+        siguiente = None
+        if sin_lugar:
+            siguiente = volumenes.renovar(excel_path)
+            logger.info("La planilla %s está completa; %s registros pasan a %s.", excel_path, len(sin_lugar), siguiente)
+            _reenviar(siguiente, sin_lugar)
+        proxima = registro_snic.primera_fila_libre(wb.active)
+        estado = (aplicados, owners, proxima, registro_snic.filas_ocupadas_desde(wb.active, proxima), offset, siguiente)
+        if offset == desde:
+            raise _SinNovedades(estado)
+        _marcar_offset(wb, offset)
+        return estado
+
+    def al_guardar(estado, info) -> None:
+        _, _, proxima, ocupadas, offset, _ = estado
+        registro_snic.actualizar_indice_filas(excel_path, proxima, info.generation, ocupadas, log_offset=offset)
+
+    try:
+        aplicados, owners, _, _, _, siguiente = commit_workbook_changes(
+            excel_path, aplicar, on_commit=al_guardar, engine=ENGINE_OPENPYXL  # el offset va en docProps
+        )
+    except _SinNovedades as nada:
+        # El índice estaba atrasado: se lo pone al día para no volver a cargar el libro.
+        _, _, proxima, ocupadas, offset, _ = nada.args[0]
+        info = stat_blob(excel_path)
+        if info is not None:
+            registro_snic.actualizar_indice_filas(excel_path, proxima, info.generation, ocupadas, log_offset=offset)
+        return 0
+    # Las líneas ya están en la planilla: si no se pueden liberar, las reservas vencen solas.
+    try:
+        row_leases.liberar(lease_path, *owners)
+    except Exception as exc:
+        logger.warning("No se pudieron liberar las reservas de %s: %s", excel_path, exc)
+    if siguiente is not None:
+        aplicados += materializar(siguiente)
+    return aplicados
+
+
+def materializar_si_hay_pendientes(excel_path: str) -> int:
+    return materializar(excel_path) if pendientes(excel_path) else 0
+
+
+# =========================
+# Materialización en segundo plano
+# =========================
+
+class Materializador:
+    """
+    Hilo que materializa las planillas con registros nuevos. ``programar``
+    marca la planilla; el hilo espera ``demora`` segundos para juntar los
+    guardados seguidos y, si falla, reintenta con espera creciente.
+    """
+
+    def __init__(
+        self,
+        al_materializar: Optional[Callable[[str, int], Any]] = None,
+        demora: float = MATERIALIZAR_DEMORA_SEGUNDOS,
+    ):
+        self.al_materializar = al_materializar
+        self.demora = demora
+        self._programadas: dict[str, float] = {}
+        self._fallos: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker = threading.Thread(target=self._run, name="registro-materializador", daemon=True)
+        self._worker.start()
+
+    def programar(self, excel_path: str, demora: Optional[float] = None) -> None:
+        vence = time.monotonic() + (self.demora if demora is None else demora)
+        with self._lock:
+            actual = self._programadas.get(excel_path)
+            if actual is None or vence < actual:
+                self._programadas[excel_path] = vence
+            self._wakeup.notify()
+
+    def _siguiente(self) -> tuple[Optional[str], Optional[float]]:
+        if not self._programadas:
+            return None, None
+        excel_path, vence = min(self._programadas.items(), key=lambda item: item[1])
+        espera = vence - time.monotonic()
+        if espera > 0:
+            return None, espera
+        del self._programadas[excel_path]
+        return excel_path, None
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                excel_path, espera = self._siguiente()
+                while excel_path is None:
+                    self._wakeup.wait(timeout=espera)
+                    excel_path, espera = self._siguiente()
+
+            try:
+                aplicados = materializar(excel_path)
+            except Exception as exc:
+                with self._lock:
+                    fallos = self._fallos[excel_path] = self._fallos.get(excel_path, 0) + 1
+                logger.warning("No se pudo materializar %s (intento %s): %s", excel_path, fallos, exc)
+                self.programar(excel_path, min(self.demora * (2 ** fallos), REINTENTO_MAX_SEGUNDOS))
+                continue
+
+            with self._lock:
+                self._fallos.pop(excel_path, None)
+            if aplicados and self.al_materializar is not None:
+                try:
+                    self.al_materializar(excel_path, aplicados)
+                except Exception:
+                    logger.exception("Falló el aviso de materialización de %s", excel_path)
@@ -0,0 +1,488 @@
+"""Escritura de un registro SNIC-SAT en la planilla de la comisaría.
+
+El registro es un diccionario serializable a JSON con los datos generales
+del paso 6 y, si corresponden, los resúmenes de Direcciones, Robos/Hurtos
+y Otros. Así puede guardarse en el momento o quedar en el diario de
+guardado diferido (``write_behind``) y escribirse más tarde.
+
+Junto a cada planilla se guarda un índice chico (``<planilla>.filas.json``)
+con la próxima fila libre y la generación del libro sobre la que se
+calculó, para no descargar la planilla entera solo para saber dónde sigue.
+Cuando hay que reconstruirlo se lee solo la columna de fecha en streaming
+(``xlsx_stream``).
+
+Cada operador que empieza una carga reserva una fila (``row_leases``) en
+``<planilla>.reservas.json``; el guardado escribe en esa fila, y los demás
+guardados la saltean mientras la reserva esté vigente.
+
+Un registro con ``id`` (los del guardado diferido) deja su id y su fila en
+las propiedades del libro en el mismo commit, así que volver a guardarlo
+(p. ej. al retomar el diario después de una caída) no lo escribe dos veces.
+"""
+from __future__ import annotations
+
+import logging
+import zipfile
+from typing import Any, Iterable, Optional
+
+from openpyxl.packaging.custom import StringProperty
+
+from gcs_utils import (
+    BlobInfo,
+    GenerationMismatch,
+    download_blob_to_file,
+    load_json_with_generation,
+    load_workbook_with_generation,
+    save_json_to_gcs,
+    stat_blob,
+)
+import row_leases
+import xlsx_stream
+from workbook_writes import ENGINE_OPENPYXL, commit_workbook_changes, is_blank
+from xlsx_zip import UnsupportedEdit
+
+logger = logging.getLogger(__name__)
+
+FILA_INICIAL = 3
+FILA_LIMITE = 103  # a partir de esta fila la planilla se considera completa
+COLUMNA_FECHA = "C"
+
+
+class PlanillaCompletaError(Exception):
+    """La planilla no tiene más filas libres."""
+
+
+def unwrap_quotes(v):
+    if not isinstance(v, str):
+        return v
+    if len(v) >= 2 and ((v[0] == v[-1] == '"') or (v[0] == v[-1] == "'")):
+        return v[1:-1]
+    return v
+
+
+def _sumar_por_sexo(rows) -> tuple[int, int, int]:
+    total_m = total_f = total_nc = 0
+    for r in (rows or []):
+        sexo = (r.get("sexo") or "").strip()
+        try:
+            c = int(str(r.get("cant") or "0").strip())
+        except Exception:
+            c = 0
+        if sexo == "MASCULINO": total_m += c
+        elif sexo == "FEMENINO": total_f += c
+        elif sexo == "NO CONSTA": total_nc += c
+    return total_m, total_f, total_nc
+
+
+# =========================
+# Bloques de columnas
+# =========================
+
+def escribir_datos_generales(ws, fila: int, registro: dict[str, Any]) -> None:
+    """C,D,E,F,H,Q,AF,BL,X,R (sin tocar A)."""
+    ws[f"C{fila}"].value  = registro.get("fecha_denuncia_txt")
+    ws[f"D{fila}"].value  = registro.get("fecha_hecho_txt")
+    ws[f"E{fila}"].value  = registro.get("hora_hecho_txt")
+    ws[f"F{fila}"].value  = registro.get("hora_fin_txt")
+    ws[f"H{fila}"].value  = unwrap_quotes(registro.get("preventivo"))
+    ws[f"Q{fila}"].value  = unwrap_quotes(registro.get("denunciante"))
+    ws[f"AF{fila}"].value = unwrap_quotes(registro.get("motivo"))
+    ws[f"BL{fila}"].value = unwrap_quotes(registro.get("hecho"))
+    ws[f"X{fila}"].value  = unwrap_quotes(registro.get("delito"))
+    ws[f"R{fila}"].value  = unwrap_quotes(registro.get("actuacion"))
+
+
+def escribir_direcciones(ws, fila: int, dprev: dict[str, Any]) -> None:
+    C = lambda col: f"{col}{fila}"
+
+    # I{fila}: ciudad/código según comisaría
+    cc = dprev.get("ciudad_cod")
+    if cc not in (None, ""):
+        ws[C("I")].value = unwrap_quotes(str(cc))
+
+    # J{fila}: barrio (si 'OTRO', además guarda el texto en K{fila})
+    b = dprev.get("barrio")
+    if b not in (None, ""):
+        ws[C("J")].value = unwrap_quotes(str(b))
+    ob = dprev.get("otro_barrio") or ""
+    if (b == "OTRO") and ob.strip():
+        ws[C("K")].value = unwrap_quotes(ob.strip())
+
+    # L{fila}: dirección ; M{fila}: altura
+    dir_txt = dprev.get("direccion")
+    if dir_txt not in (None, ""):
+        ws[C("L")].value = unwrap_quotes(str(dir_txt))
+    alt_txt = dprev.get("altura")
+    if alt_txt not in (None, ""):
+        ws[C("M")].value = unwrap_quotes(str(alt_txt))
+
+    # N{fila}: link de Google Maps (obligatorio)
+    link = (dprev.get("link_maps") or "").strip()
+    if link:
+        ws[C("N")].value = unwrap_quotes(link)
+
+
+def escribir_robos_hurtos(ws, fila: int, rh_preview: dict[str, Any]) -> None:
+    C = lambda col: f"{col}{fila}"
+
+    # -------- Víctimas (AO total) + por sexo (AG/AH/AI)
+    total_m, total_f, total_nc = _sumar_por_sexo(rh_preview.get("vict_rows"))
+    ao_total = total_m + total_f + total_nc
+    ws[C("AO")].value = ao_total if ao_total else None
+    if total_m: ws[C("AG")].value = total_m
+    if total_f: ws[C("AH")].value = total_f
+    if total_nc: ws[C("AI")].value = total_nc
+
+    # -------- Vulnerabilidad (AP) y Tipo de arma (AR)
+    v = rh_preview.get("vulnerab")
+    if v not in (None, ""): ws[C("AP")].value = unwrap_quotes(str(v).strip())
+    ta = rh_preview.get("tipo_arma")
+    if ta not in (None, ""): ws[C("AR")].value = unwrap_quotes(str(ta).strip())
+
+    # -------- Inculpados: SI/NO (AS) + rango (AW/AX/AY/AZ) + sexo (AT/AU/AV)
+    inc_sn = (rh_preview.get("inc_sn") or "").strip()
+    if inc_sn: ws[C("AS")].value = unwrap_quotes(inc_sn)
+    if inc_sn == "SI":
+        rango = rh_preview.get("rango_etario")
+        cant_rango = rh_preview.get("cant_rango")
+        if rango and str(cant_rango).strip() != "":
+            try:
+                cant_num = int(str(cant_rango).strip())
+            except Exception:
+                cant_num = 0
+            if   rango == "Hasta 15 año":     ws[C("AW")].value = cant_num
+            elif rango == "15 a 17 años":     ws[C("AX")].value = cant_num
+            elif rango == "mayor de 18 años": ws[C("AY")].value = cant_num
+            elif rango == "Sin Determinar":   ws[C("AZ")].value = cant_num
+        # Distribución por sexo de inculpados
+        t_m, t_f, t_nc = _sumar_por_sexo(rh_preview.get("sex_rows"))
+        if t_m: ws[C("AT")].value = t_m
+        if t_f: ws[C("AU")].value = t_f
+        if t_nc: ws[C("AV")].value = t_nc
+
+    # -------- Tipo de lugar (AD) + Detalle establecimiento (AE)
+    tl = rh_preview.get("tipo_lugar")
+    if tl not in (None, ""): ws[C("AD")].value = unwrap_quotes(str(tl).strip())
+    de = rh_preview.get("detalle_est")
+    if de not in (None, ""): ws[C("AE")].value = unwrap_quotes(str(de).strip())
+
+    # -------- Elementos (BB) + Subcat (BC) + Denom (BD) + Año (BE) + Modelo (BF)
+    el = rh_preview.get("elem")
+    if el not in (None, ""): ws[C("BB")].value = unwrap_quotes(str(el).strip())
+    sc = rh_preview.get("subcat")
+    if sc not in (None, ""): ws[C("BC")].value = unwrap_quotes(str(sc).strip())
+    dn = rh_preview.get("denom")
+    if dn not in (None, ""): ws[C("BD")].value = unwrap_quotes(str(dn).strip())
+    if el in ("AUTOMOTOR", "MOTOCICLETA"):
+        an = rh_preview.get("anio")
+        md = rh_preview.get("modelo")
+        if an not in (None, ""): ws[C("BE")].value = unwrap_quotes(str(an).strip())
+        if md not in (None, ""): ws[C("BF")].value = unwrap_quotes(str(md).strip())
+
+    # -------- Modus (BJ) + Especialidad (BK)
+    mo = rh_preview.get("modus")
+    if mo not in (None, ""): ws[C("BJ")].value = unwrap_quotes(str(mo).strip())
+    es = rh_preview.get("especialidad")
+    if es not in (None, ""): ws[C("BK")].value = unwrap_quotes(str(es).strip())
+
+
+def escribir_otros(ws, fila: int, oprev: dict[str, Any]) -> None:
+    C = lambda col: f"{col}{fila}"
+
+    # Limpiar AO/AG/AH/AI por seguridad (si reescriben tras editar)
+    ws[C("AO")].value = None
+    ws[C("AG")].value = None
+    ws[C("AH")].value = None
+    ws[C("AI")].value = None
+
+    # Acumular por sexo (AG/AH/AI) y total (AO)
+    total_m, total_f, total_nc = _sumar_por_sexo(oprev.get("vict_rows"))
+    ao_total = total_m + total_f + total_nc
+    ws[C("AO")].value = ao_total if ao_total else None
+    if total_m: ws[C("AG")].value = total_m
+    if total_f: ws[C("AH")].value = total_f
+    if total_nc: ws[C("AI")].value = total_nc
+
+    # AP Vulnerabilidad
+    vul = oprev.get("vulnerabilidad")
+    if vul not in (None, ""):
+        ws[C("AP")].value = unwrap_quotes(str(vul).strip())
+
+    # BA ¿Apareció? solo si corresponde (Desaparición)
+    if oprev.get("aparecio") is not None:
+        ws[C("BA")].value = unwrap_quotes(str(oprev.get("aparecio")).strip())
+
+
+# =========================
+# Registro completo
+# =========================
+
+def armar_registro(
+    excel_path: str,
+    *,
+    comisaria: Optional[str],
+    hecho,
+    delito,
+    actuacion,
+    fecha_denuncia_txt: Optional[str],
+    fecha_hecho_txt: Optional[str],
+    hora_hecho_txt: Optional[str],
+    hora_fin_txt: Optional[str],
+    preventivo,
+    denunciante,
+    motivo,
+    direcciones: Optional[dict] = None,
+    robos_hurtos: Optional[dict] = None,
+    otros: Optional[dict] = None,
+    fila_reservada: Optional[int] = None,
+    reserva_owner: Optional[str] = None,
+) -> dict[str, Any]:
+    return {
+        "excel_path": excel_path,
+        "comisaria": comisaria,
+        "hecho": hecho,
+        "delito": delito,
+        "actuacion": actuacion,
+        "fecha_denuncia_txt": fecha_denuncia_txt,
+        "fecha_hecho_txt": fecha_hecho_txt,
+        "hora_hecho_txt": hora_hecho_txt,
+        "hora_fin_txt": hora_fin_txt,
+        "preventivo": preventivo,
+        "denunciante": denunciante,
+        "motivo": motivo,
+        "direcciones": direcciones or None,
+        "robos_hurtos": robos_hurtos or None,
+        "otros": otros or None,
+        "fila_reservada": fila_reservada,
+        "reserva_owner": reserva_owner,
+    }
+
+
+def _fila_vacia(ws, fila: int) -> bool:
+    return is_blank(ws[f"{COLUMNA_FECHA}{fila}"].value)
+
+
+def primera_fila_libre(ws, excluidas: Iterable[int] = ()) -> int:
+    """Primera fila vacía en la columna de fecha (C) a partir de la fila 3."""
+    excluidas = set(excluidas)
+    fila = FILA_INICIAL
+    while not _fila_vacia(ws, fila) or fila in excluidas:
+        fila += 1
+    return fila
+
+
+def filas_ocupadas_desde(ws, desde: int) -> list[int]:
+    """Filas con fecha a partir de ``desde`` (huecos dejados por reservas)."""
+    return [fila for fila in range(desde, ws.max_row + 1) if not _fila_vacia(ws, fila)]
+
+
+def aplicar_registro(wb, registro: dict[str, Any], excluidas: Iterable[int] = ()) -> int:
+    """
+    Escribe el registro completo en su fila reservada si sigue libre; si no,
+    en la primera fila libre que no esté reservada por otro.
+    """
+    ws = wb.active
+    fila = registro.get("fila_reservada")
+    if not fila or not _fila_vacia(ws, fila):
+        fila = primera_fila_libre(ws, excluidas)
+    if fila >= FILA_LIMITE:
+        raise PlanillaCompletaError(f"La planilla {registro.get('excel_path')} está completa.")
+    if registro.get("direcciones"):
+        escribir_direcciones(ws, fila, registro["direcciones"])
+    if registro.get("robos_hurtos"):
+        escribir_robos_hurtos(ws, fila, registro["robos_hurtos"])
+    if registro.get("otros"):
+        escribir_otros(ws, fila, registro["otros"])
+    escribir_datos_generales(ws, fila, registro)
+    return fila
+
+
+# Últimos registros con id guardados en el libro ("id:fila,..."). Alcanza con
+# pocos: el diario diferido guarda de a uno por planilla y en orden.
+APLICADOS_PROPERTY = "snic_registros_aplicados"
+APLICADOS_MAX = 5
+
+
+class _YaGuardado(Exception):
+    """El registro ya está en el libro: no hace falta subirlo otra vez."""
+
+
+def _aplicados(wb) -> dict[str, int]:
+    try:
+        valor = wb.custom_doc_props[APLICADOS_PROPERTY].value or ""
+    except KeyError:
+        return {}
+    pares = (par.rpartition(":") for par in valor.split(",") if par)
+    return {registro_id: int(fila) for registro_id, _, fila in pares if fila.isdigit()}
+
+
+def _marcar_aplicado(wb, registro_id: str, fila: int) -> None:
+    aplicados = _aplicados(wb)
+    aplicados[registro_id] = fila
+    valor = ",".join(f"{rid}:{f}" for rid, f in list(aplicados.items())[-APLICADOS_MAX:])
+    try:
+        wb.custom_doc_props[APLICADOS_PROPERTY].value = valor
+    except KeyError:
+        wb.custom_doc_props.append(StringProperty(name=APLICADOS_PROPERTY, value=valor))
+
+
+def guardar_registro(registro: dict[str, Any]) -> int:
+    """
+    Guarda el registro en un único commit y devuelve la fila usada. Si el
+    registro tiene ``id`` y ya estaba guardado, devuelve su fila sin escribir.
+    """
+    excel_path = registro["excel_path"]
+    owner = registro.get("reserva_owner")
+    registro_id = registro.get("id")
+    reservadas = row_leases.filas_reservadas(reservas_path(excel_path), excluir_owner=owner)
+
+    def aplicar(wb) -> tuple[int, int, list[int]]:
+        if registro_id:
+            previa = _aplicados(wb).get(registro_id)
+            if previa is not None:
+                raise _YaGuardado(previa)
+        fila = aplicar_registro(wb, registro, excluidas=reservadas)
+        if registro_id:
+            _marcar_aplicado(wb, registro_id, fila)
+        proxima = primera_fila_libre(wb.active)
+        return fila, proxima, filas_ocupadas_desde(wb.active, proxima)
+
+    try:
+        fila, _, _ = commit_workbook_changes(
+            excel_path,
+            aplicar,
+            on_commit=lambda result, info: actualizar_indice_filas(excel_path, result[1], info.generation, result[2]),
+            # El id va en docProps, que solo escribe openpyxl.
+            engine=ENGINE_OPENPYXL if registro_id else None,
+        )
+    except _YaGuardado as ya:
+        logger.info("El registro %s ya estaba guardado en %s (fila %s).", registro_id, excel_path, ya.args[0])
+        fila = ya.args[0]
+    if owner:
+        # El registro ya está guardado: si no se puede liberar, la reserva vence sola.
+        try:
+            row_leases.liberar(reservas_path(excel_path), owner)
+        except Exception as exc:
+            logger.warning("No se pudo liberar la reserva de %s en %s: %s", owner, excel_path, exc)
+    return fila
+
+
+# =========================
+# Índice de filas
+# =========================
+
+INDEX_SUFFIX = ".filas.json"
+_INDEX_ATTEMPTS = 3
+
+
+def indice_filas_path(excel_path: str) -> str:
+    return f"{excel_path}{INDEX_SUFFIX}"
+
+
+def actualizar_indice_filas(
+    excel_path: str,
+    proxima_fila: int,
+    generation: int,
+    ocupadas: Iterable[int] = (),
+    log_offset: Optional[int] = None,
+) -> None:
+    """
+    Guarda la próxima fila libre calculada sobre ``generation``. Si el índice
+    ya refleja una versión más nueva del libro no se toca. ``log_offset`` es
+    hasta dónde el libro tiene aplicado el registro de la comisaría
+    (``registro_log``); si no se indica se conserva el anterior.
+    """
+    index_path = indice_filas_path(excel_path)
+    ocupadas = sorted(ocupadas)
+    for _ in range(_INDEX_ATTEMPTS):
+        actual, index_generation = load_json_with_generation(index_path)
+        generation_actual = int(actual.get("generation") or 0)
+        offset_actual = int(actual.get("log_offset") or 0)
+        if generation_actual > generation:
+            return
+        if generation_actual == generation and (log_offset is None or offset_actual >= log_offset):
+            return
+        try:
+            save_json_to_gcs(
+                index_path,
+                {
+                    "next_row": proxima_fila,
+                    "row_count": proxima_fila - FILA_INICIAL + len(ocupadas),
+                    "generation": generation,
+                    "ocupadas": ocupadas,
+                    "log_offset": offset_actual if log_offset is None else log_offset,
+                },
+                if_generation_match=index_generation or 0,
+            )
+            return
+        except GenerationMismatch:
+            continue
+
+
+def _filas_con_fecha(excel_path: str) -> tuple[list[int], int]:
+    """
+    Filas con fecha (columna C) desde FILA_INICIAL y la generación leída.
+    Se recorre la columna en streaming; si el archivo no es un zip legible
+    (o no existe todavía) se usa openpyxl.
+    """
+    source, generation = download_blob_to_file(excel_path)
+    if source is not None:
+        with source:
+            try:
+                return xlsx_stream.filled_rows(source, COLUMNA_FECHA, min_row=FILA_INICIAL), generation
+            except (zipfile.BadZipFile, KeyError, StopIteration, UnsupportedEdit):
+                pass
+    wb, generation = load_workbook_with_generation(excel_path)
+    ws = wb.active
+    return [fila for fila in range(FILA_INICIAL, ws.max_row + 1) if not _fila_vacia(ws, fila)], generation
+
+
+def reconstruir_indice_filas(excel_path: str) -> tuple[int, list[int]]:
+    con_fecha, generation = _filas_con_fecha(excel_path)
+    llenas = set(con_fecha)
+    proxima_fila = FILA_INICIAL
+    while proxima_fila in llenas:
+        proxima_fila += 1
+    ocupadas = [fila for fila in con_fecha if fila > proxima_fila]
+    actualizar_indice_filas(excel_path, proxima_fila, generation, ocupadas)
+    return proxima_fila, ocupadas
+
+
+def estado_filas(excel_path: str) -> tuple[int, list[int]]:
+    """
+    Próxima fila libre de la planilla y las filas ocupadas después de ella.
+    Sale del índice si fue calculado sobre la generación vigente del libro;
+    si el libro cambió por fuera (p. ej. un administrador subió otro Excel)
+    se reconstruye leyendo la planilla.
+    """
+    info: Optional[BlobInfo] = stat_blob(excel_path)
+    if info is not None:
+        indice, _ = load_json_with_generation(indice_filas_path(excel_path))
+        if indice.get("generation") == info.generation and indice.get("next_row"):
+            return int(indice["next_row"]), [int(f) for f in indice.get("ocupadas") or []]
+    return reconstruir_indice_filas(excel_path)
+
+
+def siguiente_fila(excel_path: str) -> int:
+    return estado_filas(excel_path)[0]
+
+
+# =========================
+# Reservas de filas
+# =========================
+
+RESERVAS_SUFFIX = ".reservas.json"
+
+
+def reservas_path(excel_path: str) -> str:
+    return f"{excel_path}{RESERVAS_SUFFIX}"
+
+
+def reservar_fila_planilla(excel_path: str, owner: str) -> int:
+    """Reserva (o renueva) la fila en la que ``owner`` va a guardar su registro."""
+    proxima, ocupadas = estado_filas(excel_path)
+    return row_leases.reservar_fila(reservas_path(excel_path), owner, proxima, ocupadas)
+
+
+def liberar_reserva_planilla(excel_path: str, owner: str) -> None:
+    row_leases.liberar(reservas_path(excel_path), owner)
@@ -0,0 +1,101 @@
+"""Reservas de filas con vencimiento (leases) guardadas en el bucket.
+
+Cada planilla tiene un blob JSON con una reserva por dueño (la sesión del
+operador): ``{"reservas": {dueño: {"fila": n, "vence": epoch}}}``. Todas
+las modificaciones son compare-and-swap sobre la generación del blob, así
+que dos sesiones nunca reciben la misma fila. Una reserva que no se
+renueva vence sola y su fila vuelve a quedar disponible.
+"""
+from __future__ import annotations
+
+import os
+import time
+from typing import Callable, Iterable, Optional
+
+from gcs_utils import GenerationMismatch, load_json_with_generation, save_json_to_gcs
+
+LEASE_TTL_SECONDS = float(os.getenv("SNICSAT_LEASE_TTL", "600"))
+MAX_CAS_ATTEMPTS = 8
+
+
+class LeaseConflictError(Exception):
+    """No se pudo actualizar el blob de reservas tras varios intentos."""
+
+
+def _vigentes(data: dict, now: float) -> dict[str, dict]:
+    reservas = data.get("reservas") or {}
+    return {
+        owner: lease for owner, lease in reservas.items()
+        if isinstance(lease, dict) and float(lease.get("vence") or 0) > now
+    }
+
+
+def _modificar(lease_path: str, cambio: Callable[[dict[str, dict], float], Optional[int]]) -> Optional[int]:
+    """
+    Lee las reservas vigentes, aplica ``cambio`` (que las modifica en el
+    lugar y devuelve un resultado) y las guarda solo si nadie escribió en el
+    medio. Si ``cambio`` no modificó nada no se escribe.
+    """
+    for _ in range(MAX_CAS_ATTEMPTS):
+        data, generation = load_json_with_generation(lease_path)
+        now = time.time()
+        reservas = _vigentes(data, now)
+        antes = {owner: dict(lease) for owner, lease in reservas.items()}
+        resultado = cambio(reservas, now)
+        if reservas == antes and len(reservas) == len(data.get("reservas") or {}):
+            return resultado
+        try:
+            save_json_to_gcs(lease_path, {"reservas": reservas}, if_generation_match=generation or 0)
+        except GenerationMismatch:
+            continue
+        return resultado
+    raise LeaseConflictError(f"No se pudo actualizar {lease_path}. Intente nuevamente.")
+
+
+def reservar_fila(
+    lease_path: str,
+    owner: str,
+    primera_candidata: int,
+    ocupadas: Iterable[int] = (),
+    ttl_seconds: float = LEASE_TTL_SECONDS,
+) -> int:
+    """
+    Reserva para ``owner`` la primera fila desde ``primera_candidata`` que no
+    esté ocupada ni reservada por otro. Si ya tiene una reserva vigente y su
+    fila sigue libre la conserva (y la renueva si pasó la mitad del TTL).
+    """
+    ocupadas = set(ocupadas)
+
+    def cambio(reservas: dict[str, dict], now: float) -> int:
+        propia = reservas.get(owner)
+        if propia is not None and int(propia["fila"]) >= primera_candidata and int(propia["fila"]) not in ocupadas:
+            if float(propia["vence"]) - now < ttl_seconds / 2:
+                propia["vence"] = now + ttl_seconds
+            return int(propia["fila"])
+        tomadas = {int(lease["fila"]) for o, lease in reservas.items() if o != owner}
+        fila = primera_candidata
+        while fila in tomadas or fila in ocupadas:
+            fila += 1
+        reservas[owner] = {"fila": fila, "vence": now + ttl_seconds}
+        return fila
+
+    return _modificar(lease_path, cambio)
+
+
+def liberar(lease_path: str, *owners: str) -> None:
+    def cambio(reservas: dict[str, dict], now: float) -> None:
+        for owner in owners:
+            reservas.pop(owner, None)
+
+    if owners:
+        _modificar(lease_path, cambio)
+
+
+def filas_reservadas(lease_path: str, excluir_owner: Optional[str] = None) -> set[int]:
+    """Filas con reserva vigente de otros dueños (solo lectura)."""
+    data, _ = load_json_with_generation(lease_path)
+    return {
+        int(lease["fila"])
+        for owner, lease in _vigentes(data, time.time()).items()
+        if owner != excluir_owner
+    }
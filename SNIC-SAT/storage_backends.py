@@ -0,0 +1,632 @@
+"""Backends de almacenamiento detrás de ``gcs_utils``.
+
+``gcs_utils`` habla siempre con un ``StorageBackend``. En producción es
+``GCSBackend`` (bucket de Google Cloud Storage); para pruebas de carga y
+perfilado sin red se puede usar ``LocalDirectoryBackend`` o
+``MemoryBackend``, que emulan generaciones y precondiciones igual que GCS.
+``LatencyBackend`` envuelve a cualquiera de ellos y agrega una demora fija
+por operación para simular la latencia del bucket.
+
+``BlobInfo`` lleva el CRC32C (base64, como lo publica GCS) cuando el backend
+lo conoce, para verificar el contenido subido y descargado.
+"""
+from __future__ import annotations
+
+import base64
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Callable, NamedTuple, Optional
+
+import google_crc32c
+from google.api_core.exceptions import (
+    NotFound,
+    NotModified,
+    PreconditionFailed,
+    RequestRangeNotSatisfiable,
+    ServerError,
+    TooManyRequests,
+)
+
+try:
+    from google.cloud.storage.exceptions import DataCorruption
+except ImportError:  # google-cloud-storage 2.x
+    from google.resumable_media.common import DataCorruption
+
+# Por encima de este tamaño las subidas a GCS son reanudables y se envían en
+# partes; solo se reintenta la parte que falló. Debe ser múltiplo de 256 KiB.
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class BlobInfo(NamedTuple):
+    name: str
+    size: int
+    generation: int
+    updated: Optional[datetime]
+    crc32c: Optional[str] = None
+    md5_hash: Optional[str] = None
+
+
+class BlobNotFound(Exception):
+    """El blob pedido no existe."""
+
+
+class BlobNotModified(Exception):
+    """La generación pedida sigue siendo la vigente (lectura condicional)."""
+
+
+class GenerationMismatch(Exception):
+    """La precondición de generación de una escritura no se cumplió."""
+
+
+class IntegrityError(Exception):
+    """El contenido transferido no coincide con su checksum."""
+
+
+class TransientStorageError(Exception):
+    """Falla momentánea del almacenamiento; la operación puede reintentarse."""
+
+
+def crc32c_of_bytes(data: bytes) -> str:
+    return base64.b64encode(google_crc32c.Checksum(data).digest()).decode("ascii")
+
+
+def crc32c_of_file(fileobj: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    """CRC32C del archivo desde el inicio; deja la posición al inicio."""
+    checksum = google_crc32c.Checksum()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+        checksum.update(chunk)
+    fileobj.seek(0)
+    return base64.b64encode(checksum.digest()).decode("ascii")
+
+
+class StorageBackend:
+    """
+    Operaciones mínimas que necesita ``gcs_utils``.
+
+    Las generaciones son enteros que cambian con cada escritura del blob.
+    ``if_generation_match=0`` significa "solo si el blob no existe".
+    """
+
+    def stat(self, name: str) -> Optional[BlobInfo]:
+        raise NotImplementedError
+
+    def list_prefix(self, prefix: str) -> list[BlobInfo]:
+        """Blobs directamente bajo ``prefix`` (sin entrar en sub-carpetas)."""
+        raise NotImplementedError
+
+    def read(self, name: str, if_generation_not_match: Optional[int] = None) -> tuple[bytes, BlobInfo]:
+        raise NotImplementedError
+
+    def write(
+        self,
+        name: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+    ) -> BlobInfo:
+        raise NotImplementedError
+
+    def delete(self, name: str) -> None:
+        raise NotImplementedError
+
+    # Variantes por archivo: los backends que pueden hacerlo sin tener todo
+    # el contenido en memoria las reemplazan.
+
+    def read_into(
+        self,
+        name: str,
+        fileobj: BinaryIO,
+        if_generation_not_match: Optional[int] = None,
+    ) -> BlobInfo:
+        data, info = self.read(name, if_generation_not_match=if_generation_not_match)
+        fileobj.write(data)
+        return info
+
+    def write_from_file(
+        self,
+        name: str,
+        fileobj: BinaryIO,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+    ) -> BlobInfo:
+        return self.write(name, fileobj.read(), content_type=content_type, if_generation_match=if_generation_match)
+
+    # Blobs de solo agregado (registros): por defecto se reescribe el blob
+    # entero; GCS lo resuelve con un ``compose`` sin volver a subirlo.
+
+    def read_range(self, name: str, start: int) -> tuple[bytes, BlobInfo]:
+        """Contenido desde el byte ``start`` hasta el final."""
+        data, info = self.read(name)
+        return data[start:], info
+
+    def append(
+        self,
+        name: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+    ) -> BlobInfo:
+        """Agrega ``data`` al final del blob (0 = lo crea)."""
+        try:
+            previous, info = self.read(name)
+        except BlobNotFound:
+            previous, info = b"", None
+        _check_generation(info, if_generation_match)
+        generation = info.generation if info is not None else 0
+        return self.write(name, previous + data, content_type=content_type, if_generation_match=generation)
+
+
+def _check_generation(current: Optional[BlobInfo], if_generation_match: Optional[int]) -> None:
+    if if_generation_match is None:
+        return
+    current_generation = current.generation if current is not None else 0
+    if current_generation != if_generation_match:
+        raise GenerationMismatch(
+            f"Generación esperada {if_generation_match}, actual {current_generation}."
+        )
+
+
+def _is_direct_child(name: str, prefix: str) -> bool:
+    return name.startswith(prefix) and "/" not in name[len(prefix):]
+
+
+# =========================
+# Google Cloud Storage
+# =========================
+
+class GCSBackend(StorageBackend):
+    _TRANSIENT = (ServerError, TooManyRequests, OSError)
+
+    def __init__(self, client_factory: Callable[[], object], bucket_name: str):
+        self._client_factory = client_factory
+        self.bucket_name = bucket_name
+
+    def _bucket(self):
+        return self._client_factory().bucket(self.bucket_name)
+
+    @staticmethod
+    def _info(blob, size: Optional[int] = None) -> BlobInfo:
+        return BlobInfo(
+            blob.name,
+            int(size if size is not None else blob.size or 0),
+            int(blob.generation or 0),
+            blob.updated,
+            blob.crc32c,
+            blob.md5_hash,
+        )
+
+    def stat(self, name: str) -> Optional[BlobInfo]:
+        blob = self._bucket().get_blob(name)
+        return self._info(blob) if blob is not None else None
+
+    def list_prefix(self, prefix: str) -> list[BlobInfo]:
+        client = self._client_factory()
+        blobs = client.list_blobs(self.bucket_name, prefix=prefix or None, delimiter="/")
+        return [self._info(blob) for blob in blobs]
+
+    def read(self, name: str, if_generation_not_match: Optional[int] = None) -> tuple[bytes, BlobInfo]:
+        blob = self._bucket().blob(name)
+        try:
+            data = blob.download_as_bytes(if_generation_not_match=if_generation_not_match, checksum="crc32c")
+        except NotModified as exc:
+            raise BlobNotModified(name) from exc
+        except NotFound as exc:
+            raise BlobNotFound(name) from exc
+        except DataCorruption as exc:
+            raise IntegrityError(name) from exc
+        except self._TRANSIENT as exc:
+            raise TransientStorageError(name) from exc
+        return data, self._info(blob, len(data))
+
+    def write(
+        self,
+        name: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+    ) -> BlobInfo:
+        blob = self._bucket().blob(name)
+        try:
+            blob.upload_from_string(
+                data,
+                content_type=content_type,
+                if_generation_match=if_generation_match,
+                checksum="crc32c",
+            )
+        except PreconditionFailed as exc:
+            raise GenerationMismatch(name) from exc
+        except DataCorruption as exc:
+            raise IntegrityError(name) from exc
+        except self._TRANSIENT as exc:
+            raise TransientStorageError(name) from exc
+        return self._info(blob, len(data))
+
+    def read_into(
+        self,
+        name: str,
+        fileobj: BinaryIO,
+        if_generation_not_match: Optional[int] = None,
+    ) -> BlobInfo:
+        blob = self._bucket().blob(name)
+        start = fileobj.tell()
+        try:
+            blob.download_to_file(fileobj, if_generation_not_match=if_generation_not_match, checksum="crc32c")
+        except NotModified as exc:
+            raise BlobNotModified(name) from exc
+        except NotFound as exc:
+            raise BlobNotFound(name) from exc
+        except DataCorruption as exc:
+            raise IntegrityError(name) from exc
+        except self._TRANSIENT as exc:
+            raise TransientStorageError(name) from exc
+        return self._info(blob, fileobj.tell() - start)
+
+    def write_from_file(
+        self,
+        name: str,
+        fileobj: BinaryIO,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+    ) -> BlobInfo:
+        blob = self._bucket().blob(name)
+        start = fileobj.tell()
+        size = fileobj.seek(0, os.SEEK_END) - start
+        fileobj.seek(start)
+        if size > UPLOAD_CHUNK_SIZE:
+            # Subida reanudable en partes: la librería reintenta solo la parte fallida.
+            blob.chunk_size = UPLOAD_CHUNK_SIZE
+        try:
+            blob.upload_from_file(
+                fileobj,
+                size=size,
+                content_type=content_type,
+                if_generation_match=if_generation_match,
+                checksum="crc32c",
+            )
+        except PreconditionFailed as exc:
+            raise GenerationMismatch(name) from exc
+        except DataCorruption as exc:
+            raise IntegrityError(name) from exc
+        except self._TRANSIENT as exc:
+            raise TransientStorageError(name) from exc
+        return self._info(blob)
+
+    def read_range(self, name: str, start: int) -> tuple[bytes, BlobInfo]:
+        blob = self._bucket().blob(name)
+        try:
+            # Los checksums de GCS son del objeto entero: un rango no se puede verificar.
+            data = blob.download_as_bytes(start=start, checksum=None)
+        except RequestRangeNotSatisfiable:
+            info = self.stat(name)
+            if info is None:
+                raise BlobNotFound(name)
+            return b"", info
+        except NotFound as exc:
+            raise BlobNotFound(name) from exc
+        except self._TRANSIENT as exc:
+            raise TransientStorageError(name) from exc
+        return data, self._info(blob, start + len(data))
+
+    def append(
+        self,
+        name: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+    ) -> BlobInfo:
+        if not if_generation_match:
+            return self.write(name, data, content_type=content_type, if_generation_match=if_generation_match)
+        bucket = self._bucket()
+        # La parte nueva se sube aparte y se concatena en el servidor.
+        part = bucket.blob(f"{name}.part-{uuid.uuid4().hex}")
+        target = bucket.blob(name)
+        target.content_type = content_type
+        try:
+            part.upload_from_string(data, content_type=content_type, checksum="crc32c")
+            target.compose([bucket.blob(name), part], if_generation_match=if_generation_match)
+        except PreconditionFailed as exc:
+            raise GenerationMismatch(name) from exc
+        except NotFound as exc:
+            raise GenerationMismatch(name) from exc
+        except DataCorruption as exc:
+            raise IntegrityError(name) from exc
+        except self._TRANSIENT as exc:
+            raise TransientStorageError(name) from exc
+        finally:
+            try:
+                part.delete()
+            except Exception:
+                pass
+        return self._info(target)
+
+    def delete(self, name: str) -> None:
+        try:
+            self._bucket().blob(name).delete()
+        except NotFound as exc:
+            raise BlobNotFound(name) from exc
+
+
+# =========================
+# Memoria (pruebas / benchmarks)
+# =========================
+
+class MemoryBackend(StorageBackend):
+    def __init__(self):
+        self._blobs: dict[str, tuple[bytes, BlobInfo]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def stat(self, name: str) -> Optional[BlobInfo]:
+        with self._lock:
+            entry = self._blobs.get(name)
+        return entry[1] if entry is not None else None
+
+    def list_prefix(self, prefix: str) -> list[BlobInfo]:
+        with self._lock:
+            return [info for name, (_, info) in self._blobs.items() if _is_direct_child(name, prefix)]
+
+    def read(self, name: str, if_generation_not_match: Optional[int] = None) -> tuple[bytes, BlobInfo]:
+        with self._lock:
+            entry = self._blobs.get(name)
+        if entry is None:
+            raise BlobNotFound(name)
+        if if_generation_not_match is not None and entry[1].generation == if_generation_not_match:
+            raise BlobNotModified(name)
+        return entry
+
+    def write(
+        self,
+        name: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+    ) -> BlobInfo:
+        data = bytes(data)
+        with self._lock:
+            current = self._blobs.get(name)
+            _check_generation(current[1] if current is not None else None, if_generation_match)
+            self._generation += 1
+            info = BlobInfo(name, len(data), self._generation, datetime.now(timezone.utc), crc32c_of_bytes(data))
+            self._blobs[name] = (data, info)
+        return info
+
+    def delete(self, name: str) -> None:
+        with self._lock:
+            if self._blobs.pop(name, None) is None:
+                raise BlobNotFound(name)
+
+
+# =========================
+# Directorio local (pruebas / benchmarks)
+# =========================
+
+class LocalDirectoryBackend(StorageBackend):
+    """
+    Guarda cada blob como archivo bajo ``root``. La generación es el
+    ``st_mtime_ns`` del archivo, forzado a crecer en cada escritura.
+    Las precondiciones son atómicas dentro del proceso.
+    """
+
+    _TMP_SUFFIX = ".tmp-write"
+
+    def __init__(self, root: str):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> Path:
+        path = (self.root / name).resolve()
+        if self.root not in path.parents:
+            raise ValueError(f"Nombre de blob inválido: {name!r}")
+        return path
+
+    def _info(self, name: str, path: Path) -> Optional[BlobInfo]:
+        try:
+            st_result = path.stat()
+        except FileNotFoundError:
+            return None
+        if not path.is_file():
+            return None
+        updated = datetime.fromtimestamp(st_result.st_mtime, tz=timezone.utc)
+        return BlobInfo(name, st_result.st_size, st_result.st_mtime_ns, updated)
+
+    def stat(self, name: str) -> Optional[BlobInfo]:
+        return self._info(name, self._path(name))
+
+    def list_prefix(self, prefix: str) -> list[BlobInfo]:
+        folder, _, start = prefix.rpartition("/")
+        directory = self.root / folder if folder else self.root
+        if not directory.is_dir():
+            return []
+        infos = []
+        for entry in directory.iterdir():
+            if not entry.is_file() or entry.name.endswith(self._TMP_SUFFIX) or not entry.name.startswith(start):
+                continue
+            name = f"{folder}/{entry.name}" if folder else entry.name
+            info = self._info(name, entry)
+            if info is not None:
+                infos.append(info)
+        return infos
+
+    def read(self, name: str, if_generation_not_match: Optional[int] = None) -> tuple[bytes, BlobInfo]:
+        path = self._path(name)
+        with self._lock:
+            info = self._info(name, path)
+            if info is None:
+                raise BlobNotFound(name)
+            if if_generation_not_match is not None and info.generation == if_generation_not_match:
+                raise BlobNotModified(name)
+            data = path.read_bytes()
+        return data, info
+
+    def read_into(
+        self,
+        name: str,
+        fileobj: BinaryIO,
+        if_generation_not_match: Optional[int] = None,
+    ) -> BlobInfo:
+        path = self._path(name)
+        with self._lock:
+            info = self._info(name, path)
+            if info is None:
+                raise BlobNotFound(name)
+            if if_generation_not_match is not None and info.generation == if_generation_not_match:
+                raise BlobNotModified(name)
+            with open(path, "rb") as fh:
+                shutil.copyfileobj(fh, fileobj)
+        return info
+
+    def write(
+        self,
+        name: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+    ) -> BlobInfo:
+        return self._write(name, lambda fh: fh.write(data), if_generation_match)
+
+    def write_from_file(
+        self,
+        name: str,
+        fileobj: BinaryIO,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+    ) -> BlobInfo:
+        return self._write(name, lambda fh: shutil.copyfileobj(fileobj, fh), if_generation_match)
+
+    def _write(self, name: str, fill: Callable[[BinaryIO], object], if_generation_match: Optional[int]) -> BlobInfo:
+        path = self._path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + self._TMP_SUFFIX)
+        with self._lock:
+            current = self._info(name, path)
+            _check_generation(current, if_generation_match)
+            with open(tmp_path, "wb") as fh:
+                fill(fh)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp_path, path)
+            if current is not None and path.stat().st_mtime_ns <= current.generation:
+                next_generation = current.generation + 1
+                os.utime(path, ns=(next_generation, next_generation))
+            info = self._info(name, path)
+        assert info is not None
+        return info
+
+    def delete(self, name: str) -> None:
+        with self._lock:
+            try:
+                self._path(name).unlink()
+            except FileNotFoundError as exc:
+                raise BlobNotFound(name) from exc
+
+
+# =========================
+# Latencia inyectada
+# =========================
+
+class LatencyBackend(StorageBackend):
+    """Agrega ``latency_seconds`` antes de cada operación del backend envuelto."""
+
+    def __init__(self, inner: StorageBackend, latency_seconds: float):
+        self.inner = inner
+        self.latency_seconds = latency_seconds
+
+    def _wait(self) -> None:
+        if self.latency_seconds > 0:
+            time.sleep(self.latency_seconds)
+
+    def stat(self, name: str) -> Optional[BlobInfo]:
+        self._wait()
+        return self.inner.stat(name)
+
+    def list_prefix(self, prefix: str) -> list[BlobInfo]:
+        self._wait()
+        return self.inner.list_prefix(prefix)
+
+    def read(self, name: str, if_generation_not_match: Optional[int] = None) -> tuple[bytes, BlobInfo]:
+        self._wait()
+        return self.inner.read(name, if_generation_not_match=if_generation_not_match)
+
+    def write(
+        self,
+        name: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+    ) -> BlobInfo:
+        self._wait()
+        return self.inner.write(name, data, content_type=content_type, if_generation_match=if_generation_match)
+
+    def read_into(
+        self,
+        name: str,
+        fileobj: BinaryIO,
+        if_generation_not_match: Optional[int] = None,
+    ) -> BlobInfo:
+        self._wait()
+        return self.inner.read_into(name, fileobj, if_generation_not_match=if_generation_not_match)
+
+    def write_from_file(
+        self,
+        name: str,
+        fileobj: BinaryIO,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+    ) -> BlobInfo:
+        self._wait()
+        return self.inner.write_from_file(
+            name, fileobj, content_type=content_type, if_generation_match=if_generation_match
+        )
+
+    def read_range(self, name: str, start: int) -> tuple[bytes, BlobInfo]:
+        self._wait()
+        return self.inner.read_range(name, start)
+
+    def append(
+        self,
+        name: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+    ) -> BlobInfo:
+        self._wait()
+        return self.inner.append(name, data, content_type=content_type, if_generation_match=if_generation_match)
+
+    def delete(self, name: str) -> None:
+        self._wait()
+        self.inner.delete(name)
+
+
+BACKEND_KINDS = ("gcs", "local", "memory")
+
+
+def create_backend(
+    kind: str,
+    *,
+    gcs_client_factory: Optional[Callable[[], object]] = None,
+    bucket_name: str = "",
+    local_dir: str = ".storage-local",
+    latency_ms: float = 0,
+) -> StorageBackend:
+    kind = (kind or "gcs").strip().lower()
+    if kind == "gcs":
+        if gcs_client_factory is None:
+            raise ValueError("El backend 'gcs' necesita un cliente de Cloud Storage.")
+        backend: StorageBackend = GCSBackend(gcs_client_factory, bucket_name)
+    elif kind == "local":
+        backend = LocalDirectoryBackend(local_dir)
+    elif kind == "memory":
+        backend = MemoryBackend()
+    else:
+        raise ValueError(f"Backend de almacenamiento desconocido: {kind!r} (opciones: {', '.join(BACKEND_KINDS)})")
+
+    if latency_ms and float(latency_ms) > 0:
+        backend = LatencyBackend(backend, float(latency_ms) / 1000.0)
+    return backend
@@ -0,0 +1,283 @@
+"""Medición de las operaciones de almacenamiento por rerun de Streamlit.
+
+``gcs_utils`` envuelve cada operación (existencia, descarga, subida, JSON)
+en ``operation()``. Cada medición guarda desde dónde se llamó, el blob, los
+bytes transferidos y la latencia, y se acumula en:
+
+- la traza del rerun actual de la sesión (``begin_rerun()`` la reinicia);
+  un hilo de fondo que trabaja para una sesión la usa con ``on_behalf_of()``,
+- una ventana global por tipo de operación para p50/p95,
+- el log ``storage_metrics`` como una línea JSON por operación.
+
+Las operaciones anidadas (p. ej. la descarga dentro de ``load_json``) se
+suman a la operación externa y se registran una sola vez.
+
+Las caches en memoria del proceso se anotan con ``register_cache()`` y el
+panel muestra cuánto ocupan.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+import streamlit as st
+
+try:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:  # versiones viejas de Streamlit
+    get_script_run_ctx = lambda suppress_warning=False: None  # noqa: E731
+
+logger = logging.getLogger("storage_metrics")
+
+ROLLING_WINDOW = 500
+_TRACE_KEY = "_storage_trace"
+_PREV_TRACE_KEY = "_storage_trace_prev"
+
+# Módulos que no cuentan como "lugar de la llamada".
+_INTERNAL_FILES = {
+    "gcs_utils.py",
+    "storage_backends.py",
+    "storage_metrics.py",
+    "workbook_writes.py",
+    "contextlib.py",
+}
+
+_local = threading.local()
+_rolling: dict[str, deque] = {}
+_rolling_lock = threading.Lock()
+_caches: dict[str, Callable[[], dict[str, int]]] = {}
+
+
+def _configure_logger() -> None:
+    level = os.getenv("STORAGE_METRICS_LOG", "").strip().upper() or "INFO"
+    if level == "OFF":
+        logger.disabled = True
+        return
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+    # Un valor que no es un nivel de logging (p. ej. "on") no debe impedir
+    # que arranque la app: se usa INFO y se avisa.
+    if isinstance(logging.getLevelName(level), int):
+        logger.setLevel(level)
+    else:
+        logger.setLevel(logging.INFO)
+        logger.warning("STORAGE_METRICS_LOG=%r no es un nivel válido; se usa INFO", level)
+
+
+_configure_logger()
+
+
+def _call_site() -> str:
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename not in _INTERNAL_FILES:
+            return f"{filename}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+def _session_trace() -> Optional[dict[str, Any]]:
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return None
+    return st.session_state.get(_TRACE_KEY)
+
+
+def caller() -> dict[str, Any]:
+    """
+    Traza y lugar de la llamada actuales, para que un hilo de fondo que
+    trabaja por este llamador le asigne sus operaciones (``on_behalf_of``).
+    """
+    return {"trace": _session_trace(), "site": _call_site()}
+
+
+@contextmanager
+def on_behalf_of(callers: list[dict[str, Any]]) -> Iterator[None]:
+    """
+    Las operaciones de este hilo se suman a las trazas de ``callers`` (p. ej.
+    un guardado en grupo cuenta en el rerun de cada sesión del lote).
+    """
+    previous = getattr(_local, "callers", None)
+    _local.callers = callers
+    try:
+        yield
+    finally:
+        _local.callers = previous
+
+
+def _traces() -> list[dict[str, Any]]:
+    trace = _session_trace()
+    if trace is not None:
+        return [trace]
+    callers = getattr(_local, "callers", None) or []
+    return [c["trace"] for c in callers if c["trace"] is not None]
+
+
+def _site() -> str:
+    callers = getattr(_local, "callers", None)
+    if _session_trace() is None and callers:
+        return ", ".join(dict.fromkeys(c["site"] for c in callers))
+    return _call_site()
+
+
+def rerun_id() -> Optional[int]:
+    """Número del rerun actual de la sesión (None fuera de una sesión)."""
+    trace = _session_trace()
+    return trace["rerun"] if trace is not None else None
+
+
+def begin_rerun() -> None:
+    """Abre una traza nueva para este rerun de la sesión."""
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return
+    previous = st.session_state.get(_TRACE_KEY)
+    if previous is not None:
+        st.session_state[_PREV_TRACE_KEY] = previous
+    st.session_state[_TRACE_KEY] = {
+        "rerun": (previous or {}).get("rerun", 0) + 1,
+        "started": time.time(),
+        "ops": [],
+    }
+
+
+def _record(entry: dict[str, Any]) -> None:
+    with _rolling_lock:
+        window = _rolling.get(entry["op"])
+        if window is None:
+            window = _rolling[entry["op"]] = deque(maxlen=ROLLING_WINDOW)
+        window.append(entry["ms"])
+
+    traces = _traces()
+    for trace in traces:
+        trace["ops"].append(entry)
+    if len(traces) == 1:
+        entry = dict(entry, rerun=traces[0]["rerun"])
+    elif traces:
+        entry = dict(entry, rerun=[trace["rerun"] for trace in traces])
+
+    if not logger.disabled:
+        logger.info(json.dumps({"event": "storage_op", **entry}, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def operation(op: str, blob: str) -> Iterator[dict[str, Any]]:
+    """
+    Mide una operación. El llamador completa ``entry["bytes"]`` y, si
+    corresponde, ``entry["cache"]`` ("hit", "miss", "not_modified").
+    """
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    entry: dict[str, Any] = {"op": op, "blob": blob, "bytes": 0, "cache": None, "error": None}
+    if not stack:
+        entry["site"] = _site()
+    stack.append(entry)
+    start = time.perf_counter()
+    try:
+        yield entry
+    except BaseException as exc:
+        entry["error"] = type(exc).__name__
+        raise
+    finally:
+        stack.pop()
+        if stack:
+            outer = stack[-1]
+            outer["bytes"] += entry["bytes"]
+            outer["cache"] = outer["cache"] or entry["cache"]
+        else:
+            entry["ms"] = round((time.perf_counter() - start) * 1000, 2)
+            _record(entry)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def rolling_summary() -> list[dict[str, Any]]:
+    with _rolling_lock:
+        snapshot = {op: list(window) for op, window in _rolling.items()}
+    return [
+        {
+            "operación": op,
+            "muestras": len(values),
+            "p50 ms": _percentile(values, 50),
+            "p95 ms": _percentile(values, 95),
+        }
+        for op, values in sorted(snapshot.items())
+        if values
+    ]
+
+
+def register_cache(name: str, usage: Callable[[], dict[str, int]]) -> None:
+    """``usage()`` devuelve ``{"entradas", "bytes", "máximo"}`` de la cache."""
+    _caches[name] = usage
+
+
+def cache_summary() -> list[dict[str, Any]]:
+    rows = []
+    for name, usage in sorted(_caches.items()):
+        data = usage()
+        rows.append(
+            {
+                "cache": name,
+                "entradas": data["entradas"],
+                "MiB": round(data["bytes"] / 1024 / 1024, 2),
+                "máximo MiB": round(data["máximo"] / 1024 / 1024, 2),
+            }
+        )
+    return rows
+
+
+def _trace_rows(trace: Optional[dict[str, Any]]) -> list[dict[str, Any]]:
+    if not trace:
+        return []
+    return [
+        {
+            "operación": e["op"],
+            "blob": e["blob"],
+            "bytes": e["bytes"],
+            "ms": e["ms"],
+            "cache": e["cache"] or "",
+            "error": e["error"] or "",
+            "origen": e.get("site", ""),
+        }
+        for e in trace["ops"]
+    ]
+
+
+def _render_trace(title: str, trace: Optional[dict[str, Any]]) -> None:
+    rows = _trace_rows(trace)
+    total_ms = sum(r["ms"] for r in rows)
+    total_bytes = sum(r["bytes"] for r in rows)
+    st.markdown(f"**{title}:** {len(rows)} operaciones · {total_bytes / 1024:.1f} KiB · {total_ms:.0f} ms")
+    if rows:
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+
+
+def render_storage_panel() -> None:
+    """Panel plegable (solo administradores) con el costo de almacenamiento."""
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return
+    with st.expander("⏱️ Rendimiento de almacenamiento", expanded=False):
+        _render_trace("Rerun actual (hasta este punto)", st.session_state.get(_TRACE_KEY))
+        _render_trace("Rerun anterior", st.session_state.get(_PREV_TRACE_KEY))
+        resumen = rolling_summary()
+        if resumen:
+            st.markdown(f"**Latencias recientes (últimas {ROLLING_WINDOW} por operación)**")
+            st.dataframe(resumen, use_container_width=True, hide_index=True)
+        caches = cache_summary()
+        if caches:
+            st.markdown("**Caches en memoria del proceso**")
+            st.dataframe(caches, use_container_width=True, hide_index=True)
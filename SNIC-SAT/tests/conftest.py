@@ -0,0 +1,124 @@
+"""Configuración común: cada prueba usa un ``MemoryBackend`` nuevo."""
+import io
+import os
+import re
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+from openpyxl import Workbook
+from openpyxl.styles import Font
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("STORAGE_METRICS_LOG", "off")
+
+_SNICSAT_DIR = Path(__file__).resolve().parent.parent
+for _path in (_SNICSAT_DIR, _SNICSAT_DIR.parent):
+    if str(_path) not in sys.path:
+        sys.path.insert(0, str(_path))
+
+import gcs_utils  # noqa: E402
+from storage_backends import MemoryBackend  # noqa: E402
+from xlsx_zip import NS_MAIN  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def memoria(monkeypatch):
+    """Bucket en memoria vacío y caches de ``gcs_utils`` sin datos de otras pruebas."""
+    backend = MemoryBackend()
+    monkeypatch.setattr(gcs_utils, "_get_backend", lambda: backend)
+    monkeypatch.setattr(gcs_utils, "_MANIFEST", gcs_utils._BucketManifest(gcs_utils.MANIFEST_TTL_SECONDS))
+    monkeypatch.setattr(gcs_utils, "_BYTE_CACHE", gcs_utils._BlobByteCache(gcs_utils.BYTE_CACHE_MAX_BYTES))
+    return backend
+
+
+def _como_excel(data: bytes) -> bytes:
+    """
+    Pasa el libro que escribe openpyxl a la forma que usa Excel: textos en
+    ``sharedStrings.xml`` (el texto ``"-"`` queda como cadena vacía, que
+    openpyxl no escribe) y la fórmula de B2:B3 como fórmula compartida.
+    """
+    origen = zipfile.ZipFile(io.BytesIO(data))
+    hoja = origen.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    textos: list[str] = []
+
+    def compartir(match: re.Match) -> str:
+        textos.append("" if match.group(2) == "-" else match.group(2))
+        return f'<c r="{match.group(1)}" t="s"><v>{len(textos) - 1}</v></c>'
+
+    hoja = re.sub(r'<c r="([A-Z]+\d+)" t="inlineStr"><is><t>([^<]*)</t></is></c>', compartir, hoja)
+    hoja = hoja.replace("<f>A2*2</f>", '<f t="shared" ref="B2:B3" si="0">A2*2</f>')
+    hoja = hoja.replace("<f>A3*2</f>", '<f t="shared" si="0"/>')
+    sst = "".join(f"<si><t>{texto}</t></si>" for texto in textos)
+    partes = {
+        "xl/worksheets/sheet1.xml": hoja.encode("utf-8"),
+        "xl/sharedStrings.xml": (
+            f'<sst xmlns="{NS_MAIN}" count="{len(textos)}" uniqueCount="{len(textos)}">{sst}</sst>'
+        ).encode("utf-8"),
+        "xl/_rels/workbook.xml.rels": origen.read("xl/_rels/workbook.xml.rels").replace(
+            b"</Relationships>",
+            b'<Relationship Id="rIdSst" Target="sharedStrings.xml" Type="http://schemas.openxmlformats.org/'
+            b'officeDocument/2006/relationships/sharedStrings"/></Relationships>',
+        ),
+        "[Content_Types].xml": origen.read("[Content_Types].xml").replace(
+            b"</Types>",
+            b'<Override PartName="/xl/sharedStrings.xml" ContentType="application/'
+            b'vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/></Types>',
+        ),
+    }
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as destino:
+        for nombre in origen.namelist():
+            destino.writestr(nombre, partes.pop(nombre, None) or origen.read(nombre))
+        for nombre, contenido in partes.items():
+            destino.writestr(nombre, contenido)
+    return salida.getvalue()
+
+
+@pytest.fixture
+def libro_excel() -> bytes:
+    """
+    Hoja "Datos" con cadenas y fórmula compartidas:
+
+    ====  =====  ======  =======
+    fila  A      B       C
+    ====  =====  ======  =======
+    1     Fecha  Doble   Texto
+    2     1      =A2*2   uno
+    3     2      =A3*2   (vacío)
+    5                    cinco
+    ====  =====  ======  =======
+    """
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Datos"
+    ws.append(["Fecha", "Doble", "Texto"])
+    ws.append([1, "=A2*2", "uno"])
+    ws.append([2, "=A3*2", "-"])
+    ws["C5"] = "cinco"
+    ws["A2"].font = Font(bold=True)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return _como_excel(buffer.getvalue())
+
+
+@pytest.fixture
+def subir_planilla():
+    """
+    Sube una planilla SNIC-SAT de prueba: encabezado en las filas 1-2 y
+    ``llenas`` filas con fecha (columna C) desde la fila 3.
+    """
+    def subir(excel_path: str, llenas: int = 0) -> None:
+        wb = Workbook()
+        ws = wb.active
+        ws["A1"], ws["C1"], ws["X1"] = "N°", "Fecha denuncia", "Delito"
+        for fila in range(3, 3 + llenas):
+            ws[f"A{fila}"] = f"=ROW()-2"
+            ws[f"C{fila}"] = "01/01/2026"
+            ws[f"X{fila}"] = "previo"
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        gcs_utils.upload_blob_bytes(excel_path, buffer.getvalue())
+
+    return subir
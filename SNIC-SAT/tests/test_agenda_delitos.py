@@ -0,0 +1,160 @@
+import datetime
+import json
+import uuid
+
+import pytest
+
+import agenda_delitos
+import gcs_utils
+
+
+@pytest.fixture(autouse=True)
+def sin_cache(monkeypatch):
+    # Los JSON ya leídos se validan por generación, que en cada bucket nuevo vuelve a empezar.
+    monkeypatch.setattr(agenda_delitos, "_parseados", {})
+    monkeypatch.setattr(agenda_delitos, "_indices", {})
+
+
+def _slot(nombre: str, cargados: int = 0, preventivo=None) -> dict:
+    slot_id = uuid.uuid4().hex
+    registro = {"id": slot_id, "nombre": nombre, "plan": 1, "cargados": cargados}
+    if preventivo:
+        registro["preventivo"] = preventivo
+    return {slot_id: registro}
+
+
+def _dias_v1() -> dict:
+    """Un mes en el formato anterior: un dict por slot con ids uuid."""
+    return {
+        "2026-01-05": {"delitos": {**_slot("Robo"), **_slot("Hurto", 1, "12/26"), **_slot("Robo", 1)}},
+        "2026-01-02": {"delitos": {**_slot("Amenazas")}},
+    }
+
+
+def _delitos(dias: dict) -> dict:
+    """Delitos de cada día sin los ids (se renumeran al pasar al formato compacto)."""
+    return {
+        key: [(d["nombre"], d["cargados"], d.get("preventivo")) for d in entry["delitos"].values()]
+        for key, entry in dias.items()
+    }
+
+
+def test_codec_v1_v2_v1():
+    v1 = _dias_v1()
+
+    v2 = agenda_delitos._codificar_mes(v1)
+    decodificado = agenda_delitos._decodificar_mes(json.loads(json.dumps(v2)))
+
+    assert v2["v"] == agenda_delitos.AGENDA_FORMATO
+    assert v2["dias"]["2026-01-05"] == {
+        "n": ["Robo", "Hurto"],
+        "s": [[1, 0], [2, 1], [3, 0]],
+        "c": 4,
+        "k": 0b110,
+        "p": {"2": "12/26"},
+    }
+    assert _delitos(decodificado) == _delitos(v1)
+    assert list(decodificado["2026-01-05"]["delitos"]) == ["1", "2", "3"]
+    # Ya con ids cortos, volver a codificar da lo mismo (y leer un mes sin versión, también).
+    assert agenda_delitos._codificar_mes(decodificado) == v2
+    assert agenda_delitos._decodificar_mes(v1) == decodificado
+
+
+def test_migracion_del_archivo_unico():
+    gcs_utils.save_json_to_gcs(agenda_delitos.AGENDA_PATH, {"comisaria 1": _dias_v1()})
+    fecha = datetime.date(2026, 1, 5)
+
+    assert agenda_delitos.obtener_dias_planificados("comisaria 1") == [datetime.date(2026, 1, 2), fecha]
+    assert agenda_delitos.obtener_primer_dia_pendiente("comisaria 1") == datetime.date(2026, 1, 2)
+
+    shard, _ = gcs_utils.load_json_with_generation("agenda_delitos/comisaria 1/2026-01.json")
+    assert shard["v"] == agenda_delitos.AGENDA_FORMATO
+    detalle = agenda_delitos.obtener_detalle_dia("comisaria 1", fecha)
+    assert [(d["nombre"], d["cargados"], d["preventivo"]) for d in detalle.values()] == [
+        ("Robo", 0, None), ("Hurto", 1, "12/26"), ("Robo", 1, None),
+    ]
+
+    assert agenda_delitos.asignar_delito("comisaria 1", fecha, "Estafa", 2) == (True, None)
+    assert list(agenda_delitos.obtener_detalle_dia("comisaria 1", fecha)) == ["1", "2", "3", "4", "5"]
+    # El respaldo vuelve al formato de la API con los mismos delitos.
+    respaldo = agenda_delitos._agenda_completa()["comisaria 1"]
+    assert _delitos(respaldo)["2026-01-05"][3:] == [("Estafa", 0, None), ("Estafa", 0, None)]
+    assert agenda_delitos._codificar_mes(respaldo) == gcs_utils.load_json_with_generation(
+        "agenda_delitos/comisaria 1/2026-01.json"
+    )[0]
+
+
+def test_modificar_mes_reintenta_ante_otra_escritura(monkeypatch):
+    fecha = datetime.date(2026, 1, 5)
+    assert agenda_delitos.asignar_delito("comisaria 1", fecha, "Robo", 1) == (True, None)
+    guardar = agenda_delitos._guardar_dias
+    intentos = []
+
+    def guardar_con_competencia(path, dias, if_generation_match=None):
+        if not intentos:
+            # Otra sesión asigna un delito entre la lectura y la escritura.
+            actuales, _ = agenda_delitos._leer_dias(path)
+            otros = json.loads(json.dumps(actuales))
+            otros["2026-01-05"]["delitos"]["9"] = {"id": "9", "nombre": "Hurto", "plan": 1, "cargados": 0}
+            guardar(path, otros)
+        intentos.append(if_generation_match)
+        return guardar(path, dias, if_generation_match=if_generation_match)
+
+    monkeypatch.setattr(agenda_delitos, "_guardar_dias", guardar_con_competencia)
+
+    assert agenda_delitos.asignar_delito("comisaria 1", fecha, "Estafa", 1) == (True, None)
+
+    assert len(intentos) == 2
+    nombres = [d["nombre"] for d in agenda_delitos.obtener_detalle_dia("comisaria 1", fecha).values()]
+    assert sorted(nombres) == ["Estafa", "Hurto", "Robo"]
+
+
+def test_restaurar_respaldo_escribe_sobre_la_version_leida(monkeypatch):
+    enero, febrero = datetime.date(2026, 1, 5), datetime.date(2026, 2, 3)
+    agenda_delitos.asignar_delito("comisaria 1", enero, "Robo", 1)
+    respaldo = json.loads(json.dumps(agenda_delitos._agenda_completa()))
+    agenda_delitos.asignar_delito("comisaria 1", enero, "Hurto", 1)
+    agenda_delitos.asignar_delito("comisaria 1", febrero, "Estafa", 1)
+    assert agenda_delitos.obtener_dias_planificados("comisaria 1") == [enero, febrero]
+    guardar = agenda_delitos._guardar_dias
+    condiciones = []
+
+    def guardar_registrando(path, dias, if_generation_match=None):
+        condiciones.append(if_generation_match)
+        return guardar(path, dias, if_generation_match=if_generation_match)
+
+    monkeypatch.setattr(agenda_delitos, "_guardar_dias", guardar_registrando)
+
+    agenda_delitos._restaurar_agenda(respaldo)
+
+    assert len(condiciones) == 2 and all(condiciones)
+    assert [d["nombre"] for d in agenda_delitos.obtener_detalle_dia("comisaria 1", enero).values()] == ["Robo"]
+    # Febrero no estaba en el respaldo: queda vacío.
+    assert agenda_delitos.obtener_detalle_dia("comisaria 1", febrero) == {}
+    assert agenda_delitos.obtener_dias_planificados("comisaria 1") == [enero]
+
+
+def test_cambios_no_releen_el_manifiesto(monkeypatch):
+    fecha = datetime.date(2026, 1, 5)
+    agenda_delitos.asignar_delito("comisaria 1", fecha, "Robo", 1)
+    lecturas = []
+    monkeypatch.setattr(agenda_delitos, "_manifiesto", lambda: lecturas.append(1) or {})
+
+    assert agenda_delitos.asignar_delito("comisaria 1", fecha, "Hurto", 1) == (True, None)
+    assert agenda_delitos.asignar_delito("comisaria 1", datetime.date(2026, 1, 6), "Hurto", 1) == (True, None)
+
+    assert lecturas == []
+
+
+def test_restaurar_rearma_un_manifiesto_danado():
+    fecha = datetime.date(2026, 1, 5)
+    agenda_delitos.asignar_delito("comisaria 1", fecha, "Robo", 1)
+    respaldo = json.loads(json.dumps(agenda_delitos._agenda_completa()))
+    gcs_utils.upload_blob_bytes(agenda_delitos.AGENDA_MANIFEST_PATH, b"{roto")
+    assert agenda_delitos._manifiesto_danado()
+    assert agenda_delitos.obtener_dias_planificados("comisaria 1") == []
+
+    agenda_delitos._restaurar_agenda(respaldo)
+
+    assert not agenda_delitos._manifiesto_danado()
+    assert agenda_delitos.obtener_dias_planificados("comisaria 1") == [fecha]
@@ -0,0 +1,81 @@
+import io
+
+from openpyxl import load_workbook
+
+import gcs_utils
+import registro_log
+import registro_snic
+
+PLANILLA = "snic/comisaria 1.xlsx"
+
+
+def _registro(fecha: str, **extra) -> dict:
+    registro = registro_snic.armar_registro(
+        PLANILLA,
+        comisaria="comisaria 1",
+        hecho="hecho",
+        delito="ROBO",
+        actuacion="actuación",
+        fecha_denuncia_txt=fecha,
+        fecha_hecho_txt=fecha,
+        hora_hecho_txt="10:00",
+        hora_fin_txt="11:00",
+        preventivo="1/26",
+        denunciante="denunciante",
+        motivo="motivo",
+    )
+    registro.update(extra)
+    return registro
+
+
+def _libro(excel_path: str = PLANILLA):
+    return load_workbook(io.BytesIO(gcs_utils.download_blob_bytes(excel_path)))
+
+
+def _fechas(excel_path: str = PLANILLA) -> list:
+    ws = _libro(excel_path).active
+    valores = (ws[f"C{fila}"].value for fila in range(registro_snic.FILA_INICIAL, ws.max_row + 1))
+    return [valor for valor in valores if valor is not None]
+
+
+def test_materializar_aplica_cada_linea_una_vez(subir_planilla):
+    subir_planilla(PLANILLA, llenas=1)
+    registro_log.agregar_registro(_registro("02/01/2026"))
+    registro_log.agregar_registro(_registro("03/01/2026"))
+
+    assert registro_log.pendientes(PLANILLA) > 0
+    assert registro_log.materializar(PLANILLA) == 2
+    assert registro_log.materializar(PLANILLA) == 0
+
+    log_size = gcs_utils.stat_blob(registro_log.registro_log_path(PLANILLA)).size
+    assert registro_log.offset_proyectado(_libro()) == log_size
+    assert registro_log.pendientes(PLANILLA) == 0
+    assert _fechas() == ["01/01/2026", "02/01/2026", "03/01/2026"]
+
+    registro_log.agregar_registro(_registro("04/01/2026"))
+    assert registro_log.materializar(PLANILLA) == 1
+    assert _fechas()[-1] == "04/01/2026"
+
+
+def test_materializar_ignora_una_linea_a_medio_escribir(subir_planilla):
+    subir_planilla(PLANILLA)
+    registro_log.agregar_registro(_registro("02/01/2026"))
+    gcs_utils.append_blob_bytes(registro_log.registro_log_path(PLANILLA), b'{"id": "a medias"')
+
+    assert registro_log.materializar(PLANILLA) == 1
+    assert registro_log.pendientes(PLANILLA) == len(b'{"id": "a medias"')
+
+
+def test_materializar_pasa_lo_que_no_entra_al_volumen_siguiente(subir_planilla):
+    subir_planilla(PLANILLA, llenas=registro_snic.FILA_LIMITE - registro_snic.FILA_INICIAL - 1)
+    for dia in (2, 3, 4):
+        registro_log.agregar_registro(_registro(f"0{dia}/02/2026"))
+
+    assert registro_log.materializar(PLANILLA) == 3
+
+    assert _fechas()[-1] == "02/02/2026"
+    assert len(_fechas()) == registro_snic.FILA_LIMITE - registro_snic.FILA_INICIAL
+    volumen_2 = "snic/comisaria 1 - vol 2.xlsx"
+    assert _fechas(volumen_2) == ["03/02/2026", "04/02/2026"]
+    assert registro_log.pendientes(PLANILLA) == 0
+    assert registro_log.pendientes(volumen_2) == 0
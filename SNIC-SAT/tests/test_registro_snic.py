@@ -0,0 +1,108 @@
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+import gcs_utils
+import registro_snic
+
+PLANILLA = "snic/comisaria 1.xlsx"
+
+
+def _registro(**extra) -> dict:
+    registro = registro_snic.armar_registro(
+        PLANILLA,
+        comisaria="comisaria 1",
+        hecho="hecho",
+        delito="ROBO",
+        actuacion="actuación",
+        fecha_denuncia_txt="05/01/2026",
+        fecha_hecho_txt="04/01/2026",
+        hora_hecho_txt="10:00",
+        hora_fin_txt="11:00",
+        preventivo='"12/26"',
+        denunciante="denunciante",
+        motivo="motivo",
+        direcciones={"direccion": "San Martín", "altura": "100", "link_maps": "https://maps"},
+    )
+    registro.update(extra)
+    return registro
+
+
+def _libro():
+    return load_workbook(io.BytesIO(gcs_utils.download_blob_bytes(PLANILLA)))
+
+
+def test_aplicar_registro_en_la_primera_fila_libre(subir_planilla):
+    subir_planilla(PLANILLA, llenas=2)
+    wb = _libro()
+
+    fila = registro_snic.aplicar_registro(wb, _registro(), excluidas={5})
+
+    assert fila == 6
+    ws = wb.active
+    assert [ws[f"{col}6"].value for col in ("C", "H", "X", "L", "M")] == [
+        "05/01/2026", "12/26", "ROBO", "San Martín", "100",
+    ]
+
+
+def test_aplicar_registro_respeta_la_fila_reservada(subir_planilla):
+    subir_planilla(PLANILLA, llenas=2)
+    wb = _libro()
+
+    assert registro_snic.aplicar_registro(wb, _registro(fila_reservada=8)) == 8
+    # Si alguien la ocupó, va a la primera libre.
+    assert registro_snic.aplicar_registro(wb, _registro(fila_reservada=8)) == 5
+
+
+def test_planilla_completa(subir_planilla):
+    subir_planilla(PLANILLA, llenas=registro_snic.FILA_LIMITE - registro_snic.FILA_INICIAL)
+
+    with pytest.raises(registro_snic.PlanillaCompletaError):
+        registro_snic.aplicar_registro(_libro(), _registro())
+
+
+def test_guardar_registro(subir_planilla):
+    subir_planilla(PLANILLA, llenas=1)
+
+    assert registro_snic.guardar_registro(_registro()) == 4
+    assert registro_snic.guardar_registro(_registro(fecha_denuncia_txt="06/01/2026")) == 5
+    ws = _libro().active
+    assert [ws[f"C{fila}"].value for fila in (3, 4, 5)] == ["01/01/2026", "05/01/2026", "06/01/2026"]
+
+
+def test_guardar_registro_actualiza_el_indice(subir_planilla, monkeypatch):
+    subir_planilla(PLANILLA, llenas=1)
+    assert registro_snic.guardar_registro(_registro()) == 4
+
+    with monkeypatch.context() as m:
+        # La próxima fila sale del índice, sin volver a leer la planilla.
+        m.setattr(registro_snic, "reconstruir_indice_filas", lambda excel_path: pytest.fail("releyó"))
+        assert registro_snic.siguiente_fila(PLANILLA) == 5
+
+    # Si la planilla cambia por fuera, el índice se reconstruye.
+    subir_planilla(PLANILLA, llenas=3)
+    assert registro_snic.siguiente_fila(PLANILLA) == 6
+
+
+def test_guardar_registro_saltea_filas_reservadas(subir_planilla):
+    subir_planilla(PLANILLA, llenas=1)
+    assert registro_snic.reservar_fila_planilla(PLANILLA, "ana") == 4
+    assert registro_snic.reservar_fila_planilla(PLANILLA, "beto") == 5
+
+    assert registro_snic.guardar_registro(_registro(reserva_owner="beto", fila_reservada=5)) == 5
+    assert registro_snic.guardar_registro(_registro()) == 6
+    assert registro_snic.estado_filas(PLANILLA) == (4, [5, 6])
+
+
+def test_guardar_registro_con_id_no_se_repite(subir_planilla):
+    subir_planilla(PLANILLA, llenas=2)
+    registro = _registro(id="tarea-1")
+
+    assert registro_snic.guardar_registro(registro) == 5
+    # Se repite (p. ej. el diario se retomó después de una caída): no se escribe de nuevo.
+    assert registro_snic.guardar_registro(registro) == 5
+    assert registro_snic.guardar_registro(_registro(id="tarea-2")) == 6
+
+    ws = _libro().active
+    assert [ws[f"C{fila}"].value for fila in (5, 6, 7)] == ["05/01/2026", "05/01/2026", None]
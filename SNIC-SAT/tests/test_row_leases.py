@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+import gcs_utils
+import row_leases
+
+LEASES = "leases/planilla.json"
+
+
+def _con_otro_escritor(monkeypatch, veces: int) -> list[int]:
+    """Después de cada lectura (hasta ``veces``) otro usuario reserva la fila siguiente."""
+    leer = row_leases.load_json_with_generation
+    filas: list[int] = []
+
+    def leer_y_competir(path):
+        data, generation = leer(path)
+        if len(filas) < veces:
+            fila = 10 + len(filas)
+            filas.append(fila)
+            reservas = dict(data.get("reservas") or {})
+            reservas[f"otro-{fila}"] = {"fila": fila, "vence": time.time() + 60}
+            gcs_utils.save_json_to_gcs(path, {"reservas": reservas})
+        return data, generation
+
+    monkeypatch.setattr(row_leases, "load_json_with_generation", leer_y_competir)
+    return filas
+
+
+def test_reservas_de_distintos_duenos():
+    assert row_leases.reservar_fila(LEASES, "ana", 10) == 10
+    assert row_leases.reservar_fila(LEASES, "beto", 10, ocupadas={11}) == 12
+    assert row_leases.reservar_fila(LEASES, "ana", 10) == 10
+    assert row_leases.filas_reservadas(LEASES, excluir_owner="ana") == {12}
+
+    row_leases.liberar(LEASES, "ana")
+    assert row_leases.filas_reservadas(LEASES) == {12}
+
+
+def test_conflicto_se_reintenta_sobre_la_version_nueva(monkeypatch):
+    tomadas = _con_otro_escritor(monkeypatch, veces=2)
+
+    fila = row_leases.reservar_fila(LEASES, "ana", 10)
+
+    assert tomadas == [10, 11]
+    assert fila == 12
+    assert row_leases.filas_reservadas(LEASES) == {10, 11, 12}
+
+
+def test_conflicto_permanente(monkeypatch):
+    _con_otro_escritor(monkeypatch, veces=row_leases.MAX_CAS_ATTEMPTS)
+
+    with pytest.raises(row_leases.LeaseConflictError):
+        row_leases.reservar_fila(LEASES, "ana", 10)
+    assert "ana" not in gcs_utils.load_json_with_generation(LEASES)[0]["reservas"]
@@ -0,0 +1,94 @@
+import io
+
+from openpyxl import load_workbook
+from openpyxl.styles import Font
+
+import gcs_utils
+import registro_snic
+import volumenes
+
+PLANILLA = "snic/comisaria 1.xlsx"
+VOLUMEN_2 = "snic/comisaria 1 - vol 2.xlsx"
+LLENA = registro_snic.FILA_LIMITE - registro_snic.FILA_INICIAL
+
+
+def _registro(fecha: str, **extra) -> dict:
+    registro = registro_snic.armar_registro(
+        PLANILLA,
+        comisaria="comisaria 1",
+        hecho="hecho",
+        delito="ROBO",
+        actuacion="actuación",
+        fecha_denuncia_txt=fecha,
+        fecha_hecho_txt=fecha,
+        hora_hecho_txt="10:00",
+        hora_fin_txt="11:00",
+        preventivo="1/26",
+        denunciante="denunciante",
+        motivo="motivo",
+    )
+    registro.update(extra)
+    return registro
+
+
+def _hoja(excel_path: str):
+    return load_workbook(io.BytesIO(gcs_utils.download_blob_bytes(excel_path))).active
+
+
+def test_nombres_de_volumenes(subir_planilla):
+    subir_planilla(PLANILLA)
+    assert volumenes.volumen_path(PLANILLA, 2) == VOLUMEN_2
+    assert volumenes.volumen_path(VOLUMEN_2, 1) == PLANILLA
+    assert volumenes.volumenes(PLANILLA) == [PLANILLA]
+
+
+def test_guardar_registro_en_planilla_completa_abre_un_volumen(subir_planilla):
+    subir_planilla(PLANILLA, llenas=LLENA)
+
+    assert volumenes.guardar_registro(_registro("02/02/2026")) == (VOLUMEN_2, registro_snic.FILA_INICIAL)
+    assert volumenes.volumenes(PLANILLA) == [PLANILLA, VOLUMEN_2]
+    assert volumenes.volumen_para_escribir(PLANILLA) == (VOLUMEN_2, registro_snic.FILA_INICIAL + 1)
+
+    ws = _hoja(VOLUMEN_2)
+    # El volumen nuevo sale de la plantilla: encabezado y fórmulas, sin los datos.
+    assert ws["C1"].value == "Fecha denuncia"
+    assert ws["C3"].value == "02/02/2026"
+    assert ws["C4"].value is None
+    assert ws["A4"].value == "=ROW()-2"
+
+
+def test_exportar_combinado(subir_planilla):
+    subir_planilla(PLANILLA, llenas=LLENA)
+    volumenes.guardar_registro(_registro("02/02/2026"))
+    volumenes.guardar_registro(_registro("03/02/2026", excel_path=VOLUMEN_2))
+
+    ws = load_workbook(io.BytesIO(volumenes.exportar_combinado(PLANILLA))).active
+
+    fila = registro_snic.FILA_LIMITE
+    assert [ws[f"C{f}"].value for f in (fila - 1, fila, fila + 1, fila + 2)] == [
+        "01/01/2026", "02/02/2026", "03/02/2026", None,
+    ]
+    assert ws[f"X{fila + 1}"].value == "ROBO"
+
+
+def test_exportar_combinado_traslada_formulas_y_formato(subir_planilla):
+    subir_planilla(PLANILLA, llenas=LLENA)
+    wb = load_workbook(io.BytesIO(gcs_utils.download_blob_bytes(PLANILLA)))
+    wb.active["C3"].font = Font(bold=True)
+    wb.active["C3"].number_format = "dd/mm/yyyy"
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    gcs_utils.upload_blob_bytes(PLANILLA, buffer.getvalue())
+    volumenes.guardar_registro(_registro("02/02/2026"))
+    wb = load_workbook(io.BytesIO(gcs_utils.download_blob_bytes(VOLUMEN_2)))
+    wb.active["B3"] = "=C3&X3"
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    gcs_utils.upload_blob_bytes(VOLUMEN_2, buffer.getvalue())
+
+    ws = load_workbook(io.BytesIO(volumenes.exportar_combinado(PLANILLA))).active
+
+    fila = registro_snic.FILA_LIMITE
+    assert ws[f"B{fila}"].value == f"=C{fila}&X{fila}"
+    assert ws[f"C{fila}"].font.bold
+    assert ws[f"C{fila}"].number_format == "dd/mm/yyyy"
@@ -0,0 +1,127 @@
+import io
+import threading
+import time
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+import gcs_utils
+import storage_metrics
+import workbook_writes
+
+PLANILLA = "ley2785/planilla.xlsx"
+
+
+def _subir(filas: list[list]) -> None:
+    wb = Workbook()
+    for fila in filas:
+        wb.active.append(fila)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    gcs_utils.upload_blob_bytes(PLANILLA, buffer.getvalue())
+
+
+def _columna_a() -> list:
+    ws = load_workbook(io.BytesIO(gcs_utils.download_blob_bytes(PLANILLA))).active
+    return [ws.cell(fila, 1).value for fila in range(1, ws.max_row + 1)]
+
+
+def test_commit_reintenta_sobre_la_version_nueva():
+    _subir([["N°"], [1]])
+    intentos = []
+
+    def agregar(wb):
+        if not intentos:
+            # Otro operador guarda entre la lectura y la subida.
+            _subir([["N°"], [1], [2]])
+        intentos.append(1)
+        return workbook_writes.apply_row_append(wb, workbook_writes.RowAppend(rows=[{"A": 3}], start_row=2))
+
+    resultado = workbook_writes.commit_workbook_changes(PLANILLA, agregar)
+
+    assert len(intentos) == 2
+    assert resultado.first_row == 4
+    assert _columna_a() == ["N°", 1, 2, 3]
+
+
+def test_commit_se_rinde_si_siempre_hay_conflicto():
+    _subir([["N°"]])
+
+    def siempre_en_conflicto(wb):
+        _subir([["N°"]])
+
+    with pytest.raises(workbook_writes.WorkbookConflictError):
+        workbook_writes.commit_workbook_changes(PLANILLA, siempre_en_conflicto, max_attempts=3)
+
+
+def test_append_rows_agrupa_los_que_llegan_durante_un_guardado(monkeypatch):
+    _subir([["N°"]])
+    commit = workbook_writes.commit_workbook_changes
+    lotes = []
+    en_curso, seguir = threading.Event(), threading.Event()
+
+    def commit_lento(blob_name, apply_changes, *args, **kwargs):
+        def aplicar(wb):
+            resultado = apply_changes(wb)
+            lotes.append(len(resultado))
+            return resultado
+        en_curso.set()
+        seguir.wait(5)
+        return commit(blob_name, aplicar, *args, **kwargs)
+
+    monkeypatch.setattr(workbook_writes, "commit_workbook_changes", commit_lento)
+    filas = []
+
+    def agregar(numero):
+        spec = workbook_writes.RowAppend(rows=[{"A": numero}], start_row=2, counter_column="B")
+        filas.append(workbook_writes.append_rows(PLANILLA, spec).first_row)
+
+    hilos = [threading.Thread(target=agregar, args=(numero,)) for numero in range(5)]
+    hilos[0].start()
+    assert en_curso.wait(5)
+    for hilo in hilos[1:]:
+        hilo.start()
+    time.sleep(0.05)
+    seguir.set()
+    for hilo in hilos:
+        hilo.join(5)
+
+    assert lotes == [1, 4]
+    assert sorted(filas) == [2, 3, 4, 5, 6]
+    assert sorted(_columna_a()[1:]) == [0, 1, 2, 3, 4]
+
+
+def test_append_rows_solo_no_espera_la_ventana(monkeypatch):
+    _subir([["N°"]])
+    monkeypatch.setattr(workbook_writes, "COALESCE_WINDOW_SECONDS", 5.0)
+
+    inicio = time.monotonic()
+    resultado = workbook_writes.append_rows(PLANILLA, workbook_writes.RowAppend(rows=[{"A": 1}], start_row=2))
+
+    assert resultado.first_row == 2
+    assert time.monotonic() - inicio < 1.0
+
+
+def test_append_rows_no_espera_para_siempre(monkeypatch):
+    _subir([["N°"]])
+    monkeypatch.setattr(workbook_writes, "APPEND_TIMEOUT_SECONDS", 0.1)
+    monkeypatch.setattr(workbook_writes, "_commit_batch", lambda blob_name, batch: time.sleep(1))
+
+    with pytest.raises(workbook_writes.WorkbookSaveTimeout):
+        workbook_writes.append_rows(PLANILLA, workbook_writes.RowAppend(rows=[{"A": 1}], start_row=2))
+
+
+def test_append_rows_anota_el_guardado_en_la_traza_del_llamador(monkeypatch):
+    _subir([["N°"], [1]])
+    traza = {"rerun": 7, "ops": []}
+    principal = threading.current_thread()
+    # Solo el hilo de la prueba tiene "sesión"; el guardado corre en otro hilo.
+    monkeypatch.setattr(
+        storage_metrics, "_session_trace", lambda: traza if threading.current_thread() is principal else None
+    )
+
+    workbook_writes.append_rows(PLANILLA, workbook_writes.RowAppend(rows=[{"A": 2}], start_row=2))
+
+    operaciones = {op["op"] for op in traza["ops"]}
+    assert {"download", "upload"} <= operaciones
+    assert all(op["site"].startswith("test_workbook_writes.py:") for op in traza["ops"])
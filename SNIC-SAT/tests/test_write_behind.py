@@ -0,0 +1,106 @@
+import json
+import time
+
+import gcs_utils
+import write_behind
+
+
+def _esperar(condicion, segundos: float = 5.0) -> None:
+    limite = time.monotonic() + segundos
+    while not condicion():
+        assert time.monotonic() < limite, "el hilo de guardado no terminó a tiempo"
+        time.sleep(0.01)
+
+
+def _guardar(payload):
+    """Handler que agrega el payload al blob: deja en el bucket el orden en que se aplicaron."""
+    data, generation = gcs_utils.load_json_with_generation(payload["blob"])
+    aplicados = data.get("aplicados", []) + [payload["n"]]
+    gcs_utils.save_json_to_gcs(payload["blob"], {"aplicados": aplicados}, if_generation_match=generation or 0)
+
+
+def _aplicados(blob: str) -> list:
+    return gcs_utils.load_json_with_generation(blob)[0].get("aplicados", [])
+
+
+def test_replay_respeta_el_orden_por_blob(tmp_path):
+    diario = tmp_path / "diario.jsonl"
+    registros = [
+        {"op": "add", "id": "a1", "blob": "a.json", "payload": {"blob": "a.json", "n": "a1"}},
+        {"op": "add", "id": "b1", "blob": "b.json", "payload": {"blob": "b.json", "n": "b1"}},
+        {"op": "add", "id": "a2", "blob": "a.json", "payload": {"blob": "a.json", "n": "a2"}},
+        {"op": "add", "id": "x1", "blob": "a.json", "payload": {"blob": "a.json", "n": "x1"}},
+        {"op": "done", "id": "x1"},
+        {"op": "failed", "id": "a1", "attempts": 5, "error": "sin red"},
+        {"op": "add", "id": "b2", "blob": "b.json", "payload": {"blob": "b.json", "n": "b2"}},
+    ]
+    # La última línea quedó a medio escribir por una caída.
+    diario.write_text("".join(json.dumps(r) + "\n" for r in registros) + '{"op": "add", "id"', encoding="utf-8")
+
+    journal = write_behind.WriteBehindJournal(str(diario), _guardar)
+
+    _esperar(lambda: journal.pending_count("b.json") == 0)
+    assert _aplicados("b.json") == ["b1", "b2"]
+    # a1 quedó fallida: retiene a a2 y x1 ya estaba hecha.
+    assert _aplicados("a.json") == []
+    assert [(e["id"], e["estado"]) for e in journal.entries()] == [
+        ("a1", write_behind.FAILED),
+        ("a2", write_behind.PENDING),
+    ]
+
+    assert journal.retry("a1")
+    _esperar(lambda: not journal.entries())
+    assert _aplicados("a.json") == ["a1", "a2"]
+
+
+def test_diario_se_retoma_al_reiniciar(tmp_path, monkeypatch):
+    diario = tmp_path / "diario.jsonl"
+    # Sin hilo de vaciado: las tareas quedan solo en el diario, como si el proceso se cayera.
+    with monkeypatch.context() as m:
+        m.setattr(write_behind.WriteBehindJournal, "_run", lambda self: None)
+        journal = write_behind.WriteBehindJournal(str(diario), _guardar)
+        for n in range(3):
+            journal.enqueue("a.json", {"blob": "a.json", "n": n})
+
+    retomado = write_behind.WriteBehindJournal(str(diario), _guardar)
+
+    _esperar(lambda: not retomado.entries())
+    assert _aplicados("a.json") == [0, 1, 2]
+
+
+def test_tarea_fallida_queda_hasta_que_se_reintenta(tmp_path):
+    caido = [True]
+
+    def guardar(payload):
+        if caido[0]:
+            raise ConnectionError("sin red")
+        _guardar(payload)
+
+    journal = write_behind.WriteBehindJournal(str(tmp_path / "diario.jsonl"), guardar, max_attempts=1)
+    entry_id = journal.enqueue("a.json", {"blob": "a.json", "n": 1})
+
+    _esperar(lambda: journal.entries()[0]["estado"] == write_behind.FAILED)
+    assert journal.entries()[0]["ultimo_error"] == "sin red"
+    assert _aplicados("a.json") == []
+
+    caido[0] = False
+    assert journal.retry(entry_id)
+    _esperar(lambda: not journal.entries())
+    assert _aplicados("a.json") == [1]
+
+
+def test_on_success_recibe_la_tarea_y_el_resultado(tmp_path):
+    hechos = []
+
+    def guardar(payload):
+        _guardar(payload)
+        return len(_aplicados(payload["blob"]))
+
+    journal = write_behind.WriteBehindJournal(
+        str(tmp_path / "diario.jsonl"), guardar, on_success=lambda payload, fila: hechos.append((payload["n"], fila))
+    )
+    assert journal.enqueue("a.json", {"blob": "a.json", "n": "a1"}, entry_id="a1") == "a1"
+    journal.enqueue("a.json", {"blob": "a.json", "n": "a2"})
+
+    _esperar(lambda: not journal.entries())
+    assert hechos == [("a1", 1), ("a2", 2)]
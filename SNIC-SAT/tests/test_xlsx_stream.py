@@ -0,0 +1,33 @@
+import io
+
+from openpyxl import Workbook
+
+import xlsx_stream
+
+
+def test_filled_rows(libro_excel):
+    assert xlsx_stream.filled_rows(io.BytesIO(libro_excel), "C") == [1, 2, 5]
+    assert xlsx_stream.filled_rows(io.BytesIO(libro_excel), "B", min_row=2) == [2, 3]
+    assert xlsx_stream.filled_rows(io.BytesIO(libro_excel), "A", min_row=2, max_row=2) == [2]
+
+
+def test_column_values_resuelve_cadenas(libro_excel):
+    assert list(xlsx_stream.column_values(io.BytesIO(libro_excel), "C", min_row=2)) == [
+        (2, "uno"),
+        (3, ""),
+        (5, "cinco"),
+    ]
+
+
+def test_celda_mas_larga_que_un_bloque(monkeypatch):
+    monkeypatch.setattr(xlsx_stream, "CHUNK_SIZE", 1024)
+    wb = Workbook()
+    ws = wb.active
+    for fila in range(2, 201):
+        ws[f"A{fila}"] = "x" * 5000 if fila == 50 else fila
+    buffer = io.BytesIO()
+    wb.save(buffer)
+
+    filas = xlsx_stream.filled_rows(io.BytesIO(buffer.getvalue()), "A")
+    assert 50 in filas
+    assert len(filas) == 199
@@ -0,0 +1,101 @@
+import io
+import zipfile
+
+import pytest
+from openpyxl import load_workbook
+
+import gcs_utils
+import workbook_writes
+from xlsx_zip import UnsupportedEdit, ZipWorkbook
+
+
+def _guardar(wb: ZipWorkbook) -> bytes:
+    salida = io.BytesIO()
+    wb.save(salida)
+    return salida.getvalue()
+
+
+def test_lectura_igual_que_openpyxl(libro_excel):
+    esperado = load_workbook(io.BytesIO(libro_excel))["Datos"]
+    ws = ZipWorkbook(io.BytesIO(libro_excel))["Datos"]
+    for fila in range(1, 6):
+        for columna in range(1, 4):
+            assert ws.cell(fila, columna).value == esperado.cell(fila, columna).value, (fila, columna)
+    assert ws.max_row == esperado.max_row
+
+
+def test_guardado_se_lee_con_openpyxl(libro_excel):
+    wb = ZipWorkbook(io.BytesIO(libro_excel))
+    ws = wb["Datos"]
+    ws["A4"].value = 3
+    ws["C4"].value = "cuatro <&>"
+    ws["A2"].value = 10
+    ws.cell(7, 2).value = 1.5
+
+    guardado = load_workbook(io.BytesIO(_guardar(wb)))["Datos"]
+    assert [c.value for c in guardado[4]] == [3, None, "cuatro <&>"]
+    assert guardado["A2"].value == 10
+    assert guardado["A2"].font.bold
+    assert guardado["B7"].value == 1.5
+    assert guardado["B2"].value == "=A2*2"
+    assert guardado["C2"].value == "uno"
+    assert guardado["C5"].value == "cinco"
+
+
+def test_guardar_dos_veces_da_el_mismo_libro(libro_excel):
+    wb = ZipWorkbook(io.BytesIO(libro_excel))
+    wb["Datos"]["A4"].value = 3
+    assert _guardar(wb) == _guardar(wb)
+
+
+def test_formula_compartida(libro_excel):
+    ws = ZipWorkbook(io.BytesIO(libro_excel))["Datos"]
+    assert ws["B3"].value == "=A3*2"
+    with pytest.raises(UnsupportedEdit):
+        ws["B3"].value = 5
+    with pytest.raises(UnsupportedEdit):
+        ws["B2"].value = 5
+
+
+def test_partes_sin_cambios_se_copian_byte_a_byte(libro_excel):
+    origen = zipfile.ZipFile(io.BytesIO(libro_excel))
+    wb = ZipWorkbook(io.BytesIO(libro_excel))
+    wb["Datos"]["A4"].value = 3
+    guardado = zipfile.ZipFile(io.BytesIO(_guardar(wb)))
+
+    def crudo(zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+        zf.fp.seek(info.header_offset + 26)
+        nombre, extra = int.from_bytes(zf.fp.read(2), "little"), int.from_bytes(zf.fp.read(2), "little")
+        zf.fp.seek(nombre + extra, 1)
+        return zf.fp.read(info.compress_size)
+
+    reescritas = {"xl/worksheets/sheet1.xml", "xl/workbook.xml"}
+    assert guardado.namelist() == origen.namelist()
+    for info in origen.infolist():
+        copia = guardado.getinfo(info.filename)
+        assert copia.external_attr == info.external_attr
+        if info.filename in reescritas:
+            continue
+        assert (copia.CRC, copia.compress_size, copia.compress_type) == (
+            info.CRC, info.compress_size, info.compress_type,
+        )
+        assert crudo(guardado, copia) == crudo(origen, info), info.filename
+    assert guardado.testzip() is None
+
+
+def test_append_rows_en_el_bucket(libro_excel):
+    gcs_utils.upload_blob_bytes("planillas/datos.xlsx", libro_excel)
+    spec = workbook_writes.RowAppend(rows=[{"A": 6, "C": "seis"}], key_column="C", start_row=2,
+                                     mode=workbook_writes.AFTER_LAST, sheet_name="Datos")
+
+    primero = workbook_writes.append_rows("planillas/datos.xlsx", spec)
+    segundo = workbook_writes.append_rows("planillas/datos.xlsx", spec)
+
+    assert (primero.first_row, segundo.first_row) == (6, 7)
+    ws = load_workbook(io.BytesIO(gcs_utils.download_blob_bytes("planillas/datos.xlsx")))["Datos"]
+    assert [(ws.cell(fila, 1).value, ws.cell(fila, 3).value) for fila in (5, 6, 7)] == [
+        (None, "cinco"),
+        (6, "seis"),
+        (6, "seis"),
+    ]
+    assert ws["B3"].value == "=A3*2"
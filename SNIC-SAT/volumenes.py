@@ -0,0 +1,183 @@
+"""Volúmenes de la planilla SNIC-SAT de cada comisaría.
+
+Una planilla tiene lugar hasta ``registro_snic.FILA_LIMITE``. Cuando se
+completa queda sellada y los registros siguientes van a un volumen nuevo
+(``comisaria 14 - vol 2.xlsm``) creado a partir de una plantilla: el
+primer volumen con las filas de datos vacías. El volumen activo es el de
+número más alto. Cada volumen tiene su propio índice de filas, reservas y
+registro, así que todo lo demás funciona igual sobre cualquiera de ellos.
+
+Las descargas pueden ser de un volumen o de todos combinados en un libro.
+"""
+from __future__ import annotations
+
+import functools
+import io
+import re
+from copy import copy
+from typing import Any, Optional
+
+from openpyxl import load_workbook
+from openpyxl.formula.translate import Translator
+from openpyxl.packaging.custom import CustomPropertyList
+from openpyxl.utils import column_index_from_string
+
+from gcs_utils import create_blob_if_absent, download_blob_to_file, is_xlsm, stat_blob
+import registro_snic
+from workbook_writes import is_blank
+
+_VOLUMEN_RE = re.compile(r"^(?P<base>.*) - vol (?P<numero>\d+)(?P<ext>\.\w+)$")
+
+
+def _partes(excel_path: str) -> tuple[str, int, str]:
+    """``(base, número, extensión)``; el primer volumen no lleva sufijo."""
+    match = _VOLUMEN_RE.match(excel_path)
+    if match:
+        return match["base"], int(match["numero"]), match["ext"]
+    base, punto, ext = excel_path.rpartition(".")
+    return base, 1, f"{punto}{ext}"
+
+
+def volumen_path(excel_path: str, numero: int) -> str:
+    base, _, ext = _partes(excel_path)
+    return f"{base}{ext}" if numero == 1 else f"{base} - vol {numero}{ext}"
+
+
+def numero_volumen(excel_path: str) -> int:
+    return _partes(excel_path)[1]
+
+
+def volumenes(excel_path: str) -> list[str]:
+    """Todos los volúmenes de la planilla, del primero al activo."""
+    encontrados = [volumen_path(excel_path, 1)]
+    while stat_blob(volumen_path(excel_path, len(encontrados) + 1)) is not None:
+        encontrados.append(volumen_path(excel_path, len(encontrados) + 1))
+    return encontrados
+
+
+def volumen_activo(excel_path: str) -> str:
+    return volumenes(excel_path)[-1]
+
+
+def _es_formula(valor: Any) -> bool:
+    return isinstance(valor, str) and valor.startswith("=")
+
+
+@functools.lru_cache(maxsize=8)
+def _plantilla(excel_path: str, generation: int) -> bytes:
+    """
+    El volumen ``excel_path`` (en la versión ``generation``) sin datos: se
+    vacían las celdas desde FILA_INICIAL conservando formatos y fórmulas.
+    """
+    source, _ = download_blob_to_file(excel_path)
+    if source is None:
+        raise FileNotFoundError(excel_path)
+    with source:
+        wb = load_workbook(source, keep_vba=is_xlsm(excel_path))
+    for fila in wb.active.iter_rows(min_row=registro_snic.FILA_INICIAL):
+        for celda in fila:
+            if celda.value is not None and not _es_formula(celda.value):
+                celda.value = None
+    # Las propiedades propias (p. ej. el offset del registro) son de cada volumen.
+    wb.custom_doc_props = CustomPropertyList()
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def renovar(excel_path: str) -> str:
+    """
+    Sella ``excel_path`` y devuelve el volumen siguiente, creándolo desde la
+    plantilla si todavía no existe (si otra sesión lo creó antes, se usa ese).
+    """
+    siguiente = volumen_path(excel_path, numero_volumen(excel_path) + 1)
+    if stat_blob(siguiente) is None:
+        primero = volumen_path(excel_path, 1)
+        info = stat_blob(primero)
+        if info is None:
+            raise FileNotFoundError(primero)
+        create_blob_if_absent(siguiente, _plantilla(primero, info.generation))
+    return siguiente
+
+
+def volumen_para_escribir(excel_path: str) -> tuple[str, int]:
+    """Volumen activo con lugar y su próxima fila libre; abre uno nuevo si hace falta."""
+    activo = volumen_activo(excel_path)
+    proxima = registro_snic.siguiente_fila(activo)
+    while proxima >= registro_snic.FILA_LIMITE:
+        activo = renovar(activo)
+        proxima = registro_snic.siguiente_fila(activo)
+    return activo, proxima
+
+
+def guardar_registro(registro: dict[str, Any]) -> tuple[str, int]:
+    """
+    Guarda el registro en su volumen o, si se completó mientras tanto, en
+    el siguiente. Devuelve el volumen y la fila usados.
+    """
+    while True:
+        try:
+            return registro["excel_path"], registro_snic.guardar_registro(registro)
+        except registro_snic.PlanillaCompletaError:
+            anterior = registro["excel_path"]
+            if registro.get("reserva_owner"):
+                registro_snic.liberar_reserva_planilla(anterior, registro["reserva_owner"])
+            registro = {**registro, "excel_path": renovar(anterior), "fila_reservada": None}
+
+
+# =========================
+# Descarga combinada
+# =========================
+
+def _copiar_formato(origen, destino) -> None:
+    destino.font = copy(origen.font)
+    destino.fill = copy(origen.fill)
+    destino.border = copy(origen.border)
+    destino.alignment = copy(origen.alignment)
+    destino.protection = copy(origen.protection)
+    destino.number_format = origen.number_format
+
+
+def exportar_combinado(excel_path: str, nombres: Optional[list[str]] = None) -> bytes:
+    """
+    Un libro con los registros de todos los volúmenes: el primero completo
+    y, a continuación, las filas con datos de los demás (con el formato de
+    la primera fila de datos y las fórmulas trasladadas a su fila nueva).
+    """
+    nombres = nombres or volumenes(excel_path)
+    source, _ = download_blob_to_file(nombres[0])
+    if source is None:
+        raise FileNotFoundError(nombres[0])
+    with source:
+        wb = load_workbook(source, keep_vba=is_xlsm(nombres[0]))
+    ws = wb.active
+    columna_fecha = column_index_from_string(registro_snic.COLUMNA_FECHA)
+    llenas = [
+        fila for fila in range(registro_snic.FILA_INICIAL, ws.max_row + 1)
+        if not is_blank(ws.cell(row=fila, column=columna_fecha).value)
+    ]
+    destino = (llenas[-1] if llenas else registro_snic.FILA_INICIAL - 1) + 1
+    for nombre in nombres[1:]:
+        source, _ = download_blob_to_file(nombre)
+        if source is None:
+            continue
+        with source:
+            origen = load_workbook(source, read_only=True)
+            for fila in origen.active.iter_rows(min_row=registro_snic.FILA_INICIAL):
+                if len(fila) < columna_fecha or is_blank(fila[columna_fecha - 1].value):
+                    continue
+                for celda in fila:
+                    if celda.value is None:
+                        continue
+                    nueva = ws.cell(row=destino, column=celda.column)
+                    valor = celda.value
+                    if _es_formula(valor):
+                        # Las referencias relativas se mueven a la fila donde queda el registro.
+                        valor = Translator(valor, origin=celda.coordinate).translate_formula(nueva.coordinate)
+                    nueva.value = valor
+                    _copiar_formato(ws.cell(row=registro_snic.FILA_INICIAL, column=celda.column), nueva)
+                destino += 1
+            origen.close()
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
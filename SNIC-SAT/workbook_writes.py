@@ -0,0 +1,334 @@
+"""Escritura de planillas en el bucket con concurrencia optimista.
+
+Cada guardado lee el libro junto con su generación, aplica los cambios y
+lo sube con ``if_generation_match``. Si otro usuario guardó en el medio la
+subida es rechazada, se vuelve a leer la versión nueva y se re-aplican los
+cambios pendientes; en el caso de filas agregadas, sobre la próxima fila
+libre de esa versión. Así varios operadores de una misma unidad pueden
+guardar a la vez sin pisarse filas.
+
+Un agregado de filas a una planilla sin otro guardado en curso se guarda
+enseguida. Los que llegan mientras se está guardando la misma planilla
+esperan una ventana corta (``WORKBOOK_COALESCE_MS``) y se guardan juntos en
+un solo ciclo de lectura/escritura; cada llamador recibe igual su propia fila.
+
+Por defecto los cambios se aplican a nivel zip (``xlsx_zip``), reescribiendo
+solo el XML de la hoja; si el cambio no se puede hacer así, o con
+``WORKBOOK_ENGINE=openpyxl``, se carga y guarda el libro con openpyxl.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, NamedTuple, Optional, TypeVar, Union
+
+from openpyxl.utils import column_index_from_string
+
+from gcs_utils import (
+    BlobInfo,
+    GenerationMismatch,
+    download_blob_to_file,
+    is_xlsm,
+    load_workbook_with_generation,
+    save_workbook_to_gcs,
+)
+import storage_metrics
+from xlsx_zip import UnsupportedEdit, ZipWorkbook
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MAX_COMMIT_ATTEMPTS = 5
+
+ENGINE_ZIP = "zip"
+ENGINE_OPENPYXL = "openpyxl"
+WORKBOOK_ENGINE = os.getenv("WORKBOOK_ENGINE", ENGINE_ZIP).strip().lower()
+COALESCE_WINDOW_SECONDS = float(os.getenv("WORKBOOK_COALESCE_MS", "150")) / 1000.0
+APPEND_TIMEOUT_SECONDS = float(os.getenv("WORKBOOK_APPEND_TIMEOUT_S", "120"))
+
+# Cómo se busca la fila donde empezar a escribir:
+FIRST_BLANK = "first_blank"  # primera fila vacía en la columna clave desde start_row
+AFTER_LAST = "after_last"    # fila siguiente a la última con dato en la columna clave
+
+Column = Union[str, int]
+
+
+class WorkbookConflictError(Exception):
+    """No se pudo guardar porque la planilla cambió en cada reintento."""
+
+
+class WorkbookSaveTimeout(Exception):
+    """El guardado en grupo no respondió a tiempo; el resultado es desconocido."""
+
+
+class RowAppend(NamedTuple):
+    """Filas a agregar en una planilla (una entrada de ``rows`` por fila)."""
+
+    rows: list[dict[Column, Any]]
+    key_column: Column = "A"
+    start_row: int = 1
+    mode: str = FIRST_BLANK
+    counter_column: Optional[Column] = None
+    sheet_name: Optional[str] = None
+
+
+class AppendResult(NamedTuple):
+    first_row: int
+    first_number: Optional[int]
+
+
+def column_index(column: Column) -> int:
+    if isinstance(column, int):
+        return column
+    return column_index_from_string(column)
+
+
+def is_blank(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and value.strip() == "")
+
+
+def _worksheet(wb, sheet_name: Optional[str], blob_name: str = ""):
+    if sheet_name is None:
+        return wb.active
+    if sheet_name not in wb.sheetnames:
+        raise ValueError(f"La hoja '{sheet_name}' no existe en el archivo {blob_name}.")
+    return wb[sheet_name]
+
+
+def locate_append_row(ws, spec: RowAppend) -> AppendResult:
+    """Fila donde empezar a escribir y número correlativo que le corresponde."""
+    key = column_index(spec.key_column)
+    if spec.mode == AFTER_LAST:
+        row = spec.start_row
+        for current in range(spec.start_row, ws.max_row + 1):
+            if ws.cell(row=current, column=key).value is not None:
+                row = current + 1
+    else:
+        row = spec.start_row
+        while not is_blank(ws.cell(row=row, column=key).value):
+            row += 1
+
+    if spec.counter_column is None:
+        return AppendResult(row, None)
+    if row == spec.start_row:
+        return AppendResult(row, 1)
+    last = ws.cell(row=row - 1, column=column_index(spec.counter_column)).value
+    try:
+        return AppendResult(row, int(last) + 1)
+    except (TypeError, ValueError):
+        return AppendResult(row, 1)
+
+
+def apply_row_append(wb, spec: RowAppend, blob_name: str = "") -> AppendResult:
+    ws = _worksheet(wb, spec.sheet_name, blob_name)
+    # Se resuelven las columnas antes de escribir para no dejar filas a medias.
+    rows = [{column_index(column): value for column, value in values.items()} for values in spec.rows]
+    counter = column_index(spec.counter_column) if spec.counter_column is not None else None
+    result = locate_append_row(ws, spec)
+    for offset, values in enumerate(rows):
+        row = result.first_row + offset
+        if counter is not None and result.first_number is not None:
+            ws.cell(row=row, column=counter).value = result.first_number + offset
+        for column, value in values.items():
+            ws.cell(row=row, column=column).value = value
+    return result
+
+
+def _zip_attempt(blob_name: str, apply_changes: Callable[[Any], T]) -> tuple[T, BlobInfo]:
+    source, generation = download_blob_to_file(blob_name)
+    if source is None:
+        raise UnsupportedEdit(f"{blob_name} no existe; lo crea openpyxl.")
+    with source:
+        try:
+            wb = ZipWorkbook(source)
+        except (KeyError, StopIteration, ValueError) as exc:
+            raise UnsupportedEdit(f"{blob_name}: estructura no reconocida ({exc}).") from exc
+        with wb:
+            result = apply_changes(wb)
+            return result, save_workbook_to_gcs(wb, blob_name, if_generation_match=generation)
+
+
+def _openpyxl_attempt(blob_name: str, apply_changes: Callable[[Any], T]) -> tuple[T, BlobInfo]:
+    wb, generation = load_workbook_with_generation(blob_name)
+    result = apply_changes(wb)
+    return result, save_workbook_to_gcs(wb, blob_name, if_generation_match=generation)
+
+
+def commit_workbook_changes(
+    blob_name: str,
+    apply_changes: Callable[[Any], T],
+    max_attempts: int = MAX_COMMIT_ATTEMPTS,
+    on_commit: Optional[Callable[[T, BlobInfo], None]] = None,
+    engine: Optional[str] = None,
+) -> T:
+    """
+    Lee el libro, le aplica ``apply_changes`` y lo sube solo si nadie lo
+    modificó en el medio. Ante un conflicto repite todo sobre la versión nueva.
+    Devuelve lo que devuelva ``apply_changes`` en el intento que se guardó;
+    ``on_commit`` recibe ese resultado y la versión subida. Corre cuando el
+    libro ya está subido, así que si falla solo se registra: el guardado no
+    se informa como fallido (y no se repite en otra fila).
+
+    ``apply_changes`` recibe un ``ZipWorkbook`` o un libro de openpyxl según
+    el motor; los que necesitan algo más que leer y escribir celdas deben
+    pedir ``engine=ENGINE_OPENPYXL``.
+    """
+    engine = engine or WORKBOOK_ENGINE
+    if not blob_name.lower().endswith(".xlsx") and not is_xlsm(blob_name):
+        engine = ENGINE_OPENPYXL
+    for _ in range(max_attempts):
+        attempt = _zip_attempt if engine == ENGINE_ZIP else _openpyxl_attempt
+        try:
+            try:
+                result, info = attempt(blob_name, apply_changes)
+            except UnsupportedEdit as exc:
+                logger.info("Guardado de %s con openpyxl: %s", blob_name, exc)
+                engine = ENGINE_OPENPYXL
+                result, info = _openpyxl_attempt(blob_name, apply_changes)
+        except GenerationMismatch:
+            continue
+        if on_commit is not None:
+            try:
+                on_commit(result, info)
+            except Exception:
+                logger.exception("Falló la actualización posterior al guardado de %s", blob_name)
+        return result
+    raise WorkbookConflictError(
+        f"La planilla {blob_name} cambió durante {max_attempts} intentos de guardado. Intente nuevamente."
+    )
+
+
+# =========================
+# Agrupado de agregados por planilla
+# =========================
+
+class _PendingAppend:
+    __slots__ = ("spec", "max_attempts", "caller", "done", "result", "error")
+
+    def __init__(self, spec: RowAppend, max_attempts: int):
+        self.spec = spec
+        self.max_attempts = max_attempts
+        # El lote se guarda en otro hilo: sus lecturas y escrituras se anotan
+        # en la traza del rerun que pidió el agregado.
+        self.caller = storage_metrics.caller()
+        self.done = threading.Event()
+        self.result: Optional[AppendResult] = None
+        self.error: Optional[BaseException] = None
+
+
+class _NothingToSave(Exception):
+    """Ningún agregado del lote se pudo aplicar: no hace falta subir el libro."""
+
+
+class _AppendQueue:
+    def __init__(self, blob_name: str):
+        self.blob_name = blob_name
+        self.lock = threading.Lock()
+        self.pending: list[_PendingAppend] = []
+        self.draining = False
+
+
+_QUEUES: dict[str, _AppendQueue] = {}
+_QUEUES_LOCK = threading.Lock()
+
+
+def _queue_for(blob_name: str) -> _AppendQueue:
+    with _QUEUES_LOCK:
+        queue = _QUEUES.get(blob_name)
+        if queue is None:
+            queue = _QUEUES[blob_name] = _AppendQueue(blob_name)
+        return queue
+
+
+def _commit_batch(blob_name: str, batch: list[_PendingAppend]) -> None:
+    """
+    Guarda todo el lote en un solo commit. Un agregado que falla al
+    aplicarse (p. ej. hoja inexistente) queda afuera y solo ese llamador
+    recibe el error.
+    """
+    def apply(wb):
+        outcomes = []
+        for item in batch:
+            try:
+                outcomes.append((item, apply_row_append(wb, item.spec, blob_name), None))
+            except UnsupportedEdit:
+                raise
+            except Exception as exc:
+                outcomes.append((item, None, exc))
+        if all(error is not None for _, _, error in outcomes):
+            raise _NothingToSave(outcomes)
+        return outcomes
+
+    try:
+        with storage_metrics.on_behalf_of([item.caller for item in batch]):
+            outcomes = commit_workbook_changes(blob_name, apply, max(item.max_attempts for item in batch))
+    except _NothingToSave as nothing:
+        outcomes = nothing.args[0]
+    except BaseException as exc:
+        for item in batch:
+            item.error = exc
+            item.done.set()
+        return
+
+    for item, result, error in outcomes:
+        item.result, item.error = result, error
+        item.done.set()
+
+
+def _drain(queue: _AppendQueue) -> None:
+    # El primer lote sale sin esperar; si mientras tanto llegaron más
+    # agregados, se da la ventana para juntar los que sigan llegando.
+    first = True
+    try:
+        while True:
+            if not first:
+                with queue.lock:
+                    if not queue.pending:
+                        queue.draining = False
+                        return
+                time.sleep(COALESCE_WINDOW_SECONDS)
+            first = False
+            with queue.lock:
+                batch, queue.pending = queue.pending, []
+                if not batch:
+                    queue.draining = False
+                    return
+            _commit_batch(queue.blob_name, batch)
+    except BaseException:
+        logger.exception("Se detuvo el guardado en grupo de %s", queue.blob_name)
+        with queue.lock:
+            queue.draining = False
+        raise
+
+
+def append_rows(blob_name: str, spec: RowAppend, max_attempts: int = MAX_COMMIT_ATTEMPTS) -> AppendResult:
+    """
+    Agrega las filas de ``spec`` en la próxima posición libre de la planilla.
+    Espera a que el lote en el que quedó incluido se guarde.
+    """
+    if COALESCE_WINDOW_SECONDS <= 0:
+        return commit_workbook_changes(
+            blob_name,
+            lambda wb: apply_row_append(wb, spec, blob_name),
+            max_attempts=max_attempts,
+        )
+
+    item = _PendingAppend(spec, max_attempts)
+    queue = _queue_for(blob_name)
+    with queue.lock:
+        queue.pending.append(item)
+        if not queue.draining:
+            queue.draining = True
+            threading.Thread(target=_drain, args=(queue,), name=f"append:{blob_name}", daemon=True).start()
+
+    if not item.done.wait(APPEND_TIMEOUT_SECONDS):
+        raise WorkbookSaveTimeout(
+            f"No se confirmó el guardado de {blob_name} después de {APPEND_TIMEOUT_SECONDS:.0f} s"
+        )
+    if item.error is not None:
+        raise item.error
+    assert item.result is not None
+    return item.result
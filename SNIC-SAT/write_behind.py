@@ -0,0 +1,257 @@
+"""Guardado diferido con diario local.
+
+Cada tarea se agrega primero a un diario JSONL en disco (con ``fsync``) y
+recién después se devuelve el control a la interfaz. Un hilo en segundo
+plano vacía el diario hacia el bucket llamando al ``handler`` configurado,
+con reintentos y respetando el orden de llegada dentro de cada blob: una
+tarea no se procesa mientras haya otra anterior del mismo blob pendiente.
+
+Las tareas que agotan los reintentos quedan como fallidas hasta que un
+administrador las reintente o descarte; mientras tanto detienen a las
+siguientes del mismo blob (para no escribirlas antes) pero no a las de
+otros blobs.
+Al reiniciar el proceso se vuelve a leer el diario y se retoman las
+tareas que no habían terminado. Una caída entre el guardado y la marca de
+terminada hace que la tarea se repita, así que el ``handler`` debe poder
+recibirla dos veces (p. ej. reconociendo el id con el que se encoló).
+
+``on_success`` corre después de cada guardado exitoso, con la tarea y lo
+que devolvió el ``handler``; si falla, la tarea se reintenta entera.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 60.0
+
+PENDING = "pendiente"
+FAILED = "fallido"
+
+
+class JournalEntry:
+    __slots__ = ("id", "blob", "payload", "created", "attempts", "last_error", "status", "next_attempt")
+
+    def __init__(self, entry_id: str, blob: str, payload: dict[str, Any], created: str):
+        self.id = entry_id
+        self.blob = blob
+        self.payload = payload
+        self.created = created
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+        self.status = PENDING
+        self.next_attempt = 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "blob": self.blob,
+            "creado": self.created,
+            "intentos": self.attempts,
+            "estado": self.status,
+            "ultimo_error": self.last_error,
+            "payload": self.payload,
+        }
+
+
+class WriteBehindJournal:
+    def __init__(
+        self,
+        path: str,
+        handler: Callable[[dict[str, Any]], Any],
+        max_attempts: int = MAX_ATTEMPTS,
+        on_success: Optional[Callable[[dict[str, Any], Any], None]] = None,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.handler = handler
+        self.max_attempts = max_attempts
+        self.on_success = on_success
+        self._entries: dict[str, JournalEntry] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._replay()
+        self._compact()
+        self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._worker.start()
+
+    # ---------- diario en disco ----------
+
+    def _append(self, record: dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(line)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def _replay(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Última línea a medio escribir por una caída: se descarta.
+                    continue
+                op = record.get("op")
+                entry_id = record.get("id")
+                if op == "add":
+                    self._entries[entry_id] = JournalEntry(
+                        entry_id, record["blob"], record["payload"], record.get("created", "")
+                    )
+                    continue
+                entry = self._entries.get(entry_id)
+                if entry is None:
+                    continue
+                if op in ("done", "discard"):
+                    del self._entries[entry_id]
+                elif op == "failed":
+                    entry.status = FAILED
+                    entry.attempts = record.get("attempts", entry.attempts)
+                    entry.last_error = record.get("error")
+                elif op == "retry":
+                    entry.status = PENDING
+                    entry.attempts = 0
+
+    def _compact(self) -> None:
+        """Reescribe el diario dejando solo las tareas vivas."""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            for entry in self._entries.values():
+                fh.write(json.dumps({
+                    "op": "add", "id": entry.id, "blob": entry.blob,
+                    "payload": entry.payload, "created": entry.created,
+                }, ensure_ascii=False, default=str) + "\n")
+                if entry.status == FAILED:
+                    fh.write(json.dumps({
+                        "op": "failed", "id": entry.id,
+                        "attempts": entry.attempts, "error": entry.last_error,
+                    }, ensure_ascii=False) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.path)
+
+    # ---------- API ----------
+
+    def enqueue(self, blob: str, payload: dict[str, Any], entry_id: Optional[str] = None) -> str:
+        """
+        Registra la tarea en el diario (durable) y la deja para el hilo.
+        ``entry_id`` permite usar un id que el ``handler`` ya conoce.
+        """
+        entry = JournalEntry(entry_id or uuid.uuid4().hex, blob, payload, datetime.now(timezone.utc).isoformat())
+        with self._lock:
+            self._append({
+                "op": "add", "id": entry.id, "blob": blob,
+                "payload": payload, "created": entry.created,
+            })
+            self._entries[entry.id] = entry
+            self._wakeup.notify()
+        return entry.id
+
+    def entries(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [entry.as_dict() for entry in self._entries.values()]
+
+    def pending_count(self, blob: Optional[str] = None) -> int:
+        with self._lock:
+            return sum(
+                1 for entry in self._entries.values()
+                if entry.status == PENDING and (blob is None or entry.blob == blob)
+            )
+
+    def retry(self, entry_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None or entry.status != FAILED:
+                return False
+            self._append({"op": "retry", "id": entry_id})
+            entry.status = PENDING
+            entry.attempts = 0
+            entry.next_attempt = 0.0
+            self._wakeup.notify()
+            return True
+
+    def discard(self, entry_id: str) -> bool:
+        with self._lock:
+            if entry_id not in self._entries:
+                return False
+            self._append({"op": "discard", "id": entry_id})
+            del self._entries[entry_id]
+            return True
+
+    # ---------- hilo de vaciado ----------
+
+    def _next_ready(self) -> tuple[Optional[JournalEntry], Optional[float]]:
+        now = time.monotonic()
+        blocked: set[str] = set()
+        wait: Optional[float] = None
+        for entry in self._entries.values():
+            if entry.blob in blocked:
+                continue
+            if entry.status != PENDING:
+                # Una tarea fallida retiene a las posteriores de su blob.
+                blocked.add(entry.blob)
+                continue
+            if entry.next_attempt <= now:
+                return entry, None
+            blocked.add(entry.blob)
+            delay = entry.next_attempt - now
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self._process_next()
+            except Exception:
+                # Un error inesperado (p. ej. al escribir el diario) no debe
+                # detener el hilo: se registra y se sigue con la próxima tarea.
+                logger.exception("Error inesperado en el guardado diferido")
+                time.sleep(RETRY_BASE_SECONDS)
+
+    def _process_next(self) -> None:
+        with self._lock:
+            entry, wait = self._next_ready()
+            while entry is None:
+                self._wakeup.wait(timeout=wait)
+                entry, wait = self._next_ready()
+
+        try:
+            result = self.handler(entry.payload)
+            if self.on_success is not None:
+                self.on_success(entry.payload, result)
+        except Exception as exc:
+            logger.warning("Guardado diferido %s de %s falló: %s", entry.id, entry.blob, exc)
+            with self._lock:
+                entry.attempts += 1
+                entry.last_error = str(exc)
+                if entry.attempts >= self.max_attempts:
+                    entry.status = FAILED
+                    self._append({
+                        "op": "failed", "id": entry.id,
+                        "attempts": entry.attempts, "error": entry.last_error,
+                    })
+                else:
+                    delay = min(RETRY_BASE_SECONDS * (2 ** (entry.attempts - 1)), RETRY_MAX_SECONDS)
+                    entry.next_attempt = time.monotonic() + delay
+            return
+
+        with self._lock:
+            # Ya está en el bucket: se saca antes de anotarlo para no repetirlo
+            # si falla la escritura del diario.
+            self._entries.pop(entry.id, None)
+            self._append({"op": "done", "id": entry.id})
+            if not self._entries:
+                self._compact()
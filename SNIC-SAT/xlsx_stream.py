@@ -0,0 +1,191 @@
+"""Lectura en streaming de algunas columnas de un .xlsx/.xlsm.
+
+Lee el XML de la hoja directamente desde el miembro del zip, en bloques,
+sin armar el modelo de objetos de openpyxl: en cada bloque se buscan solo
+las celdas de las columnas pedidas (por su referencia, p. ej. ``C15``) y
+el resto del XML se descarta sin analizarlo, así que la memoria no crece
+con el tamaño de la planilla. Sirve para buscar la próxima fila libre y
+para reportes que leen pocas columnas.
+
+Las celdas sin referencia (``r``), válidas pero poco comunes, lanzan
+``UnsupportedEdit``; el llamador vuelve a openpyxl.
+"""
+from __future__ import annotations
+
+import codecs
+import re
+import zipfile
+from typing import Any, BinaryIO, Iterable, Iterator, Optional, Union
+from xml.etree import ElementTree as ET
+
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+from xlsx_zip import (
+    NS_MAIN,
+    UnsupportedEdit,
+    _cell_value,
+    package_sheets,
+    read_shared_strings,
+    shared_strings_part,
+    sheet_part,
+)
+
+Column = Union[str, int]
+
+CHUNK_SIZE = 256 * 1024
+_UNREFERENCED_CELL_RE = re.compile(r'<c(?:\s+(?!r=)[\w:]+="[^"]*")*\s*/?>')
+_TEXT = f"{{{NS_MAIN}}}t"
+
+# Valor de una cadena compartida no vacía cuando no se piden los textos.
+SHARED_STRING = object()
+# Valor de una celda que usa una fórmula compartida cuando no se piden los textos.
+SHARED_FORMULA = object()
+
+
+def _column(column: Column) -> int:
+    return column if isinstance(column, int) else column_index_from_string(column)
+
+
+def _blank(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and value.strip() == "")
+
+
+class _SharedStrings:
+    """
+    Cadenas compartidas leídas recién cuando una celda pedida las usa. Sin
+    ``resolve`` solo se guarda qué índices están vacíos (memoria mínima).
+    """
+
+    def __init__(self, zf: zipfile.ZipFile, workbook_part: str, resolve: bool):
+        self._zf = zf
+        self._workbook_part = workbook_part
+        self._resolve = resolve
+        self._strings: Optional[list[str]] = None
+        self._blank: Optional[set[int]] = None
+
+    def __call__(self) -> "_SharedStrings":
+        return self
+
+    def __getitem__(self, index: int) -> Any:
+        if self._resolve:
+            if self._strings is None:
+                self._strings = read_shared_strings(self._zf, self._workbook_part)
+            return self._strings[index]
+        if self._blank is None:
+            self._blank = self._blank_indices()
+        return "" if index in self._blank else SHARED_STRING
+
+    def _blank_indices(self) -> set[int]:
+        blank: set[int] = set()
+        part = shared_strings_part(self._zf, self._workbook_part)
+        if part is None:
+            return blank
+        index = 0
+        with self._zf.open(part) as fh:
+            for _, element in ET.iterparse(fh):
+                if element.tag != f"{{{NS_MAIN}}}si":
+                    continue
+                if not "".join(t.text or "" for t in element.iter(_TEXT)).strip():
+                    blank.add(index)
+                index += 1
+                element.clear()
+        return blank
+
+
+def _chunks(fh: BinaryIO) -> Iterator[str]:
+    """Bloques del XML cortados después de un ``</row>`` o ``</c>`` (nunca a mitad de celda)."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    while True:
+        data = fh.read(CHUNK_SIZE)
+        pending += decoder.decode(data, final=not data)
+        if not data:
+            if pending:
+                yield pending
+            return
+        # Sin ningún cierre en el bloque (una celda muy larga) se sigue acumulando.
+        row_end, cell_end = pending.rfind("</row>"), pending.rfind("</c>")
+        cut = max(
+            row_end + len("</row>") if row_end >= 0 else 0,
+            cell_end + len("</c>") if cell_end >= 0 else 0,
+        )
+        if cut:
+            yield pending[:cut]
+            pending = pending[cut:]
+
+
+def iter_rows(
+    fileobj: BinaryIO,
+    columns: Iterable[Column],
+    sheet_name: Optional[str] = None,
+    min_row: int = 1,
+    max_row: Optional[int] = None,
+    resolve_strings: bool = True,
+) -> Iterator[tuple[int, dict[int, Any]]]:
+    """
+    ``(fila, {columna: valor})`` de cada fila que tenga alguna de las
+    ``columns`` pedidas. Con ``resolve_strings=False`` las cadenas
+    compartidas no vacías se devuelven como ``SHARED_STRING`` y las celdas
+    que usan una fórmula compartida como ``SHARED_FORMULA``; con textos,
+    estas últimas lanzan ``UnsupportedEdit`` (su texto está en otra celda).
+    """
+    letters = {get_column_letter(_column(column)): _column(column) for column in columns}
+    cell_re = re.compile(
+        r'<c\b[^>]*?\sr="(' + "|".join(sorted(letters, key=len, reverse=True)) + r')(\d+)"[^>]*?(?:/>|>.*?</c>)',
+        re.S,
+    )
+    with zipfile.ZipFile(fileobj) as zf:
+        workbook_part, _, _ = package_sheets(zf)
+        strings = _SharedStrings(zf, workbook_part, resolve_strings)
+        shared_formula = None if resolve_strings else (lambda si, ref: SHARED_FORMULA)
+        with zf.open(sheet_part(zf, sheet_name)) as fh:
+            current_row, values = None, {}
+            for chunk in _chunks(fh):
+                if _UNREFERENCED_CELL_RE.search(chunk):
+                    raise UnsupportedEdit("La hoja tiene celdas sin referencia.")
+                for match in cell_re.finditer(chunk):
+                    row = int(match.group(2))
+                    if row < min_row:
+                        continue
+                    if max_row is not None and row > max_row:
+                        if values:
+                            yield current_row, values
+                        return
+                    if row != current_row:
+                        if values:
+                            yield current_row, values
+                        current_row, values = row, {}
+                    values[letters[match.group(1)]] = _cell_value(match.group(0), strings, shared_formula)
+            if values:
+                yield current_row, values
+
+
+def column_values(
+    fileobj: BinaryIO,
+    column: Column,
+    sheet_name: Optional[str] = None,
+    min_row: int = 1,
+    max_row: Optional[int] = None,
+) -> Iterator[tuple[int, Any]]:
+    """``(fila, valor)`` de las celdas con valor de una columna."""
+    index = _column(column)
+    for row, values in iter_rows(fileobj, (index,), sheet_name, min_row, max_row):
+        value = values.get(index)
+        if value is not None:
+            yield row, value
+
+
+def filled_rows(
+    fileobj: BinaryIO,
+    column: Column,
+    sheet_name: Optional[str] = None,
+    min_row: int = 1,
+    max_row: Optional[int] = None,
+) -> list[int]:
+    """Filas con dato (no vacío) en ``column``, sin leer los textos."""
+    index = _column(column)
+    return [
+        row
+        for row, values in iter_rows(fileobj, (index,), sheet_name, min_row, max_row, resolve_strings=False)
+        if values.get(index) in (SHARED_STRING, SHARED_FORMULA) or not _blank(values.get(index))
+    ]
@@ -0,0 +1,484 @@
+"""Edición de filas de un .xlsx/.xlsm a nivel zip, sin cargar el libro en openpyxl.
+
+``ZipWorkbook`` abre el archivo como zip y ofrece lo mínimo de la interfaz
+de openpyxl que usan los guardados (``wb.active``, ``wb[nombre]``,
+``wb.sheetnames``, ``ws["C5"].value``, ``ws.cell(row, column).value`` y
+``ws.max_row``). Al guardar reescribe solo el XML de las hojas modificadas:
+las filas tocadas se vuelven a armar y todo lo demás del XML de la hoja
+queda igual. El resto de las partes (proyecto VBA, estilos, cadenas
+compartidas, validaciones, etc.) se copian sin cambios; los textos nuevos
+se escriben como cadenas en línea para no tocar ``sharedStrings.xml``.
+``workbook.xml`` solo se modifica para pedir a Excel que recalcule al abrir.
+
+Lo que no se puede hacer de forma segura a este nivel (pisar una fórmula,
+escribir fechas, hojas con prefijos de espacio de nombres raros) lanza
+``UnsupportedEdit`` y el llamador vuelve al camino de openpyxl.
+"""
+from __future__ import annotations
+
+import copy
+import html
+import posixpath
+import re
+import struct
+import zipfile
+from typing import Any, BinaryIO, Optional
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.formula.translate import Translator
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.exceptions import IllegalCharacterError
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_DOC_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_SHEET_DATA_RE = re.compile(r"<sheetData\s*/>|<sheetData>(.*?)</sheetData>", re.S)
+_ROW_RE = re.compile(r"<row\b[^>]*?(?:/>|>.*?</row>)", re.S)
+_CELL_RE = re.compile(r"<c\b[^>]*?(?:/>|>.*?</c>)", re.S)
+_ATTR_RE = re.compile(r'([\w:]+)="([^"]*)"')
+_OPEN_TAG_RE = re.compile(r"<(?:row|c)\b[^>]*?/?>", re.S)
+_VALUE_RE = re.compile(r"<v>([^<]*)</v>")
+# <f ...>texto</f> o, en las celdas que usan una fórmula compartida, <f t="shared" si="0"/>.
+_FORMULA_RE = re.compile(r"<f\b([^>]*?)(?:/>|>([^<]*)</f>)")
+_TEXT_RE = re.compile(r"<t(?:\s[^>]*)?>([^<]*)</t>")
+_REF_RE = re.compile(r"([A-Z]+)(\d+)$")
+_DIMENSION_RE = re.compile(r'<dimension ref="([^"]*)"\s*/>')
+_CALC_PR_RE = re.compile(r"<calcPr\b[^>]*?/>")
+_INT_RE = re.compile(r"-?\d+$")
+
+
+class UnsupportedEdit(Exception):
+    """El cambio no se puede aplicar a nivel zip; hay que usar openpyxl."""
+
+
+def _attrs(open_tag: str) -> dict[str, str]:
+    return dict(_ATTR_RE.findall(open_tag))
+
+
+def _split_ref(ref: str) -> tuple[int, int]:
+    match = _REF_RE.match(ref)
+    if match is None:
+        raise UnsupportedEdit(f"Referencia de celda no soportada: {ref!r}")
+    return int(match.group(2)), column_index_from_string(match.group(1))
+
+
+# =========================
+# Paquete
+# =========================
+
+def _rels(zf: zipfile.ZipFile, part: str) -> dict[str, str]:
+    folder, base = posixpath.split(part)
+    root = ET.fromstring(zf.read(posixpath.join(folder, "_rels", f"{base}.rels")))
+    targets = {}
+    for rel in root.iter(f"{{{NS_PKG_REL}}}Relationship"):
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            targets[rel.get("Id")] = target.lstrip("/")
+        else:
+            targets[rel.get("Id")] = posixpath.normpath(posixpath.join(folder, target))
+    return targets
+
+
+def package_sheets(zf: zipfile.ZipFile) -> tuple[str, list[tuple[str, str]], int]:
+    """``(parte del libro, [(hoja, parte)], índice de la hoja activa)``."""
+    root_rels = ET.fromstring(zf.read("_rels/.rels"))
+    workbook_part = next(
+        rel.get("Target").lstrip("/")
+        for rel in root_rels.iter(f"{{{NS_PKG_REL}}}Relationship")
+        if rel.get("Type", "").endswith("/officeDocument")
+    )
+    root = ET.fromstring(zf.read(workbook_part))
+    rels = _rels(zf, workbook_part)
+    sheets = [
+        (sheet.get("name"), rels[sheet.get(f"{{{NS_DOC_REL}}}id")])
+        for sheet in root.iter(f"{{{NS_MAIN}}}sheet")
+    ]
+    view = root.find(f"{{{NS_MAIN}}}bookViews/{{{NS_MAIN}}}workbookView")
+    active = int(view.get("activeTab", "0")) if view is not None else 0
+    return workbook_part, sheets, active
+
+
+def sheet_part(zf: zipfile.ZipFile, sheet_name: Optional[str] = None) -> str:
+    """Parte XML de la hoja ``sheet_name`` (o de la activa)."""
+    _, sheets, active = package_sheets(zf)
+    if not sheets:
+        raise UnsupportedEdit("El libro no tiene hojas.")
+    if sheet_name is None:
+        return sheets[min(active, len(sheets) - 1)][1]
+    for title, part in sheets:
+        if title == sheet_name:
+            return part
+    raise ValueError(f"La hoja '{sheet_name}' no existe.")
+
+
+def shared_strings_part(zf: zipfile.ZipFile, workbook_part: str) -> Optional[str]:
+    return next((t for t in _rels(zf, workbook_part).values() if t.endswith("sharedStrings.xml")), None)
+
+
+def read_shared_strings(zf: zipfile.ZipFile, workbook_part: str) -> list[str]:
+    part = shared_strings_part(zf, workbook_part)
+    strings: list[str] = []
+    if part is None:
+        return strings
+    with zf.open(part) as fh:
+        for _, element in ET.iterparse(fh):
+            if element.tag != f"{{{NS_MAIN}}}si":
+                continue
+            # Igual que openpyxl: se ignora el texto fonético (rPh).
+            phonetic = {id(t) for rph in element.iter(f"{{{NS_MAIN}}}rPh") for t in rph.iter()}
+            strings.append("".join(
+                t.text or "" for t in element.iter(f"{{{NS_MAIN}}}t") if id(t) not in phonetic
+            ))
+            element.clear()
+    return strings
+
+
+# =========================
+# Lectura de celdas
+# =========================
+
+def _cell_value(cell_xml: str, shared_strings, shared_formula=None) -> Any:
+    """
+    Valor de una celda como lo devolvería openpyxl (fórmulas como "=...").
+    Las celdas que usan una fórmula compartida se resuelven con
+    ``shared_formula(si, ref)``; sin ella lanzan ``UnsupportedEdit``.
+    """
+    open_tag = _OPEN_TAG_RE.match(cell_xml).group(0)
+    cell_attrs = _attrs(open_tag)
+    kind = cell_attrs.get("t", "n")
+    formula = _FORMULA_RE.search(cell_xml)
+    if formula is not None:
+        if formula.group(2):
+            return "=" + html.unescape(formula.group(2))
+        formula_attrs = _attrs(formula.group(1))
+        if formula_attrs.get("t") == "shared" and shared_formula is not None:
+            return shared_formula(formula_attrs.get("si"), cell_attrs.get("r"))
+        raise UnsupportedEdit(f"{cell_attrs.get('r')} tiene una fórmula sin texto propio.")
+    if kind == "inlineStr":
+        texts = _TEXT_RE.findall(cell_xml)
+        return html.unescape("".join(texts)) if texts else None
+    value = _VALUE_RE.search(cell_xml)
+    if value is None:
+        return None
+    raw = html.unescape(value.group(1))
+    if kind == "s":
+        return shared_strings()[int(raw)]
+    if kind == "b":
+        return raw == "1"
+    if kind in ("str", "e", "d"):
+        return raw
+    if _INT_RE.match(raw):
+        return int(raw)
+    try:
+        return float(raw)
+    except ValueError:
+        return raw
+
+
+def _cell_xml(ref: str, value: Any, style: Optional[str]) -> str:
+    style_attr = f' s="{style}"' if style is not None else ""
+    if value is None:
+        return f'<c r="{ref}"{style_attr}/>' if style is not None else ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}"{style_attr} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"{style_attr}><v>{value!r}</v></c>'
+    if isinstance(value, str):
+        if ILLEGAL_CHARACTERS_RE.search(value):
+            raise IllegalCharacterError(f"{value!r} no puede usarse en una hoja de cálculo.")
+        if value.startswith("="):
+            raise UnsupportedEdit("Las fórmulas se escriben con openpyxl.")
+        space = ' xml:space="preserve"' if value != value.strip() or "\n" in value else ""
+        return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t{space}>{escape(value)}</t></is></c>'
+    raise UnsupportedEdit(f"Tipo de valor no soportado a nivel zip: {type(value).__name__}")
+
+
+# =========================
+# Hoja
+# =========================
+
+class _Cell:
+    __slots__ = ("_ws", "row", "column")
+
+    def __init__(self, ws: "ZipWorksheet", row: int, column: int):
+        self._ws = ws
+        self.row = row
+        self.column = column
+
+    @property
+    def value(self) -> Any:
+        return self._ws._get(self.row, self.column)
+
+    @value.setter
+    def value(self, value: Any) -> None:
+        self._ws._set(self.row, self.column, value)
+
+
+class ZipWorksheet:
+    def __init__(self, workbook: "ZipWorkbook", title: str, part: str):
+        self._workbook = workbook
+        self.title = title
+        self.part = part
+        self._xml: Optional[str] = None
+        self._data_span: tuple[int, int] = (0, 0)
+        self._rows: dict[int, tuple[int, int]] = {}
+        self._parsed: dict[int, dict[int, str]] = {}
+        self._changes: dict[int, dict[int, Any]] = {}
+        self._shared_formulas: Optional[dict[str, tuple[str, str]]] = None
+
+    # ---------- carga perezosa del XML ----------
+
+    def _load(self) -> str:
+        if self._xml is not None:
+            return self._xml
+        xml = self._workbook._read_part(self.part).decode("utf-8")
+        match = _SHEET_DATA_RE.search(xml)
+        if match is None:
+            raise UnsupportedEdit(f"La hoja {self.title} no tiene <sheetData> sin prefijo.")
+        self._data_span = match.span()
+        start = match.start(1) if match.group(1) is not None else match.end()
+        body = match.group(1) or ""
+        for row_match in _ROW_RE.finditer(body):
+            number = _attrs(_OPEN_TAG_RE.match(row_match.group(0)).group(0)).get("r")
+            if number is None:
+                raise UnsupportedEdit(f"La hoja {self.title} tiene filas sin número.")
+            self._rows[int(number)] = (start + row_match.start(), start + row_match.end())
+        self._xml = xml
+        return xml
+
+    def _row_cells(self, row: int) -> dict[int, str]:
+        cells = self._parsed.get(row)
+        if cells is not None:
+            return cells
+        xml = self._load()
+        cells = {}
+        span = self._rows.get(row)
+        if span is not None:
+            for cell_match in _CELL_RE.finditer(xml, span[0], span[1]):
+                ref = _attrs(_OPEN_TAG_RE.match(cell_match.group(0)).group(0)).get("r")
+                if ref is None:
+                    raise UnsupportedEdit(f"La hoja {self.title} tiene celdas sin referencia.")
+                cells[_split_ref(ref)[1]] = cell_match.group(0)
+        self._parsed[row] = cells
+        return cells
+
+    def _get(self, row: int, column: int) -> Any:
+        changes = self._changes.get(row)
+        if changes is not None and column in changes:
+            return changes[column]
+        cell_xml = self._row_cells(row).get(column)
+        if cell_xml is None:
+            return None
+        return _cell_value(cell_xml, self._workbook._shared_strings, self._shared_formula)
+
+    def _shared_formula(self, si: Optional[str], ref: Optional[str]) -> str:
+        """Fórmula compartida ``si`` trasladada a ``ref``, como la devuelve openpyxl."""
+        if self._shared_formulas is None:
+            self._shared_formulas = {}
+            xml = self._load()
+            for cell_match in _CELL_RE.finditer(xml, *self._data_span):
+                formula = _FORMULA_RE.search(cell_match.group(0))
+                if formula is None or not formula.group(2):
+                    continue
+                formula_attrs = _attrs(formula.group(1))
+                if formula_attrs.get("t") == "shared" and "si" in formula_attrs:
+                    master = _attrs(_OPEN_TAG_RE.match(cell_match.group(0)).group(0)).get("r")
+                    self._shared_formulas[formula_attrs["si"]] = (master, html.unescape(formula.group(2)))
+        master = self._shared_formulas.get(si)
+        if master is None or ref is None:
+            raise UnsupportedEdit(f"No se encontró la fórmula compartida {si} de {ref}.")
+        return Translator("=" + master[1], origin=master[0]).translate_formula(ref)
+
+    def _set(self, row: int, column: int, value: Any) -> None:
+        existing = self._row_cells(row).get(column)
+        if existing is not None and _FORMULA_RE.search(existing):
+            raise UnsupportedEdit(f"{get_column_letter(column)}{row} tiene una fórmula.")
+        _cell_xml(f"{get_column_letter(column)}{row}", value, None)  # valida el tipo ya al asignar
+        self._changes.setdefault(row, {})[column] = value
+
+    # ---------- interfaz tipo openpyxl ----------
+
+    def __getitem__(self, ref: str) -> _Cell:
+        row, column = _split_ref(ref)
+        return _Cell(self, row, column)
+
+    def cell(self, row: int, column: int) -> _Cell:
+        return _Cell(self, row, column)
+
+    @property
+    def max_row(self) -> int:
+        xml = self._load()
+        rows = [row for row, (start, end) in self._rows.items() if "<c" in xml[start:end]]
+        rows.extend(self._changes)
+        return max(rows, default=1)
+
+    # ---------- serialización ----------
+
+    @property
+    def modified(self) -> bool:
+        return bool(self._changes)
+
+    def _render_row(self, row: int) -> str:
+        xml = self._load()
+        span = self._rows.get(row)
+        if span is not None:
+            open_tag = _OPEN_TAG_RE.match(xml, span[0]).group(0)
+            # ``spans`` es solo una pista de columnas usadas y puede quedar corta.
+            open_tag = re.sub(r'\s+spans="[^"]*"', "", open_tag).rstrip("/>").rstrip() + ">"
+        else:
+            open_tag = f'<row r="{row}">'
+        cells = dict(self._row_cells(row))
+        for column, value in self._changes[row].items():
+            previous = cells.get(column)
+            style = _attrs(_OPEN_TAG_RE.match(previous).group(0)).get("s") if previous else None
+            cells[column] = _cell_xml(f"{get_column_letter(column)}{row}", value, style)
+        body = "".join(cells[column] for column in sorted(cells))
+        return f"{open_tag}{body}</row>"
+
+    def _dimension(self, xml: str) -> str:
+        match = _DIMENSION_RE.search(xml)
+        if match is None:
+            return xml
+        bounds = [_split_ref(ref) for ref in match.group(1).split(":")]
+        min_row = min(row for row, _ in bounds)
+        min_col = min(col for _, col in bounds)
+        max_row = max(row for row, _ in bounds)
+        max_col = max(col for _, col in bounds)
+        for row, changes in self._changes.items():
+            if any(value is not None for value in changes.values()):
+                columns = [col for col, value in changes.items() if value is not None]
+                min_row, max_row = min(min_row, row), max(max_row, row)
+                min_col, max_col = min(min_col, *columns), max(max_col, *columns)
+        ref = f"{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max_row}"
+        return xml[:match.start(1)] + ref + xml[match.end(1):]
+
+    def render(self) -> bytes:
+        xml = self._load()
+        start, end = self._data_span
+        pending = sorted(self._changes)
+        pieces = ["<sheetData>"]
+        for row, (row_start, row_end) in sorted(self._rows.items()):
+            while pending and pending[0] < row:
+                pieces.append(self._render_row(pending.pop(0)))
+            if pending and pending[0] == row:
+                pieces.append(self._render_row(pending.pop(0)))
+            else:
+                pieces.append(xml[row_start:row_end])
+        pieces.extend(self._render_row(row) for row in pending)
+        pieces.append("</sheetData>")
+        return self._dimension(xml[:start] + "".join(pieces) + xml[end:]).encode("utf-8")
+
+
+# =========================
+# Libro
+# =========================
+
+def _copy_raw_member(source: zipfile.ZipFile, info: zipfile.ZipInfo, out: zipfile.ZipFile) -> None:
+    """
+    Copia la parte ``info`` tal como está comprimida (mismos bytes, CRC,
+    tamaños y atributos), sin descomprimirla ni volver a comprimirla.
+    """
+    source.fp.seek(info.header_offset)
+    header = source.fp.read(zipfile.sizeFileHeader)
+    if header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Encabezado local inválido en {info.filename!r}.")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    source.fp.seek(name_length + extra_length, 1)
+
+    target = copy.copy(info)
+    # CRC y tamaños ya se conocen: van en el encabezado local, sin descriptor al final.
+    target.flag_bits &= ~0x08
+    target.header_offset = out.fp.tell()
+    out.fp.write(target.FileHeader())
+    remaining = info.compress_size
+    while remaining:
+        block = source.fp.read(min(remaining, 1024 * 1024))
+        if not block:
+            raise zipfile.BadZipFile(f"{info.filename!r} está truncado.")
+        out.fp.write(block)
+        remaining -= len(block)
+    # zipfile escribe el directorio central con lo que tenga registrado.
+    out.filelist.append(target)
+    out.NameToInfo[target.filename] = target
+    out.start_dir = out.fp.tell()
+    out._didModify = True
+
+
+class ZipWorkbook:
+    """Libro abierto como zip; ``save`` escribe la copia con las filas nuevas."""
+
+    def __init__(self, fileobj: BinaryIO):
+        self._zip = zipfile.ZipFile(fileobj)
+        self._shared: Optional[list[str]] = None
+        self._sheets: dict[str, ZipWorksheet] = {}
+        workbook_part, sheets, active = package_sheets(self._zip)
+        self._workbook_part = workbook_part
+        for title, part in sheets:
+            self._sheets[title] = ZipWorksheet(self, title, part)
+        self.sheetnames = [title for title, _ in sheets]
+        if not self.sheetnames:
+            raise UnsupportedEdit("El libro no tiene hojas.")
+        self._active = self.sheetnames[min(active, len(self.sheetnames) - 1)]
+
+    def _read_part(self, name: str) -> bytes:
+        return self._zip.read(name)
+
+    def _shared_strings(self) -> list[str]:
+        if self._shared is None:
+            self._shared = read_shared_strings(self._zip, self._workbook_part)
+        return self._shared
+
+    @property
+    def active(self) -> ZipWorksheet:
+        return self._sheets[self._active]
+
+    def __getitem__(self, title: str) -> ZipWorksheet:
+        return self._sheets[title]
+
+    def _workbook_xml(self) -> bytes:
+        """``workbook.xml`` con ``fullCalcOnLoad``: las fórmulas tienen valores cacheados viejos."""
+        xml = self._read_part(self._workbook_part).decode("utf-8")
+        match = _CALC_PR_RE.search(xml)
+        if match is not None:
+            tag = re.sub(r'\s+fullCalcOnLoad="[^"]*"', "", match.group(0))
+            tag = tag[:-2].rstrip() + ' fullCalcOnLoad="1"/>'
+            return (xml[:match.start()] + tag + xml[match.end():]).encode("utf-8")
+        # <calcPr> va después de estos elementos (el orden lo exige el esquema).
+        for closing in ("</definedNames>", "</externalReferences>", "</functionGroups>", "</sheets>"):
+            position = xml.find(closing)
+            if position >= 0:
+                position += len(closing)
+                return (xml[:position] + '<calcPr fullCalcOnLoad="1"/>' + xml[position:]).encode("utf-8")
+        return xml.encode("utf-8")
+
+    def save(self, fileobj: BinaryIO) -> None:
+        rendered = {ws.part: ws.render() for ws in self._sheets.values() if ws.modified}
+        if rendered:
+            rendered[self._workbook_part] = self._workbook_xml()
+        with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as out:
+            for info in self._zip.infolist():
+                data = rendered.get(info.filename)
+                if data is None:
+                    _copy_raw_member(self._zip, info, out)
+                    continue
+                # zipfile completa offsets, tamaños y CRC en el ZipInfo que recibe:
+                # se usa uno nuevo para no alterar los del archivo de origen.
+                target = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                target.compress_type = zipfile.ZIP_DEFLATED
+                target.create_system = info.create_system
+                target.external_attr = info.external_attr
+                target.extra = info.extra
+                out.writestr(target, data)
+
+    def close(self) -> None:
+        self._zip.close()
+
+    def __enter__(self) -> "ZipWorkbook":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+